@@ -4,21 +4,107 @@
 extern "C" {
 #endif
 
+/* Propagation strategies. These are the values of ob_strat field of the
+   taint.Merit.*Propagation objects. */
+#define PyMerit_STRATEGY_INVALID -1
+#define PyMerit_STRATEGY_FULL 0
+#define PyMerit_STRATEGY_NONE 1
+#define PyMerit_STRATEGY_PARTIAL 2
 
-PyAPI_DATA(PyTypeObject) PyMerit_MeritType;
+/* Layout of merit classes (ie. Merit and its subclasses). Merit classes are
+   instances of taint.MeritType, which keeps the propagation strategy of each
+   class in mt_strategy, so that checking it is a single load instead of an
+   attribute lookup. mt_strategy is kept in sync with the propagation
+   attribute by tp_setattro of the metatype.
+
+   Each merit class also has a unique id (assigned on creation and never
+   reused), which is the number of its bit in taint objects. */
+typedef struct {
+    PyHeapTypeObject mt_type;
+    int mt_strategy;
+    Py_ssize_t mt_id;
+} PyMeritTypeObject;
+
+PyAPI_DATA(PyTypeObject) PyMerit_MetaType;
+PyAPI_DATA(PyMeritTypeObject) _PyMerit_MeritObject;
 PyAPI_DATA(PyObject*) _PyMerit_FullPropagation;
 PyAPI_DATA(PyObject*) _PyMerit_PartialPropagation;
 PyAPI_DATA(PyObject*) _PyMerit_NonePropagation;
 
+#define PyMerit_MeritType (_PyMerit_MeritObject.mt_type.ht_type)
+
+#define PyMerit_Check(m) PyObject_TypeCheck(m, &PyMerit_MetaType)
+#define PyMerit_ID(m) (((PyMeritTypeObject *)(m))->mt_id)
+
+/* Bitsets of ids of merits with given propagation strategy, indexed the same
+   way as taint objects' ob_bits. Each of them has space for every assigned
+   merit id, so they are at least as long as any taint object. */
+PyAPI_DATA(PyTaint_Word*) _PyMerit_FullMask;    /* full propagation */
+PyAPI_DATA(PyTaint_Word*) _PyMerit_KeepMask;    /* full or partial */
+PyAPI_DATA(PyTaint_Word*) _PyMerit_InvalidMask; /* invalid strategy */
+
+/* Return merit class with given id (borrowed reference) or NULL if it
+   doesn't exist anymore. */
+PyAPI_FUNC(PyObject*) _PyMerit_FromId(Py_ssize_t id);
+
+/* Return propagation strategy of merit m - one of PyMerit_STRATEGY_* values.
+   For objects which are not merit classes it falls back to looking up the
+   propagation attribute. Never raises. */
+PyAPI_FUNC(int) _PyMerit_GetStrategy(PyObject *m);
+
+#define PyMerit_STRATEGY(m) ( \
+         Py_TYPE(m) == &PyMerit_MetaType ? \
+         ((PyMeritTypeObject *)(m))->mt_strategy : \
+         _PyMerit_GetStrategy((PyObject *)(m)))
+
+/* Per-thread propagation overrides. Every thread state has a stack of them
+   (merit_overrides, NULL when it's empty). Each entry replaces the strategy
+   of a merit class and of its subclasses inheriting the propagation
+   attribute from it, without touching the classes themselves, and keeps
+   copies of the strategy masks with all entries down the stack applied.
+   While the stack isn't empty, propagation in that thread uses the masks of
+   its top entry instead of the global ones. */
+typedef struct _merit_override {
+    struct _merit_override *mo_prev;
+    int mo_strategy;
+    Py_ssize_t mo_nids;
+    Py_ssize_t *mo_ids;         /* ids of the overridden merits */
+    Py_ssize_t mo_version;      /* _PyMerit_MaskVersion of the masks */
+    Py_ssize_t mo_words;        /* length of each mask */
+    PyTaint_Word *mo_full;      /* the three masks, in one block */
+    PyTaint_Word *mo_keep;
+    PyTaint_Word *mo_invalid;
+} PyMerit_Override;
+
+/* Incremented whenever any of the global strategy masks changes. */
+PyAPI_DATA(Py_ssize_t) _PyMerit_MaskVersion;
+
+/* Push an override of merit's strategy to the given propagation (one of
+   Merit.*Propagation) on the stack of the current thread. Returns 0 on
+   success, -1 on failure. */
+PyAPI_FUNC(int) _PyMerit_PushOverride(PyObject *merit, PyObject *propagation);
+
+/* Pop the top override of the current thread. Returns 0 on success, -1 (with
+   RuntimeError set) if there is none. */
+PyAPI_FUNC(int) _PyMerit_PopOverride(void);
+
+/* Drop all overrides of tstate. */
+struct _ts; /* Forward */
+PyAPI_FUNC(void) _PyMerit_ClearOverrides(struct _ts *tstate);
+
+/* Store the strategy masks in effect in the current thread in *full, *keep
+   and *invalid. Returns 0 on success, -1 on failure. */
+PyAPI_FUNC(int) _PyMerit_GetMasks(PyTaint_Word **full, PyTaint_Word **keep,
+                                  PyTaint_Word **invalid);
+
+#define _PyMerit_OVERRIDDEN() (PyThreadState_GET()->merit_overrides != NULL)
+
 #define PyMerit_FULL_PROPAGATION(m) ( \
-         PyObject_GetAttrString(m, "propagation") == \
-         (PyObject *)_PyMerit_FullPropagation)
+         PyMerit_STRATEGY(m) == PyMerit_STRATEGY_FULL)
 #define PyMerit_PARTIAL_PROPAGATION(m) ( \
-         PyObject_GetAttrString(m, "propagation") == \
-         (PyObject *)_PyMerit_PartialPropagation)
+         PyMerit_STRATEGY(m) == PyMerit_STRATEGY_PARTIAL)
 #define PyMerit_NONE_PROPAGATION(m) ( \
-         PyObject_GetAttrString(m, "propagation") == \
-         (PyObject *)_PyMerit_NonePropagation)
+         PyMerit_STRATEGY(m) == PyMerit_STRATEGY_NONE)
 
 PyAPI_FUNC(void) _PyTaint_Init(void);
 
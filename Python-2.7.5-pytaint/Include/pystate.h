@@ -12,6 +12,7 @@ extern "C" {
 
 struct _ts; /* Forward */
 struct _is; /* Forward */
+struct _merit_override; /* Forward */
 
 typedef struct _is {
 
@@ -98,6 +99,9 @@ typedef struct _ts {
     int trash_delete_nesting;
     PyObject *trash_delete_later;
 
+    /* Stack of taint propagation overrides (see meritobject.h) */
+    struct _merit_override *merit_overrides;
+
     /* XXX signal handlers should also be here */
 
 } PyThreadState;
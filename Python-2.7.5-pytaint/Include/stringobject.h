@@ -35,9 +35,19 @@ functions should be applied to nil objects.
 
 typedef struct {
     PyObject_VAR_HEAD
+#if !defined(Py_TAINT_COMPACT) && !defined(Py_TAINT_SIDETABLE)
     PyTaintObject *ob_merits;
+#endif
     long ob_shash;
+#if defined(Py_TAINT_COMPACT)
+    unsigned int ob_sstate : 2;
+    unsigned int ob_taint : PyTaint_INDEX_BITS;
+#elif defined(Py_TAINT_SIDETABLE)
+    unsigned int ob_sstate : 2;
+    unsigned int ob_tainted : 1;
+#else
     int ob_sstate;
+#endif
     char ob_sval[1];
 
     /* Invariants:
@@ -47,8 +57,13 @@ typedef struct {
      *     ob_sstate != 0 iff the string object is in stringobject.c's
      *       'interned' dictionary; in this case the two references
      *       from 'interned' to this object are *not counted* in ob_refcnt.
-     *     ob_merits is NULL for untainted strings, otherwise it is a tuple of
-     *       string's merits
+     *     ob_merits is NULL for untainted strings, otherwise it is the
+     *       string's taint object. With Py_TAINT_COMPACT, ob_taint is the
+     *       index of the taint object in _PyTaint_Table instead (0 for
+     *       untainted strings). With Py_TAINT_SIDETABLE, ob_tainted is set
+     *       iff the string has an entry in the taint side table. Use
+     *       PyString_GET_MERITS and PyString_ASSIGN_MERITS rather than
+     *       accessing these directly.
      */
 } PyStringObject;
 
@@ -91,6 +106,9 @@ PyAPI_FUNC(void) _Py_ReleaseInternedStrings(void);
 PyAPI_FUNC(PyObject *)
 PyString_FromStringAndSizeSameMerits(const char *, Py_ssize_t,
                                      PyTaintObject *);
+/* Copy of s with given merits, which keeps the cached hash of s. */
+PyAPI_FUNC(PyObject *) _PyString_CopyWithMerits(PyStringObject *,
+                                                PyTaintObject *);
 PyAPI_FUNC(PyObject *) PyString_FromStringAndSizeNoIntern(const char *,
                                                           Py_ssize_t);
 PyAPI_FUNC(int) _PyString_BinaryTaintPropagateInPlace(
@@ -102,6 +120,9 @@ PyAPI_FUNC(int) _PyString_PropagateTaintInPlace(register PyStringObject *,
                                                 register PyStringObject *);
 PyAPI_FUNC(PyObject*) PyString_AssignTaint(PyStringObject *, PyTaintObject *);
 
+/* Drop the shared tainted one character and empty strings. */
+PyAPI_FUNC(void) _PyString_ClearTaintedChars(void);
+
 /* Macro which assigns source's taint object to target. It assumes that source
    is tainted and target is not (ie. is a new string with NULL ob_merits). */
 #define _PyString_COPY_TAINT_REFERENCE(target, source) \
@@ -109,22 +130,45 @@ do { \
     assert(!PyString_CHECK_TAINTED(target));\
     assert(PyString_CHECK_TAINTED(source));\
     assert(target->ob_refcnt == 1);\
-    ((PyStringObject*)target)->ob_merits = \
-      ((PyStringObject*)source)->ob_merits; \
-    Py_INCREF(((PyStringObject*)target)->ob_merits); \
+    _PyString_SET_MERITS(target, PyString_GET_MERITS(source)); \
+    Py_INCREF(PyString_GET_MERITS(target)); \
 } while(0);
 
 /* Use only if you know it's a string */
 #define PyString_CHECK_INTERNED(op) (((PyStringObject *)(op))->ob_sstate)
-#define PyString_CHECK_TAINTED(op) (((PyStringObject *)(op))->ob_merits != NULL)
 
 /* Macro, trading safety for speed */
 #define PyString_AS_STRING(op) (((PyStringObject *)(op))->ob_sval)
 #define PyString_GET_SIZE(op)  Py_SIZE(op)
+#ifdef Py_TAINT_COMPACT
+#define PyString_GET_MERITS(op) \
+    (_PyTaint_Table[((PyStringObject *)(op))->ob_taint])
+#define PyString_CHECK_TAINTED(op) (((PyStringObject *)(op))->ob_taint != 0)
+/* Store taint t in string op, without touching reference counts.
+   _PyString_INIT_MERITS marks a newly allocated string as clean. */
+#define _PyString_SET_MERITS(op, t) \
+    (((PyStringObject *)(op))->ob_taint = _PyTaint_INDEX(t))
+#define _PyString_INIT_MERITS(op) (((PyStringObject *)(op))->ob_taint = 0)
+#elif defined(Py_TAINT_SIDETABLE)
+#define PyString_GET_MERITS(op) \
+    (PyString_CHECK_TAINTED(op) ? _PyTaint_SideTableGet((PyObject *)(op)) : \
+                                  (PyTaintObject *)NULL)
+#define PyString_CHECK_TAINTED(op) (((PyStringObject *)(op))->ob_tainted)
+#define _PyString_SET_MERITS(op, t) \
+    ((t) != NULL || PyString_CHECK_TAINTED(op) ? \
+     (void)(((PyStringObject *)(op))->ob_tainted = \
+            _PyTaint_SideTableSet((PyObject *)(op), (t))) : \
+     (void)0)
+#define _PyString_INIT_MERITS(op) (((PyStringObject *)(op))->ob_tainted = 0)
+#else
 #define PyString_GET_MERITS(op) (((PyStringObject *)(op))->ob_merits)
+#define PyString_CHECK_TAINTED(op) (((PyStringObject *)(op))->ob_merits != NULL)
+#define _PyString_SET_MERITS(op, t) (((PyStringObject *)(op))->ob_merits = (t))
+#define _PyString_INIT_MERITS(op) (((PyStringObject *)(op))->ob_merits = NULL)
+#endif
 #define PyString_ASSIGN_MERITS(x, t) \
 do {\
-  (((PyStringObject*)x)->ob_merits = t);\
+  _PyString_SET_MERITS(x, t);\
   Py_XINCREF(t);\
 } while(0);\
 
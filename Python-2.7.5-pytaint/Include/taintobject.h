@@ -4,35 +4,123 @@
 extern "C" {
 #endif
 
-typedef struct { PyObject_VAR_HEAD } PyTaintObject;
+/* Taint is a bitset of merits. Every merit class gets a small integer id
+   when it is created (see meritobject.h), and bit number id is set in
+   ob_bits when the taint has that merit. First 64 merits fit in a single
+   word; ob_size is the number of words in use (trailing zero words are
+   never stored, so a taint without merits has ob_size == 0).
 
-/*  Create an object representing taint with no merits (ie. empty tuple).
-    Returns NULL on failure.
+   Taint objects are canonical: there is exactly one live taint object for
+   each set of merits, so two taints are equal iff they are the same object.
+   ob_hash is the hash of ob_bits used by the canonicalisation table. */
+
+typedef PY_UINT64_T PyTaint_Word;
+
+#define PyTaint_WORD_BITS 64
+#define PyTaint_WORD_INDEX(id) ((id) / PyTaint_WORD_BITS)
+#define PyTaint_WORD_BIT(id) ((PyTaint_Word)1 << ((id) % PyTaint_WORD_BITS))
+
+typedef struct {
+    PyObject_VAR_HEAD
+    long ob_hash;
+#ifdef Py_TAINT_COMPACT
+    unsigned int ob_index;      /* slot in _PyTaint_Table */
+#endif
+    PyTaint_Word ob_bits[1];
+} PyTaintObject;
+
+PyAPI_DATA(PyTypeObject) PyTaint_Type;
+
+#ifdef Py_TAINT_COMPACT
+/* With --with-compact-taint, strings don't point to their taint object, but
+   keep its index in _PyTaint_Table (in the same word as ob_sstate, so that
+   string objects are as big as without taint tracking). Every live taint
+   object owns a slot of the table, which it releases when deallocated. Slot
+   0 is always NULL and is used by clean strings. */
+#define PyTaint_INDEX_BITS 30
+
+PyAPI_DATA(PyTaintObject**) _PyTaint_Table;
+
+#define _PyTaint_INDEX(t) ((t) == NULL ? 0 : ((PyTaintObject *)(t))->ob_index)
+#endif
+
+#ifdef Py_TAINT_SIDETABLE
+#ifdef Py_TAINT_COMPACT
+#error "--with-compact-taint and --with-taint-side-table are exclusive"
+#endif
+/* With --with-taint-side-table, strings don't hold their taint at all. The
+   taint of tainted str and unicode objects lives in a hash table keyed by
+   object address, so clean strings cost nothing. str objects also have an
+   ob_tainted bit (next to ob_sstate), so checking them doesn't touch the
+   table; unicode objects have no spare bits and are looked up, which is
+   skipped as long as no unicode object is tainted. */
+
+/* Return taint of op (borrowed reference), or NULL if it's clean. */
+PyAPI_FUNC(PyTaintObject*) _PyTaint_SideTableGet(PyObject *op);
+
+/* Set taint of op to taint (NULL to remove it), without touching reference
+   counts. Returns 1 if op is tainted now, 0 otherwise. Can't fail - it's a
+   fatal error if the table can't grow. */
+PyAPI_FUNC(int) _PyTaint_SideTableSet(PyObject *op, PyTaintObject *taint);
+
+/* Number of tainted objects in the table which aren't str objects. */
+PyAPI_DATA(Py_ssize_t) _PyTaint_SideTableUnicode;
+#endif
+
+/* Global switch of taint tracking (set from -X notaint / PYTHONNOTAINT and
+   taint.set_enabled). While it's 0, tainting and propagation always give
+   clean results - strings already tainted keep their taint, but it doesn't
+   spread. */
+PyAPI_DATA(int) _PyTaint_Enabled;
+
+/*  Return the object representing taint with no merits. Returns NULL on
+    failure.
 */
 
-PyAPI_FUNC(PyTaintObject*) PyTaint_EmptyMerits();
+PyAPI_FUNC(PyTaintObject*) PyTaint_EmptyMerits(void);
 
-/*  Return a new taint object having all the merits of old one and also
-    new_merit. Returns NULL on failure.
+/*  Return taint object having all the merits of old one and also new_merit
+    (which is taint itself when it already has new_merit). new_merit has to
+    be a valid merit (see _PyTaint_ValidMerit). Returns a new reference, or
+    NULL on failure.
 */
 
 PyAPI_FUNC(PyTaintObject*) _PyTaint_AddMerit(PyTaintObject *taint,
                                              PyObject *new_merit);
 
+/*  Return taint object having all the merits of taint (which may be NULL, for
+    no merits) and all the merits from iterable merits, built at once. Sets
+    TypeError if any of them isn't a valid merit. Returns a new reference, or
+    NULL on failure.
+*/
+
+PyAPI_FUNC(PyTaintObject*) _PyTaint_AddMerits(PyTaintObject *taint,
+                                              PyObject *merits);
+
+/* Returns 1 if taint has given merit, 0 if it doesn't. When merit is not a
+   merit object, TypeError is set and -1 is returned. */
+PyAPI_FUNC(int) _PyTaint_HasMerit(PyTaintObject *taint, PyObject *merit);
+
+/* Returns a new set with all the merits of taint. Returns NULL on failure. */
+PyAPI_FUNC(PyObject*) _PyTaint_GetMerits(PyTaintObject *taint);
+
 /* Extract taint from taintable object - ie. string or unicode. Since it should
    be only used internally, Py_FatalError is raised when an invalid object is
-   passed. Returns borrowed reference.
+   passed. Returns new reference.
  */
 PyTaintObject*
 _PyTaint_GetFromObject(PyObject *obj);
 
-/* Checks if object is a valid merit object with a valid propagation strategy.
+/* Checks if object is a valid merit object (ie. Merit or its subclass) with a
+   valid propagation strategy.
 
    Returns -1 on failure, 1 on success. */
 int
 _PyTaint_ValidMerit(PyObject *obj);
 
-/* Apply taint propagation rules to a and b and store result in r.
+/* Apply taint propagation rules to a and b and store result in r. When the
+   result has the same merits as a or b, that object is stored in r (no new
+   taint object is created).
 
    Returns -1 on failure, 1 on success. */
 PyAPI_FUNC(int) PyTaint_PropagationResult(
@@ -41,6 +129,34 @@ PyAPI_FUNC(int) PyTaint_PropagationResult(
     PyTaintObject *b
     );
 
+/* --- Propagation cache --------------------------------------------------- */
+
+/* Results of PyTaint_PropagationResult are memoized in a direct mapped cache
+   keyed by the operands' taint objects. Its size has to be a power of 2. */
+#ifndef PyTaint_PROPAGATION_CACHE_SIZE
+#define PyTaint_PROPAGATION_CACHE_SIZE 256
+#endif
+
+typedef struct {
+    Py_ssize_t hits;
+    Py_ssize_t misses;
+    Py_ssize_t evictions;       /* misses which replaced another entry */
+    Py_ssize_t invalidations;   /* clears caused by merit changes */
+    Py_ssize_t size;
+    Py_ssize_t used;            /* number of non-empty entries */
+} PyTaint_PropagationCacheInfo;
+
+/* Drop all entries of the propagation cache. Has to be called whenever
+   propagation strategy of any merit changes. */
+PyAPI_FUNC(void) _PyTaint_ClearPropagationCache(void);
+
+/* Fill info with statistics of the propagation cache. */
+PyAPI_FUNC(void) _PyTaint_GetPropagationCacheInfo(
+    PyTaint_PropagationCacheInfo *info);
+
+/* Zero hit, miss, eviction and invalidation counters. */
+PyAPI_FUNC(void) _PyTaint_ResetPropagationCacheInfo(void);
+
 /* Apply taint propagation rules to target and source and store result in
    target. This function creates a new PyTaintObject instead of modifying
    old one.
@@ -52,6 +168,74 @@ int
 PyTaint_PropagateTo(PyTaintObject **target,
                     PyTaintObject *source);
 
+/* --- Propagation of many operands --------------------------------------- */
+
+/* Accumulator computes the same result as a chain of PyTaint_PropagateTo
+   calls over a sequence of operands, without creating intermediate taint
+   objects. Its state lives in the struct itself (unless taints with more
+   than PyTaint_ACCUMULATOR_WORDS words are involved), so it's meant to be
+   allocated on stack:
+
+       PyTaint_Accumulator acc;
+       PyTaint_AccumulatorInit(&acc);
+       for (...)
+           if (PyTaint_AccumulatorAdd(&acc, taint) == -1)
+               goto error;
+       if (PyTaint_AccumulatorResult(&acc, &result) == -1)
+           goto error;
+       PyTaint_AccumulatorClear(&acc);
+
+   The accumulator must not be copied. */
+
+#define PyTaint_ACCUMULATOR_WORDS 4
+
+typedef struct {
+    Py_ssize_t ta_count;        /* number of operands added */
+    PyTaintObject *ta_source;   /* first tainted operand (owned), or NULL */
+    Py_ssize_t ta_size;         /* number of words of the running result */
+    int ta_masked;              /* whether propagation masks were applied */
+    int ta_full;                /* whether full propagation mask was applied */
+    PyTaint_Word *ta_heap;      /* result bits, when they don't fit inline */
+    PyTaint_Word ta_inline[PyTaint_ACCUMULATOR_WORDS];
+} PyTaint_Accumulator;
+
+PyAPI_FUNC(void) PyTaint_AccumulatorInit(PyTaint_Accumulator *acc);
+
+/* Release memory held by acc and reset it to the initial state. Has to be
+   called when done with the accumulator, including on failure. */
+PyAPI_FUNC(void) PyTaint_AccumulatorClear(PyTaint_Accumulator *acc);
+
+/* Fold next operand into acc. taint may be NULL (clean operand).
+
+   Returns -1 on failure, 1 on success. */
+PyAPI_FUNC(int) PyTaint_AccumulatorAdd(PyTaint_Accumulator *acc,
+                                       PyTaintObject *taint);
+
+/* Same as PyTaint_AccumulatorAdd, with the taint of a taintable object (string
+   or unicode). Py_FatalError is raised when any other object is passed. */
+PyAPI_FUNC(int) PyTaint_AccumulatorAddObject(PyTaint_Accumulator *acc,
+                                             PyObject *obj);
+
+/* Store the result of propagation over all operands added so far in target
+   (which is NULL when there were no tainted operands). The reference to the
+   original target is stolen. acc is left untouched, so more operands can be
+   added afterwards.
+
+   Returns -1 on failure, 1 on success. */
+PyAPI_FUNC(int) PyTaint_AccumulatorResult(PyTaint_Accumulator *acc,
+                                          PyTaintObject **target);
+
+/* Apply taint propagation rules to target and taints of n taintable objects
+   in objs, in order, and store result in target - the same way as calling
+   PyTaint_PropagateTo for each of them would, but creating at most one taint
+   object.
+
+   Returns -1 on failure, 1 on success. The reference to original target is
+   stolen. */
+PyAPI_FUNC(int) PyTaint_PropagateMany(PyTaintObject **target,
+                                      PyObject **objs,
+                                      Py_ssize_t n);
+
 /* For taintable object obj, return object with the same contents as obj and
    passed taint value. Steals reference to obj when succesful.
 
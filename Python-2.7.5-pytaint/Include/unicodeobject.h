@@ -410,7 +410,7 @@ typedef PY_UNICODE_TYPE Py_UNICODE;
 /* Assumes that x is not tainted */
 #define PyUnicode_ASSIGN_MERITS(x, t) \
 do {\
-  (((PyUnicodeObject*)x)->merits = t);\
+  _PyUnicode_SET_MERITS(x, t);\
   Py_XINCREF(t);\
 } while(0);\
 
@@ -428,7 +428,9 @@ typedef struct {
     PyObject *defenc;           /* (Default) Encoded version as Python
                                    string, or NULL; this is used for
                                    implementing the buffer protocol */
-    PyTaintObject *merits;
+#ifndef Py_TAINT_SIDETABLE
+    PyTaintObject *merits;      /* taint object, or NULL if clean */
+#endif
 } PyUnicodeObject;
 
 PyAPI_DATA(PyTypeObject) PyUnicode_Type;
@@ -436,8 +438,7 @@ PyAPI_DATA(PyTypeObject) PyUnicode_Type;
 #define PyUnicode_Check(op) \
                  PyType_FastSubclass(Py_TYPE(op), Py_TPFLAGS_UNICODE_SUBCLASS)
 #define PyUnicode_CheckExact(op) (Py_TYPE(op) == &PyUnicode_Type)
-#define PyUnicode_CHECK_TAINTED(op) \
-    (((PyUnicodeObject *)(op))->merits != NULL)
+#define PyUnicode_CHECK_TAINTED(op) (PyUnicode_GET_MERITS(op) != NULL)
 #define PyUnicode_IS_LATIN_CHAR(str) (str[0] < 256U)
 
 /* Fast access macros */
@@ -449,15 +450,34 @@ PyAPI_DATA(PyTypeObject) PyUnicode_Type;
     (((PyUnicodeObject *)(op))->str)
 #define PyUnicode_AS_DATA(op) \
     ((const char *)((PyUnicodeObject *)(op))->str)
+#ifdef Py_TAINT_SIDETABLE
+#define PyUnicode_GET_MERITS(op) \
+    (_PyTaint_SideTableUnicode == 0 ? (PyTaintObject *)NULL : \
+     _PyTaint_SideTableGet((PyObject *)(op)))
+/* Store taint t in unicode object op, without touching reference counts. */
+#define _PyUnicode_SET_MERITS(op, t) \
+    ((t) != NULL || _PyTaint_SideTableUnicode != 0 ? \
+     (void)_PyTaint_SideTableSet((PyObject *)(op), (t)) : (void)0)
+/* Mark a newly allocated unicode object as clean. Dead objects have no
+   entries in the side table, so there is nothing to do. */
+#define _PyUnicode_INIT_MERITS(op) ((void)0)
+#else
 #define PyUnicode_GET_MERITS(op) \
     (((PyUnicodeObject *)(op))->merits)
+/* Store taint t in unicode object op, without touching reference counts. */
+#define _PyUnicode_SET_MERITS(op, t) \
+    (((PyUnicodeObject *)(op))->merits = (t))
+/* Mark a newly allocated unicode object as clean. */
+#define _PyUnicode_INIT_MERITS(op) (((PyUnicodeObject *)(op))->merits = NULL)
+#endif
 
 #define PyUnicode_IS_SHARED(op) \
     (((PyUnicodeObject*)op) == unicode_empty || \
         (((PyUnicodeObject*)op)->length == 1 && \
          PyUnicode_IS_LATIN_CHAR(((PyUnicodeObject*)op)->str) && \
          unicode_latin1[((PyUnicodeObject*)op)->str[0]] == \
-            ((PyUnicodeObject*)op)))
+            ((PyUnicodeObject*)op)) || \
+        _PyUnicode_IS_TAINTED_CHAR(op))
 
 /* --- Constants ---------------------------------------------------------- */
 
@@ -503,6 +523,13 @@ PyAPI_FUNC(PyObject*) PyUnicode_FromUnicodeSameMerits(
     PyTaintObject *merits       /* taint value of new string */
     );
 
+/* Like PyUnicode_FromUnicodeSameMerits applied to the contents of u, but the
+   result keeps the hash of u if it was computed already. */
+PyAPI_FUNC(PyObject*) _PyUnicode_CopyWithMerits(
+    PyUnicodeObject *u,         /* object to copy */
+    PyTaintObject *merits       /* taint value of new string */
+    );
+
 
 /* Similar to PyUnicode_FromUnicode(), but u points to Latin-1 encoded bytes */
 PyAPI_FUNC(PyObject*) PyUnicode_FromStringAndSize(
@@ -601,6 +628,9 @@ void _PyUnicode_CopyTaint(PyUnicodeObject *target,
 int
 PyUnicode_IsShared(PyUnicodeObject *u);
 
+/* Drop the shared tainted one character and empty unicode objects. */
+PyAPI_FUNC(void) _PyUnicode_ClearTaintedChars(void);
+
 /* PyUnicode_AssigntTaint will return unicode object with same contents as u
    and taint value taint. The return value may be either the same object as u
    or a new unicodeobject.
@@ -4,19 +4,32 @@
 """Taint module - utilities and patching for taint tracking."""
 
 
+import hashlib
+import inspect
 import json
 import itertools
+import marshal
+import os
 import sys
+import thread
+import threading
 import types
 import re
-from inspect import currentframe, getouterframes
+import weakref
+import _taint
 from contextlib import contextmanager
-from functools import wraps
+from functools import partial, wraps
 
 __author__ = "Marcin Fatyga"
 
 
-def source(func):
+# Plain functions, and what the decorators below turn them into (which can be
+# decorated and patched again the same way).
+_function_types = (types.FunctionType, _taint.SourceWrapper,
+                   _taint.CleanerWrapper, _taint.PropagatorWrapper)
+
+
+def source(func, rate=None, lazy=False):
     """Turn function f into a taint source.
 
     Given a function returning a taintable object (either string/unicode or
@@ -25,33 +38,63 @@ def source(func):
     same as in the old one. Supported collections are builtins - list, tuple,
     set, frozenset and dictionary (note - when tainting a dictionary, only
     values are tainted; keys are not modified). Collections are tainted
-    recursively.
+    recursively. With lazy set, lists, tuples and dicts returned by a callable
+    source are given as read only TaintedList, TaintedTuple and TaintedDict
+    views instead, which taint the items when they are read (use their
+    materialize() method to get a tainted copy of the whole collection).
+    Generators and iterators of builtin collections are given as
+    TaintedIterator, which taints the items as they come out (other iterators
+    are proxied, which taints them the same way when they're iterated).
+
+    When rate is given, only that fraction of sampling keys (see
+    sampling_key) gets tainted values; under other keys the source returns
+    its results untouched.
 
     Args:
         f: Function returning a string or collections of strings.
+        rate: Sampling rate between 0 and 1, or None to taint always.
+        lazy: Whether to give read only views of lists, tuples and dicts.
 
     Returns:
         string: A tainted string or string collection.
 
     """
 
+    if rate is not None and not 0 <= rate <= 1:
+        raise ValueError("Sampling rate must be between 0 and 1, not %r"
+                         % (rate,))
+
     if not callable(func):
+        if not _sample(rate):
+            return func
         return _taint_object(func)
 
-    @wraps(func)
-    def inner(*args, **kwargs):
-        result = func(*args, **kwargs)
-        return _taint_object(result)
+    # the wrapper taints strings in place when the source gave the only
+    # reference to them
+    if rate is None:
+        return _taint.SourceWrapper(func, None, _sampling, lazy)
+    return _taint.SourceWrapper(func, partial(_sample, rate), _sampling,
+                                lazy)
 
-    return inner
 
+def _compile_sources(config):
+    """Compile taint sources specified in config into (path, rate) pairs."""
+    rate = None
+    sources = []
+    for s in config.get(u"sources", ()):
+        if type(s) == dict:
+            rate = s[u"rate"]
+        else:
+            sources.append((_path(s), rate))
+    return sources
 
-def _patch_sources(config, frame):
-    """Create all taint sources specified in config for a given frame."""
 
-    for s in config.get(u"sources", ()):
-        namespace, target = _get_namespace_and_target(s, frame)
-        apply_patch(namespace, target, source)
+def _patch_sources(sources, resolver):
+    """Create all taint sources of a compiled policy."""
+    for path, rate in sources:
+        action = source if rate is None else partial(source, rate=rate)
+        namespace, target = resolver.namespace(path)
+        apply_patch(namespace, target, action)
 
 
 def cleaner(merit):
@@ -70,27 +113,28 @@ def cleaner(merit):
             function: a cleaner for given merit
         """
 
-        @wraps(func)
-        def inner(*args, **kwargs):
-            r = func(*args, **kwargs)
-            return r._cleanfor(merit)
-
-        return inner
+        return _taint.CleanerWrapper(func, merit)
 
     return inner_cleaner
 
 
-def _patch_cleaners(config, frame):
-    """Create all cleaners specified in config for a given frame."""
-    if not u"cleaners" in config:
-        return
+def _compile_cleaners(config):
+    """Compile cleaners specified in config into (path, merit path) pairs."""
     merit = None
+    cleaners = []
     for clean in config.get(u"cleaners", ()):
         if type(clean) == dict:
-            merit = _get_merit(clean[u"merit"], frame)
+            merit = _path(clean[u"merit"])
         else:
-            namespace, target = _get_namespace_and_target(clean, frame)
-            apply_patch(namespace, target, cleaner(merit))
+            cleaners.append((_path(clean), merit))
+    return cleaners
+
+
+def _patch_cleaners(cleaners, resolver):
+    """Create all cleaners of a compiled policy."""
+    for path, merit in cleaners:
+        namespace, target = resolver.namespace(path)
+        apply_patch(namespace, target, cleaner(resolver.merit(merit)))
 
 
 def sink(merit):
@@ -109,31 +153,40 @@ def sink(merit):
 
         """
 
+        # only strings passed directly as arguments are checked; the plan
+        # counts the checks
+        plan = _taint.SinkPlan((), {}, (merit,))
+
         @wraps(func)
         def inner(*args, **kwargs):
-            taint_violations = []
-            for arg in args:
-                if (isinstance(arg, types.StringTypes) and
-                    not arg.isclean(merit)):
-                    taint_violations.append(arg)
-            for kwarg_value in kwargs.itervalues():
-                if (isinstance(kwarg_value, types.StringTypes) and
-                    not kwarg_value.isclean(merit)):
-                    taint_violations.append(kwarg_value)
-
-            if taint_violations:
-                message = ("Following arguments have no merit {}:\n"
-                           .format(merit))
-                message += "\n".join(taint_violations)
-                raise TaintError(message)
-
-            return func(*args, **kwargs)
-
+            if plan.check(args, kwargs, _sampling.sampled) is None:
+                return func(*args, **kwargs)
+
+            taint_violations = [
+                arg for arg in itertools.chain(args, kwargs.itervalues())
+                if isinstance(arg, types.StringTypes) and
+                not arg.isclean(merit)]
+            message = "Following arguments have no merit {}:\n".format(merit)
+            message += "\n".join(taint_violations)
+            raise TaintError(message)
+
+        _add_sink_plan(inner, plan)
         return inner
 
     return inner_sink
 
 
+def _argnames(func):
+    """Return names of the positional parameters of func (empty when they
+    can't be found, eg. for builtins)."""
+    while hasattr(func, "__wrapped__"):
+        func = func.__wrapped__
+    try:
+        return inspect.getargspec(func).args
+    except TypeError:
+        return []
+
+
 def _complex_sink(args_merits, kwargs_merits):
     """Create decorator to turn function into sensitive sink (with different
     taint checks for each argument)."""
@@ -149,78 +202,85 @@ def _complex_sink(args_merits, kwargs_merits):
         Returns:
             function: a sink sensitive for merit m
         """
-        def check(argument, merits):
-            if argument is None:
-                return
-            elif isinstance(argument, types.StringTypes):
-                for m in merits:
-                    if not argument.isclean(m):
-                        raise TaintError("Object \"{}\" has no merit {}."
-                                             .format(argument, m))
-            elif isinstance(argument, types.DictType):
-                for a in argument.itervalues():
-                    check(a, merits)
-            elif (isinstance(argument, types.ListType) or
-                  isinstance(argument, types.TupleType) or
-                  isinstance(argument, frozenset) or
-                  isinstance(argument, set)):
-                for a in argument:
-                    check(a, merits)
+        # the checks are compiled once, when the config is applied
+        plan = _taint.SinkPlan(args_merits, kwargs_merits, None,
+                               _argnames(func))
+        if plan.empty:
+            return func
 
         @wraps(func)
         def inner(*args, **kwargs):
-            for arg, merit in zip(args, args_merits):
-                check(arg, merit)
-
-            for kwarg_value in kwargs.keys():
-                check(kwargs[kwarg_value], kwargs_merits[kwarg_value])
+            violation = plan.check(args, kwargs, _sampling.sampled)
+            if violation is not None:
+                path, value, m = violation
+                where = "".join("[{!r}]".format(key) for key in path)
+                if where:
+                    where = " (at {})".format(where)
+                raise TaintError("Object \"{}\"{} has no merit {}."
+                                 .format(value, where, m))
 
             return func(*args, **kwargs)
 
+        _add_sink_plan(inner, plan)
         return inner
 
     return inner_sink
 
 
-def _patch_sinks(config, frame):
-    """Create all taint sinks specified in config for a given frame."""
+def _compile_sinks(config):
+    """Compile taint sinks specified in config into a list of (path, merit
+    path, args checks, kwargs checks) tuples. Simple sinks have no checks of
+    arguments (they are None), complex ones have no merit (see
+    _compile_check for the checks)."""
     merit = None
+    sinks = []
     for snk in config.get(u"sinks", ()):
-        if type(snk) == dict:
-            if u"merit" in snk:
-                merit = _get_merit(snk[u"merit"], frame)
-                continue
-            else:
-                for (sink_name, sink_specs) in snk.items():
-                    args = _preprocess_complex_args(sink_specs[u"args"],
-                                                    frame)
-                    kwargs = _preprocess_complex_kwargs(sink_specs[u"kwargs"],
-                                                        frame)
-                    patch = _complex_sink(args, kwargs)
-                    namespace, target = _get_namespace_and_target(sink_name,
-                                                                  frame)
-        else:
-            patch = sink(merit)
-            namespace, target = _get_namespace_and_target(snk, frame)
+        if type(snk) == dict and u"merit" in snk:
+            merit = _path(snk[u"merit"])
+            continue
         if not merit:
             raise ValueError(("Malformed config file - expected "
                               "merit, got \"%s\"") % snk)
+        if type(snk) == dict:
+            for (sink_name, sink_specs) in snk.items():
+                args = [_compile_check(a) for a in sink_specs[u"args"]]
+                kwargs = _compile_complex_kwargs(sink_specs[u"kwargs"])
+                sinks.append((_path(sink_name), None, args, kwargs))
+        else:
+            sinks.append((_path(snk), merit, None, None))
+    return sinks
+
 
+def _patch_sinks(sinks, resolver):
+    """Create all taint sinks of a compiled policy."""
+    for path, merit, args, kwargs in sinks:
+        if args is None:
+            patch = sink(resolver.merit(merit))
+        else:
+            args = [resolver.merits(checks) for checks in args]
+            kwargs = dict((name, resolver.merits(checks))
+                          for name, checks in kwargs.iteritems())
+            patch = _complex_sink(args, kwargs)
+        namespace, target = resolver.namespace(path)
         apply_patch(namespace, target, patch)
 
 
-def _patch_propagators(config, frame):
-    """Create all taint propagators specified in config for a given frame."""
+def _compile_propagators(config):
+    """Compile taint propagators specified in config into a list of paths."""
+    return [_path(prop) for prop in config.get(u"propagators", ())]
 
-    for prop in config.get(u"propagators", ()):
-        namespace, target = _get_namespace_and_target(prop, frame)
+
+def _patch_propagators(propagators, resolver):
+    """Create all taint propagators of a compiled policy."""
+    for path in propagators:
+        namespace, target = resolver.namespace(path)
         apply_patch(namespace, target, propagator)
 
 
 def propagator(obj):
     """ Decorator for turning function or a class into a taint propagator. """
 
-    if isinstance(obj, types.FunctionType):
+    if isinstance(obj, _function_types):
         return _proxy_function(obj)
     else: # silently assume it's a class
         return _proxy_class(obj)
@@ -245,7 +305,7 @@ def apply_patch(namespace, target_name, action):
     if isinstance(namespace, types.TypeType):
         if isinstance(target, types.TypeType):  # a class
             patched = action(target)
-        elif isinstance(target, types.FunctionType):
+        elif isinstance(target, _function_types):
             patched = staticmethod(action(getattr(namespace, target_name)))
         elif target.im_class == type:    # class method
             patched = classmethod(action(target.im_func))
@@ -258,60 +318,53 @@ def apply_patch(namespace, target_name, action):
     setattr(namespace, target_name, patched)
 
 
-def _get_namespace_and_target(full_name, frame):
-    """Get namespace in which an object exists (and its name relative to that
-    namespace) based on its current frame and name relative to current
-    namespace.
-
-    Args:
-       full_name: Relative name of the object.
-       frame: Current frame.
-
-    Returns:
-      (namespace, relative_name): tuple such that:
-        - namespace: object's namespace
-        - relative_name: object's name relative to namespace
-
-    """
-
-    namespace = sys.modules[frame.f_globals["__name__"]]
-    traversal = full_name.split(".")
-    target = traversal[-1]
+def _path(full_name):
+    """Split a dotted name of an object into a path of names."""
+    return tuple(full_name.split("."))
 
-    if len(traversal) > 1:
-        namespace = getattr(namespace, traversal[0])
-    else:
-        return namespace, target
 
-    for t in traversal[1:-1]:
-        namespace = getattr(namespace, t)
+class _Resolver(object):
+    """ Finds objects by their paths relative to a module (the one for which
+    a config is applied). Merits are looked up once for all the patches. """
 
-    return namespace, target
+    def __init__(self, module):
+        self.module = module
+        self.merits_by_path = {}
 
+    def namespace(self, path):
+        """Get namespace in which the object at path exists and its name
+        relative to that namespace."""
+        namespace = self.module
+        for name in path[:-1]:
+            namespace = getattr(namespace, name)
+        return namespace, path[-1]
 
-def _get_merit(merit_name, frame):
-    """Get merit object from given frame by name."""
-    namespace, target = _get_namespace_and_target(merit_name, frame)
-    return getattr(namespace, target)
+    def merit(self, path):
+        """Get merit object at path (None for no path)."""
+        if path is None:
+            return None
+        merit = self.merits_by_path.get(path)
+        if merit is None:
+            namespace, target = self.namespace(path)
+            merit = self.merits_by_path[path] = getattr(namespace, target)
+        return merit
 
+    def merits(self, paths):
+        """Get a list of merit objects at paths."""
+        return [self.merit(path) for path in paths]
 
-def _load_config(config_handle):
-    """Load config from file object."""
-    return json.load(config_handle)
 
-
-def _preprocess_check(check_spec, frame):
-    """ Extract information about check from check_spec and based on the frame prepare
-    list of merits to check against.
+def _compile_check(check_spec):
+    """ Compile check_spec of an argument of a complex sink into paths of the
+    merits to check against.
 
     Args:
       check_spec - either a string (when no checks are required) or a
           dictionary with exactly one key being the name of argument, and a
           value being either a merit name, or list of merits names.
-      frame - a frame from which merits to check against will be extracted
 
     Returns:
-      a list (perhaps empty) of merit objects to check against
+      a list (perhaps empty) of paths of merits
 
     """
     if type(check_spec) != dict:
@@ -319,35 +372,27 @@ def _preprocess_check(check_spec, frame):
     else:
         merits = check_spec.values()[0]
         if type(merits) == list:
-            return [_get_merit(m, frame) for m in merits]
+            return [_path(m) for m in merits]
         else:
-            return [_get_merit(merits, frame)]
-
-
-def _preprocess_complex_args(sink_args, frame):
-    """ Prepare merit checks for each of args of complex sink by extracting
-    correct merit from given frame. """
-    return [_preprocess_check(a, frame) for a in sink_args]
+            return [_path(merits)]
 
 
-def _preprocess_complex_kwargs(sink_kwargs, frame):
-    """ Prepare merit checks for each of kwargs of complex sink by extracting
-    correct merit from given frame.
+def _compile_complex_kwargs(sink_kwargs):
+    """ Compile merit checks for each of kwargs of complex sink.
 
     Args:
         sink_kwargs - list of merit checks for keyword arguments -
             each item is a merit check specification (as described by
-            _preprocess_check)
-        frame - a frame from which merits to check against will be extracted
+            _compile_check)
 
     Returns:
         a dictionary in which keys are names of kwargs, and values are lists
-        (perhaps empty) of merit objects to check against
+        (perhaps empty) of paths of merits to check against
     """
 
     res = {}
     for k in sink_kwargs:
-        checks = _preprocess_check(k, frame)
+        checks = _compile_check(k)
         name = k if type(k) != dict else k.keys()[0]
         res[name] = checks
 
@@ -368,6 +413,7 @@ class Validator(object):
             return self.warnings, self.errors
 
         self.validate_options()
+        self.validate_sources()
         self.validate_cleaners()
         self.validate_sinks()
 
@@ -396,6 +442,20 @@ class Validator(object):
             self.err("Malformed merit description {}".format(obj))
         return True
 
+    def _check_rate(self, obj):
+        if not isinstance(obj, types.DictType):
+            return False
+        if not u"rate" in obj.keys():
+            return False
+        rate = obj[u"rate"]
+        if (isinstance(rate, bool) or
+            not isinstance(rate, (int, long, float)) or
+            not 0 <= rate <= 1):
+            self.err("Malformed sampling rate {} in sources.".format(rate))
+        elif len(obj) > 1:
+            self.err("Malformed sampling rate description {}".format(obj))
+        return True
+
     def _check_patchable(self, obj):
         if not isinstance(obj, types.StringTypes):
             return False
@@ -476,6 +536,11 @@ class Validator(object):
 
         return not self.errors
 
+    def validate_sources(self):
+        for s in self.config.get(u"sources", ()):
+            if not self._check_rate(s) and not self._check_patchable(s):
+                self.err("Unexpected object in sources: {}.".format(s))
+
     def validate_cleaners(self):
         first_merit = False
         last_merit = None # indicates if previous element of config was a merit
@@ -542,14 +607,14 @@ class Validator(object):
             self.warn("No sinks specified for merit {}.".format(last_merit))
 
 
-def _apply_options(config, current_frame):
+def _apply_options(options):
     """ Apply global taint options to the application. Currently supported
     options are:
       - propagate_re - add taint propagation to regular expressions
       - taint_files - make fileobjects returned by open tainted
     """
 
-    for option in config.get(u"options", ()):
+    for option in options:
         if option == u"propagate_re":
             _patch_re()
         elif option == u"taint_files":
@@ -623,16 +688,220 @@ def enable(config_name="PLUMBING"):
         config_name: Name of the config file.
     """
 
-    with open(config_name) as config_handle:
-        config = _load_config(config_handle)
+    policy = _load_policy(config_name)
+    # names in the config are relative to the module calling enable
+    caller = sys._getframe(1)
+    resolver = _Resolver(sys.modules[caller.f_globals["__name__"]])
+
+    _apply_options(policy[u"options"])
+    _patch_sources(policy[u"sources"], resolver)
+    _patch_sinks(policy[u"sinks"], resolver)
+    _patch_cleaners(policy[u"cleaners"], resolver)
+    _patch_propagators(policy[u"propagators"], resolver)
+
+
+# Compiled policies. A config is compiled into lists of the patches it makes
+# (by the _compile_* functions above), with dotted names split into paths, so
+# that applying it takes no more than looking the names up. The compiled
+# policy is cached in a file next to the config (with "c" appended to its
+# name, as for .pyc files), which is used as long as the modification time
+# and the hash of the config are the same as when it was compiled.
+
+_POLICY_MAGIC = "taint policy 1"
+
+
+def _compile_config(config):
+    """Compile a config (as loaded from JSON) into a policy."""
+    return {
+        u"options": list(config.get(u"options", ())),
+        u"sources": _compile_sources(config),
+        u"sinks": _compile_sinks(config),
+        u"cleaners": _compile_cleaners(config),
+        u"propagators": _compile_propagators(config),
+    }
+
+
+def _load_policy(config_name):
+    """Get the compiled policy of config file config_name, from the cache when
+    it's up to date, or compiling it (and updating the cache) otherwise."""
+
+    with open(config_name, "rb") as config_handle:
+        mtime = os.fstat(config_handle.fileno()).st_mtime
+        data = config_handle.read()
+    key = (_POLICY_MAGIC, mtime, hashlib.sha1(data).hexdigest())
+    cache_name = config_name + "c"
+
+    try:
+        with open(cache_name, "rb") as cache_handle:
+            cached_key, policy = marshal.load(cache_handle)
+        if cached_key == key:
+            return policy
+    except (IOError, EOFError, ValueError, TypeError):
+        pass    # missing or broken, compiled again below
+
+    policy = _compile_config(json.loads(data))
+
+    # written under a temporary name first, so that other processes never
+    # read a partial cache
+    temp_name = "%s.%d" % (cache_name, os.getpid())
+    try:
+        with open(temp_name, "wb") as cache_handle:
+            marshal.dump((key, policy), cache_handle)
+        os.rename(temp_name, cache_name)
+    except (IOError, OSError):
+        # the policy is just not cached, eg. in a read only directory
+        try:
+            os.unlink(temp_name)
+        except OSError:
+            pass
+    return policy
+
+
+def set_enabled(flag):
+    """Turn taint tracking on or off for the whole interpreter.
+
+    While it is off, sources, str.taint() and propagation produce clean
+    objects; strings tainted earlier keep their merits. Starting the
+    interpreter with -X notaint or PYTHONNOTAINT set is the same as calling
+    set_enabled(False) first thing.
+    """
+    _taint.set_enabled(flag)
+
 
-    current_frame = getouterframes(currentframe())[1][0]
+def is_enabled():
+    """Return whether taint tracking is on."""
+    return _taint.is_enabled()
 
-    _apply_options(config, current_frame)
-    _patch_sources(config, current_frame)
-    _patch_sinks(config, current_frame)
-    _patch_cleaners(config, current_frame)
-    _patch_propagators(config, current_frame)
+
+def intern(string):
+    """Intern string, which may be tainted.
+
+    Works like the intern builtin, except that tainted strings are accepted:
+    they are interned separately for each taint, so the result has the same
+    merits as string. Use it for tainted values repeatedly used as dict keys
+    or attribute names (eg. header names), to share a single object for
+    them and make lookups compare by identity.
+    """
+    return _taint.intern(string)
+
+
+# Sampling.
+# A sampling key (eg. a request id) is mapped to a point in [0, 1) by hashing
+# it; sources with rate r taint their results under keys whose point is
+# below r, so either the whole request is tracked or none of it is, and keys
+# tracked at a lower rate are tracked at every higher one too. Threads
+# without a key use their thread id.
+
+class _SamplingState(threading.local):
+    key = None
+    point = None        # computed on first use
+    sampled = False     # whether a source tainted anything under the key
+
+_sampling = _SamplingState()
+
+# weak reference to a sink -> its plan, which keeps the counters of checks
+_sink_plans = {}
+# plans of sinks which are gone, to be added to _sink_stats
+_dead_sink_plans = []
+# merit -> [checks, checks on sampled data, violations] of sinks which are
+# gone
+_sink_stats = {}
+_sink_stats_lock = threading.Lock()
+
+
+def _sampling_point():
+    """Return the point of the current sampling key."""
+    if _sampling.point is None:
+        key = _sampling.key
+        if key is None:
+            key = thread.get_ident()
+        digest = hashlib.md5(repr(key)).hexdigest()
+        _sampling.point = int(digest[:8], 16) / float(1 << 32)
+    return _sampling.point
+
+
+def _sample(rate):
+    """Decide whether a source with given rate should taint its result."""
+    if not _taint.is_enabled():
+        return False
+    if rate is not None and _sampling_point() >= rate:
+        return False
+    _sampling.sampled = True
+    return True
+
+
+def set_sampling_key(key):
+    """Set the sampling key of the current thread (None for the thread id).
+
+    Sampled sources decide whether to taint by the key, so all of them agree
+    for the same key - eg. for a single request when the key is its id.
+    """
+    _sampling.key = key
+    _sampling.point = None
+    _sampling.sampled = False
+
+
+@contextmanager
+def sampling_key(key):
+    """Use key as the sampling key of the current thread within the block."""
+    saved = _sampling.key, _sampling.point, _sampling.sampled
+    set_sampling_key(key)
+    try:
+        yield
+    finally:
+        _sampling.key, _sampling.point, _sampling.sampled = saved
+
+
+def _merge_stats(totals, stats):
+    """Add counters of a plan (as given by its stats()) to totals."""
+    for merit, counts in stats.items():
+        merit_totals = totals.setdefault(merit, [0, 0, 0])
+        for i, count in enumerate(counts):
+            merit_totals[i] += count
+
+
+def _add_sink_plan(sink, plan):
+    """Count checks of plan in sink_stats(), also after sink is gone."""
+    # sinks can be collected anywhere (even while _sink_stats_lock is held,
+    # or at exit), so this takes no locks
+    def retire(ref, plans=_sink_plans, dead=_dead_sink_plans):
+        dead.append(plans.pop(ref))
+
+    _sink_plans[weakref.ref(sink, retire)] = plan
+
+
+def _fold_dead_sink_plans():
+    """Add counters of dead sink plans to _sink_stats (with the lock held)."""
+    while _dead_sink_plans:
+        _merge_stats(_sink_stats, _dead_sink_plans.pop().stats())
+
+
+def sink_stats():
+    """Return counters of sink checks.
+
+    Returns:
+        dict: Maps each merit checked by sinks to a dict with the number of
+        "checks", of checks done while a source tainted data under the
+        current sampling key ("sampled") and of "violations".
+    """
+    with _sink_stats_lock:
+        _fold_dead_sink_plans()
+        totals = dict((merit, list(stats))
+                      for merit, stats in _sink_stats.items())
+        for plan in _sink_plans.values():
+            _merge_stats(totals, plan.stats())
+    return dict((merit, {"checks": checks, "sampled": sampled,
+                         "violations": violations})
+                for merit, (checks, sampled, violations) in totals.items())
+
+
+def reset_sink_stats():
+    """Zero all the sink check counters."""
+    with _sink_stats_lock:
+        del _dead_sink_plans[:]
+        _sink_stats.clear()
+        for plan in _sink_plans.values():
+            plan.reset_stats()
 
 
 # Context managers.
@@ -641,25 +910,27 @@ def enable(config_name="PLUMBING"):
 # pylint: disable=E0602 class _PropagationContext(object):
 
 @contextmanager
+def _propagation_override(merit, propagation):
+    """Propagate merit according to propagation in the current thread only.
+
+    The override is kept on a per-thread stack consulted by the interpreter;
+    neither the merit class nor other threads are affected, and the override
+    is removed even when the block raises.
+    """
+    _taint.push_propagation(merit, propagation)
+    try:
+        yield
+    finally:
+        _taint.pop_propagation()
+
 def unsafePropagationFull(merit):
-    propagation = merit.propagation
-    merit.propagation = Merit.FullPropagation
-    yield
-    merit.propagation = propagation
+    return _propagation_override(merit, Merit.FullPropagation)
 
-@contextmanager
 def unsafePropagationPartial(merit):
-    propagation = merit.propagation
-    merit.propagation = Merit.PartialPropagation
-    yield
-    merit.propagation = propagation
+    return _propagation_override(merit, Merit.PartialPropagation)
 
-@contextmanager
 def unsafePropagationNone(merit):
-    propagation = merit.propagation
-    merit.propagation = Merit.NonePropagation
-    yield
-    merit.propagation = propagation
+    return _propagation_override(merit, Merit.NonePropagation)
 
 
 # TODO(marcinf) some merits (choose propagation for them)
@@ -670,69 +941,46 @@ class XSSMerit(Merit): pass
 class SQLiMerit(Merit): pass
 
 
-class Taintable(object):
-    """ Base class for taint propagator proxies. """
-
-    # special cases
-    def __iter__(self):
-        obj = object.__getattribute__(self, "__obj")
-        return _taint_attr(object.__getattribute__(obj, "__iter__"),
-                           object.__getattribute__(self, "__taint"))()
-
-    def next(self):
-        obj = object.__getattribute__(self, "__obj")
-        return _taint_attr(object.__getattribute__(obj, "next"),
-                           object.__getattribute__(self, "__taint"))()
-
-    def __str__(self):
-        return str(object.__getattribute__(self, "__obj"))
-
-    def __repr__(self):
-        return repr(object.__getattribute__(self, "__obj"))
-
-    def __unicode__(self):
-        return unicode(object.__getattribute__(self, "__obj"))
+# Taint propagating proxy of objects which can't carry taint themselves. It
+# forwards attribute access and special methods to the wrapped object and
+# taints their results - with the taint of the proxy for attributes, with
+# taint propagated from the proxy and the arguments for calls and operators.
+# Implemented in the _taint module.
+Propagator = _taint.Proxy
 
-    def __nonzero__(self):
-        return bool(object.__getattribute__(self, "__obj"))
+# Base class of all the proxies.
+Taintable = Propagator
 
-    # attributes
-    def __getattribute__(self, attr):
-        return _taint_attr(getattr(object.__getattribute__(self, "__obj"),
-                                  attr),
-                           object.__getattribute__(self, "__taint"))
+# Read only views of builtin collections, tainting the items when they are
+# read. Lazy sources and proxied functions return them instead of tainted
+# copies, so that the cost of tainting is paid only for the items which are
+# used. They aren't lists, tuples or dicts themselves, so they're only given
+# when asked for.
+TaintedList = _taint.TaintedList
+TaintedTuple = _taint.TaintedTuple
+TaintedDict = _taint.TaintedDict
 
-    # TODO it is also possible to propagate taint when setting
-    # perhaps an object which taint is modified by setting attributes may be a
-    # good idea in future.
+# Iterator tainting the items of another one as they come out. Sources and
+# proxied functions give it in place of generators and iterators of builtin
+# collections, and proxies give it when iterated, so that tainted streams
+# cost little more per item than untainted ones.
+TaintedIterator = _taint.TaintedIterator
 
-    def __setattr__(self, attr, value):
-        setattr(object.__getattribute__(self, "__obj"), attr, value)
 
-    def __delattr__(self, attr):
-        delattr(object.__getattribute__(self, "__obj"), attr)
-
-# magic methods to create for taint proxies
-_magic_methods = ["__lt__", "__le__", "__eq__", "__ne__", "__gt__", "__ge__",
-                  "__cmp__", "__rcmp__", "__hash__", "__get__",
-                  "__set__", "__delete__", "__isinstancecheck__",
-                  "__subclasshook__", "__call__", "__len__", "__getitem__",
-                  "__setitem__", "__delitem__", "__reversed__",
-                  "__contains__", "__getslice__", "__setslice__",
-                  "__delslice__", "__add__", "__sub__", "__mul__",
-                  "__floordiv__", "__mod__", "__divmod__", "__pow__",
-                  "__lshift__", "__rshift__", "__and__", "__xor__", "__or__",
-                  "__div__", "__truediv__", "__radd__", "__rsub__",
-                  "__rmul__", "__rdiv__", "__rtruediv__", "__rfloordiv__",
-                  "__rmod__", "__rdivmod__", "__rpow__", "__rlshift__",
-                  "__rrshift__", "__rand__", "__rxor__", "__ror__",
-                  "__iadd__", "__isub__", "__imul__", "__idiv__",
-                  "__itruediv__"]
+# id of wrapped class -> its proxy class. Proxy classes refer to the wrapped
+# classes (often the only reference, when propagator() is used as a class
+# decorator), so the entries are weak on the proxy side. The id isn't reused
+# while the entry exists, as the proxy class keeps the wrapped one alive.
+_proxy_classes = weakref.WeakValueDictionary()
 
 
 def _proxy_class(kls):
     """ Create a proxy class for kls which propagates taint, but otherwise
-    behaves the same. """
+    behaves the same. Each class gets a single proxy class. """
+
+    proxy = _proxy_classes.get(id(kls))
+    if proxy is not None:
+        return proxy
 
     class MC(type):
         """ Metaclass for the taint propagating proxy. """
@@ -746,142 +994,68 @@ def _proxy_class(kls):
             return unicode(kls) + " (tainted)"
 
         def __new__(mcs, name, bases, dct):
-            for m in _magic_methods:
-                if hasattr(kls, m):
-                    def _tainted_meth(self, *arg, **kwargs):
-                        taint = _collect_taint(list(args) + kwargs.values() +
-                                     [object.__getattribute__(obj, "__taint")])
-                        return _taint_object(getattr(kls, m), taint)
-                    dct[m] = getattr(kls, m)
             return type.__new__(mcs, "%s" % kls.__name__, bases, dct)
 
     class Propagator(Taintable):
         __metaclass__ = MC
 
-        def __init__(self, *args, **kwargs):
-            object.__setattr__(self, "__obj", kls(*args, **kwargs))
-            object.__setattr__(self, "__cls", kls)
-            taint = _collect_taint(list(args) + kwargs.values())
-            object.__setattr__(self, "__taint", taint)
-
+        def __new__(cls, *args, **kwargs):
+            return Taintable.__new__(cls, kls(*args, **kwargs),
+                                     _collect_taint(args, kwargs))
 
+    _proxy_classes[id(kls)] = Propagator
     return Propagator
 
-class Propagator(Taintable):
-    def __new__(cls, obj, taint):
-        dct = {}
-        for m in _magic_methods:
-            if hasattr(cls, m):
-                def _tainted_meth(self, *arg, **kwargs):
-                    taint = _collect_taint(list(args) + kwargs.values() +
-                                 [object.__getattribute__(obj, "__taint")])
-                    return _taint_object(getattr(kls, m), taint)
-
-        cls_tainted = type("%s" % cls.__name__, cls.__mro__, dct)
-        return object.__new__(cls_tainted)
-
-    def __init__(self, obj, taint):
-        object.__setattr__(self, "__obj", obj)
-        object.__setattr__(self, "__taint", taint)
-
-
-def _propagator_wrapper(obj, taint):
-    """ Default wrapper for propagating taint over arbitrary object. For objects
-    of types: NoneType, int, float, bool, long, the same object is returned. For
-    objects of other types, given object is wrapped in the Propagator. """
-    if type(obj) in [types.NoneType, types.IntType, types.FloatType,
-                     types.BooleanType, types.LongType]:
-        return obj
-    else:
-        return Propagator(obj, taint)
-
 
-def _proxy_function(func, tainted=False):
+def _proxy_function(func, tainted=False, lazy=False):
     """ Decorate a function func so that it will return a tainted object.
     Type of decorated function return value depends on func's return value. If
     it is a:
       - string/unicode - they will be tainted by their builtin mechanisms
       - builtin collection of taintable objects - each object of collection
-        will be tainted (for dictionaries, only values are tainted, keys are not
-        modified)
+        will be tainted (for dictionaries, only values are tainted, keys are
+        not modified)
+      - generator or iterator of a builtin collection - its items will be
+        tainted as they come out of a TaintedIterator
       - other object - it will proxied by Propagator class
 
     The taint value will be either:
       - when tainted is false (default) - result of taint propagation between
         func's arguments
       - when tainted is true - always tainted with no merits
-      """
 
-    @wraps(func)
-    def inner(*args, **kwargs):
-        taint = _collect_taint(list(args) + kwargs.values())
-        if tainted:
-            taint = _propagate(taint, tuple())
-        res = func(*args, **kwargs)
-
-        return _taint_object(res, taint)
+    With lazy set, lists, tuples and dicts are given as read only views
+    tainting the items when they're read, instead of tainted copies.
+      """
 
-    return inner
+    return _taint.PropagatorWrapper(func, tainted, lazy)
 
 
 # Taint utilities
 #
-#
-# TODO similar utilities are provided by taintobject.c . Probably a Python
-# wrapper around it would be better idea than redefining them again here.
-
-def _get_taint(obj):
-    """ Extract taint from taintable object - either string/unicode with builtin
-    taint or an object proxied inside taint propagator. """
-    if isinstance(obj, types.StringTypes):
-        return obj._merits()
-    elif isinstance(obj, Taintable):
-        return object.__getattribute__(obj, "__taint")
-    return None
-
-
-def _collect_taint(objects):
-    """ Return result of taint propagation across objects from given list. """
-    if not objects:
-        return None
-
-    taint = _get_taint(objects[0])
-    for o in objects[1:]:
-        taint = _propagate(taint, _get_taint(o))
-    return taint
-
-def _propagate(a, b):
-    """ Using taint propagation semantics, propagate merits between a and b.
-    Both a and b represent taint, being either a collection of merits (perhaps
-    empty) or None (when representing "taint" of untainted object)."""
-
-
-    # both clean
-    if a is None and b is None:
-        return None
-
-    # both tainted
-    if a is not None and b is not None:
-        return set(merit for merit in set(a) & set(b)
-                   if merit.propagation != Merit.NonePropagation)
-
-    # one is tainted, other clean
-    if a is None:
-        source = b
-    else:
-        source = a
-    source = set(source)
+# Taint of an object is represented either by a collection of merits (perhaps
+# empty) or by None, for untainted objects. Propagation itself is done by
+# taintobject.c, through the _taint module.
+
+# Extract taint from taintable object - either string/unicode with builtin
+# taint or an object proxied inside taint propagator.
+_get_taint = _taint.get_taint
+
+# Return result of taint propagation across objects from given sequence (and
+# values of a dict, if it's given too).
+_collect_taint = _taint.collect_taint
 
-    return set(merit for merit in source
-               if merit.propagation == Merit.FullPropagation)
+# Using taint propagation semantics, propagate merits between taints a and b.
+_propagate = _taint.propagate
 
-def _taint_object(obj, taint=(), taint_wrapper=_propagator_wrapper):
+def _taint_object(obj, taint=(), taint_wrapper=None, lazy=False):
     """ Taint arbitrary object with the taint. For string/unicode objects, their
     builtin taint mechanisms will be used. For builtin collections, each item
-    will be tainted recursively with this function (for dicts, only values are
-    tainted). For other objects, taint_wrapper will be used to give them taint
-    propagating capabilities (default taint_wrapper is the Propagator proxy
-    class).
+    will be tainted recursively (for dicts, only values are tainted). For other
+    objects, taint_wrapper will be used to give them taint propagating
+    capabilities (by default, they are wrapped in the Propagator proxy, except
+    for None and numbers, which are returned as they are, and generators and
+    iterators of builtin collections, which are given as TaintedIterator).
 
     Args:
       - obj - object to taint
@@ -890,38 +1064,8 @@ def _taint_object(obj, taint=(), taint_wrapper=_propagator_wrapper):
         defaults to empty tuple
       - taint_wrapper - a callable to wrap untaintable objects with taint
         propagation - defaults to Propagator
+      - lazy - when true, lists, tuples and dicts are given as TaintedList,
+        TaintedTuple and TaintedDict views instead of tainted copies
 
     """
-
-    if isinstance(obj, types.StringTypes):
-        if taint is None:
-            return obj
-        obj = obj.taint()
-        for merit in taint:
-            obj = obj._cleanfor(merit)
-        return obj
-    elif type(obj) is types.ListType:
-        return [_taint_object(o, taint) for o in obj]
-    elif type(obj) is types.TupleType:
-        return tuple(_taint_object(o, taint) for o in obj)
-    elif type(obj) is types.DictType:
-        return {k: _taint_object(v, taint) for (k, v) in obj.iteritems()}
-    elif type(obj) is set:
-        return set(_taint_object(o, taint) for o in obj)
-    elif type(obj) is frozenset:
-        return frozenset(_taint_object(o, taint) for o in obj)
-    else:
-        return taint_wrapper(obj, taint)
-
-def _taint_attr(attr, taint):
-    if callable(attr):
-        def f(*args, **kwargs):
-            res = attr(*args, **kwargs)
-            new_taint = _collect_taint(list(args) + kwargs.values())
-            new_taint = _propagate(new_taint, taint)
-            return _taint_object(res, new_taint)
-        return f
-    else:
-        return _taint_object(attr, taint)
-
-
+    return _taint.taint_object(obj, taint, taint_wrapper, lazy)
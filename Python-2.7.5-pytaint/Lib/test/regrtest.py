@@ -1076,6 +1076,14 @@ def dash_R_cleanup(fs, ps, pic, zdc, abcs):
     # clear type cache
     sys._clear_type_cache()
 
+    # drop shared tainted strings, which keep their taint objects alive
+    try:
+        import _taint
+    except ImportError:
+        pass
+    else:
+        _taint.tainted_chars_clear()
+
     # Clear ABC registries, restoring previously saved ABC registries.
     for abc, registry in abcs.items():
         abc._abc_registry = registry.copy()
@@ -3,6 +3,7 @@ import unittest, test.test_support
 import sys, os, cStringIO
 import struct
 import operator
+import sysconfig
 
 class SysModuleTest(unittest.TestCase):
 
@@ -438,7 +439,8 @@ class SysModuleTest(unittest.TestCase):
         attrs = ("debug", "py3k_warning", "division_warning", "division_new",
                  "inspect", "interactive", "optimize", "dont_write_bytecode",
                  "no_site", "ignore_environment", "tabcheck", "verbose",
-                 "unicode", "bytes_warning", "hash_randomization")
+                 "unicode", "bytes_warning", "hash_randomization",
+                 "no_taint")
         for attr in attrs:
             self.assertTrue(hasattr(sys.flags, attr), attr)
             self.assertEqual(type(getattr(sys.flags, attr)), int, attr)
@@ -704,8 +706,17 @@ class SizeofTest(unittest.TestCase):
         check(slice(1), size('3P'))
         # str
         vh = test.test_support._vheader
-        check('', struct.calcsize(vh + 'Plic'))
-        check('abc', struct.calcsize(vh + 'Plic') + 3)
+        if sysconfig.get_config_var('Py_TAINT_COMPACT'):
+            # taint index shares a word with ob_sstate
+            strfmt = 'lic'
+        elif sysconfig.get_config_var('Py_TAINT_SIDETABLE'):
+            # taint is kept out of the object, ob_sstate and the taint flag
+            # are bit fields taking one byte
+            strfmt = 'lBc'
+        else:
+            strfmt = 'Plic'
+        check('', struct.calcsize(vh + strfmt))
+        check('abc', struct.calcsize(vh + strfmt) + 3)
         # super
         check(super(int), size('3P'))
         # tuple
@@ -730,8 +741,12 @@ class SizeofTest(unittest.TestCase):
         samples = [u'', u'1'*100]
         # we need to test for both sizes, because we don't know if the string
         # has been cached
+        if sysconfig.get_config_var('Py_TAINT_SIDETABLE'):
+            unicodefmt = 'PPlP'
+        else:
+            unicodefmt = 'PPPlP'
         for s in samples:
-            check(s, size('PPPlP') + usize * (len(s) + 1))
+            check(s, size(unicodefmt) + usize * (len(s) + 1))
         # weakref
         import weakref
         check(weakref.ref(int), size('2Pl2P'))
@@ -1,5 +1,6 @@
 import unittest, string
 import sys
+import _taint
 from test import test_support, string_tests
 
 
@@ -84,6 +85,210 @@ class TaintTest(AbstractTaintTest):
         self.assertClean(u1)
         self.assertClean(u2)
 
+    def test_tainted_interning(self):
+        a = ('tt' + 'tt').taint()
+        b = ('t' * 4).taint()
+        c = ('t' * 4)._cleanfor(MeritFull)
+        ia = _taint.intern(a)
+        ib = _taint.intern(b)
+        ic = _taint.intern(c)
+        self.assertIs(ia, a)
+        self.assertIs(ib, a)
+        self.assertIs(ic, c)
+        self.assertMerits(ib, [])
+        self.assertMerits(ic, [MeritFull])
+        self.assertIsNot(intern('tttt'), ia)
+        self.assertIs(_taint.intern('t' * 4), intern('tttt'))
+        self.assertRaises(TypeError, _taint.intern, u'tttt')
+        self.assertRaises(TypeError, intern, a)
+
+        # interned tainted strings die like clean ones
+        del a, b, ia, ib
+        d = ('tt' + 'tt').taint()
+        self.assertIs(_taint.intern(d), d)
+        self.assertIs(_taint.intern(('t' * 4)._cleanfor(MeritFull)), c)
+        del c, ic
+        for i in xrange(100):
+            s = ('s%d' % i)._cleanfor(MeritFull)
+            self.assertIs(_taint.intern(s), s)
+        del s
+
+        # attribute names are interned
+        class C(object):
+            pass
+        o = C()
+        name = ('attr' + 'ibute').taint()
+        setattr(o, name, 1)
+        self.assertEqual(o.attribute, 1)
+        self.assertEqual(getattr(o, name), 1)
+        self.assertTainted(o.__dict__.keys()[0])
+
+    def test_shared_chars(self):
+        t = 'abc'.taint()
+        f = 'abc'._cleanfor(MeritFull)
+        self.assertIs(t[0], t[0])
+        self.assertIs(t[0], t[0:1])
+        self.assertIs(t[0], 'xax'.taint()[1])
+        self.assertIs(t[1:1], f[:0].taint())
+        self.assertIsNot(t[0], 'a')
+        self.assertIsNot(t[0], f[0])
+        self.assertMerits(t[0], [])
+        self.assertMerits(f[0], [MeritFull])
+        self.assertMerits(f[2:2], [MeritFull])
+        for c in 'abc':
+            self.assertIs(c, intern(c))
+
+        # shared strings are never modified in place
+        c = t[0]
+        self.assertMerits(c._cleanfor(MeritFull), [MeritFull])
+        c += f[0]
+        self.assertMerits(t[0], [])
+        self.assertIsNot(c, t[0])
+
+        _taint.tainted_chars_clear()
+        self.assertMerits(t[0], [])
+        self.assertIs(t[0], t[0])
+
+    def test_canonical_merits(self):
+        # equal merit sets share one taint object however they were built;
+        # withmerits() returns a string unchanged only if its taint object
+        # is the one for the given merits
+        def assertCanonical(s, merits):
+            self.assertEqual(s._merits(), set(merits))
+            self.assertIs(s.withmerits(merits), s)
+
+        s = 'a longer string'
+        assertCanonical(s.taint(), [])
+        assertCanonical(s._cleanfor(MeritFull).taint(), [])
+        assertCanonical(s._cleanfor(MeritFull).withmerits(()), [])
+        f = s._cleanfor(MeritFull)
+        fp = f._cleanfor(MeritPartial)
+        for t in (f, s.taint()._cleanfor(MeritFull), fp + f, f + fp[:1],
+                  fp._propagate(f), f._cleanfor(MeritFull)):
+            assertCanonical(t, [MeritFull])
+        for t in (fp, s._cleanfor(MeritPartial)._cleanfor(MeritFull),
+                  f.withmerits((MeritPartial, MeritFull, MeritPartial)),
+                  fp + fp, fp._propagate(fp)):
+            assertCanonical(t, [MeritFull, MeritPartial])
+
+        # shared chars are looked up by the taint object, so they are
+        # shared between equal merit sets too
+        f2 = s.taint()._cleanfor(MeritFull)
+        self.assertIs(f[0], f2[0])
+        fp2 = (f2 + fp)._cleanfor(MeritPartial)
+        self.assertIs(fp[0], fp2[0])
+        self.assertIsNot(f[0], fp2[0])
+
+        # once the strings are gone, new ones share a new object
+        del f, f2, fp, fp2, t
+        _taint.tainted_chars_clear()
+        f = s._cleanfor(MeritFull)
+        assertCanonical(f, [MeritFull])
+        assertCanonical(s.taint()._cleanfor(MeritFull), [MeritFull])
+
+    def test_many_tainted(self):
+        # lots of tainted strings dying and being created at the same time
+        # (and addresses being reused) must not mix up their taint
+        strings = [('s%d' % i)._cleanfor(MeritFull) for i in xrange(5000)]
+        strings += [('s%d' % i)._cleanfor(MeritPartial)
+                    for i in xrange(5000)]
+        del strings[::2]
+        clean = ['c%d' % i for i in xrange(5000)]
+        for s in strings[:2500]:
+            self.assertMerits(s, [MeritFull])
+        for s in strings[2500:]:
+            self.assertMerits(s, [MeritPartial])
+        for s in clean:
+            self.assertClean(s)
+        del strings
+        clean += ['d%d' % i for i in xrange(5000)]
+        for s in clean:
+            self.assertClean(s)
+
+    def test_hash_kept(self):
+        # copies with different merits carry over the hash computed for the
+        # original, which must be the same as for any other equal string
+        s = 'key ' * 300
+        expected = hash(''.join(['key '] * 300))
+        self.assertEqual(hash(s), expected)
+        f = s._cleanfor(MeritFull)
+        copies = [s.taint(), f, f._cleanfor(MeritPartial), s._propagate(f),
+                  f.zfill(10), f.ljust(10), f.rjust(10), f.center(10),
+                  ''.join([f])]
+        for c in copies:
+            self.assertEqual(c, s)
+            self.assertEqual(hash(c), expected)
+        d = {s: 1}
+        for c in copies:
+            self.assertEqual(d[c], 1)
+        d = dict.fromkeys(copies)
+        self.assertEqual(len(d), 1)
+        self.assertIn(s, d)
+
+    def test_withmerits(self):
+        s = 'a longer string that will be tainted'
+        self.assertMerits(s.withmerits([]), [])
+        self.assertMerits(s.withmerits([MeritFull]), [MeritFull])
+        t = s.withmerits((MeritFull, MeritPartial, MeritFull))
+        self.assertEqual(t, s)
+        self.assertMerits(t, [MeritFull, MeritPartial])
+        self.assertEqual(t, s.taint()._cleanfor(MeritFull)
+                              ._cleanfor(MeritPartial))
+        # merits of S are replaced, not extended
+        self.assertMerits(t.withmerits(iter([MeritNone])), [MeritNone])
+        self.assertMerits(t.withmerits(set()), [])
+        self.assertIs(t.withmerits([MeritPartial, MeritFull]), t)
+        self.assertMerits('x'.withmerits([MeritNone]), [MeritNone])
+        self.assertMerits(''.withmerits([MeritNone]), [MeritNone])
+
+        many = [type('MeritWith%d' % i, (Merit,), {}) for i in range(600)]
+        self.assertMerits(s.withmerits(many), many)
+        self.assertMerits(t.withmerits(many[::-7]), many[::-7])
+
+        self.assertRaises(TypeError, s.withmerits, None)
+        self.assertRaises(TypeError, s.withmerits, [MeritFull, str])
+        self.assertRaises(TypeError, s.withmerits, [Merit.FullPropagation])
+        self.assertRaises(ZeroDivisionError, s.withmerits,
+                          (MeritFull if i else 1 / i for i in (1, 0)))
+
+    def test_taint_in_place(self):
+        ids = []
+        def fresh(n):
+            s = 'x' * n
+            ids.append(id(s))
+            return s
+
+        # only the bound method references the string, so it's not copied
+        t = fresh(100).taint()
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [])
+        t = fresh(100)._cleanfor(MeritFull)
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [MeritFull])
+        t = fresh(100).withmerits([MeritPartial, MeritNone])
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [MeritPartial, MeritNone])
+        t = fresh(100)._cleanfor(MeritFull)._cleanfor(MeritPartial)
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [MeritFull, MeritPartial])
+
+        s = fresh(100)
+        t = s._cleanfor(MeritFull)
+        self.assertNotEqual(id(t), id(s))
+        self.assertClean(s)
+        self.assertMerits(t, [MeritFull])
+        self.assertMerits(t.taint(), [])
+        self.assertMerits(t, [MeritFull])
+
+        # shared strings are always copied
+        self.assertMerits(fresh(1).taint(), [])
+        self.assertClean('x')
+        self.assertMerits(fresh(0).taint(), [])
+        self.assertClean('')
+        t = intern(''.join(['not ', 'in place'])).taint()
+        self.assertMerits(t, [])
+        self.assertClean(intern('not in place'))
+
 
 class MeritsTest(AbstractTaintTest):
     def test_propagate(self):
@@ -340,6 +545,145 @@ class MeritsTest(AbstractTaintTest):
                 self.assertNotIn(MeritNone, m)
                 self.assertNotIn(MeritNone2, m)
 
+    def test_propagation_change(self):
+        class MeritBase(Merit):
+            propagation = Merit.FullPropagation
+
+        class MeritDerived(MeritBase):
+            pass
+
+        self.assertIsInstance(MeritDerived, type(Merit))
+        t = 'ttttt'._cleanfor(MeritDerived)
+        self.assertMerits(t + 'u', [MeritDerived])
+
+        MeritBase.propagation = Merit.NonePropagation
+        self.assertMerits(t + 'u', [])
+        self.assertMerits(t + t, [])
+
+        MeritBase.propagation = Merit.PartialPropagation
+        self.assertMerits(t + 'u', [])
+        self.assertMerits(t + t, [MeritDerived])
+
+        MeritDerived.propagation = Merit.FullPropagation
+        MeritBase.propagation = Merit.NonePropagation
+        self.assertMerits(t + 'u', [MeritDerived])
+
+        del MeritDerived.propagation
+        self.assertMerits(t + 'u', [])
+
+        MeritBase.propagation = None
+        self.assertRaises(ValueError, t.__add__, 'u')
+        self.assertRaises(TypeError, 'u'._cleanfor, MeritBase)
+
+        with self.assertRaises(TypeError):
+            Merit.propagation = Merit.FullPropagation
+
+    def test_many_merits(self):
+        full = [type('MeritFull%d' % i, (Merit,),
+                     {'propagation': Merit.FullPropagation})
+                for i in range(100)]
+        part = [type('MeritPartial%d' % i, (Merit,),
+                     {'propagation': Merit.PartialPropagation})
+                for i in range(100)]
+
+        t = 'ttttt'.taint()
+        for m in full + part:
+            t = t._cleanfor(m)
+        s = 'sssss'.taint()
+        for m in full[::2] + part[::2]:
+            s = s._cleanfor(m)
+
+        self.assertMerits(t, full + part)
+        self.assertTrue(t.isclean(part[-1]))
+        self.assertFalse(s.isclean(part[-1]))
+        self.assertMerits(t + 'u', full)
+        self.assertMerits(t + s, full[::2] + part[::2])
+        self.assertMerits(s + t, full[::2] + part[::2])
+        self.assertMerits(s + 'u', full[::2])
+
+    def test_invalid_merits(self):
+        class NotAMerit(object):
+            propagation = Merit.FullPropagation
+
+        t = 'ttttt'.taint()
+        self.assertRaises(TypeError, t._cleanfor, NotAMerit)
+        self.assertRaises(TypeError, t._cleanfor, MeritFull())
+        self.assertRaises(TypeError, t.isclean, NotAMerit)
+        self.assertRaises(TypeError, t.isclean, 'MeritFull')
+
+    def test_propagate_many(self):
+        a = 'a'._cleanfor(MeritFull)._cleanfor(MeritPartial)\
+               ._cleanfor(MeritNone)
+        b = 'b'._cleanfor(MeritFull)._cleanfor(MeritPartial)
+        parts = [a] * 1000 + [b] * 1000
+        fmt = ('%s' * len(parts))._cleanfor(MeritFull)._cleanfor(MeritPartial)
+        newfmt = ('{}' * len(parts))._cleanfor(MeritFull)\
+                                    ._cleanfor(MeritPartial)
+
+        self.assertMerits(a.join([a]), [MeritFull, MeritPartial])
+        self.assertMerits(a.join([a] * 1000), [MeritFull, MeritPartial])
+        self.assertMerits(a.join(parts), [MeritFull, MeritPartial])
+        self.assertMerits(fmt % tuple(parts), [MeritFull, MeritPartial])
+        self.assertMerits(newfmt.format(*parts), [MeritFull, MeritPartial])
+        self.assertMerits(unicode(a).join(map(unicode, parts)),
+                          [MeritFull, MeritPartial])
+        self.assertMerits(unicode(fmt) % tuple(parts),
+                          [MeritFull, MeritPartial])
+        self.assertMerits(unicode(newfmt).format(*parts),
+                          [MeritFull, MeritPartial])
+
+        # a single clean operand leaves only merits with full propagation
+        self.assertMerits(''.join(parts), [MeritFull])
+        self.assertMerits(a.join(parts + ['u']), [MeritFull])
+        self.assertMerits((fmt + 'u') % tuple(parts), [MeritFull])
+        self.assertMerits(newfmt.format(*(parts[:-1] + ['u'])), [MeritFull])
+        self.assertMerits(u''.join(map(unicode, parts)), [MeritFull])
+        self.assertMerits(u'u'.join([a, b]), [MeritFull])
+        self.assertMerits('u'.join(['u', 'u']), None)
+
+        class MeritBroken(Merit):
+            propagation = Merit.PartialPropagation
+
+        c = 'c'._cleanfor(MeritBroken)
+        MeritBroken.propagation = None
+        self.assertRaises(ValueError, c.join, [c, c])
+        self.assertRaises(ValueError, ''.join, [c, c])
+        self.assertRaises(ValueError, '%s%s'.__mod__, (c, c))
+        self.assertRaises(ValueError, ('{}' * 2).format, c, c)
+        self.assertRaises(ValueError, c.replace, 'c', c)
+        self.assertRaises(ValueError, unicode(c).join, [c, c])
+
+    def test_propagation_cache(self):
+        import _taint
+        class MeritCached(Merit):
+            propagation = Merit.FullPropagation
+
+        t = 'ttttt'._cleanfor(MeritCached)
+        _taint.propagation_cache_clear()
+        info = _taint.propagation_cache_info()
+        self.assertEqual(info['hits'], 0)
+        self.assertEqual(info['misses'], 0)
+        self.assertEqual(info['used'], 0)
+
+        self.assertMerits(t + 'u', [MeritCached])
+        self.assertMerits('u' + t, [MeritCached])
+        info = _taint.propagation_cache_info()
+        self.assertEqual(info['misses'], 1)
+        self.assertEqual(info['hits'], 1)
+        self.assertEqual(info['used'], 1)
+
+        MeritCached.propagation = Merit.NonePropagation
+        info = _taint.propagation_cache_info()
+        self.assertEqual(info['invalidations'], 1)
+        self.assertEqual(info['used'], 0)
+        self.assertMerits(t + 'u', [])
+
+        # assignment which doesn't change the strategy keeps the cache
+        MeritCached.propagation = Merit.NonePropagation
+        info = _taint.propagation_cache_info()
+        self.assertEqual(info['invalidations'], 1)
+        self.assertEqual(info['used'], 1)
+
 class UnaryStringOperationTest(AbstractTaintTest):
     """ Test string methods which use only one string argument - ie. where
     taint is just copied from the argument to result. """
@@ -629,6 +973,38 @@ class VariadicStringOperationTest(AbstractTaintTest):
         self.assertTainted(e)
         self.assertClean(f)
 
+    def test_inplace_concatenation(self):
+        full = 'fff'._cleanfor(MeritFull)._cleanfor(MeritPartial)
+        partial = 'ppp'._cleanfor(MeritPartial)
+
+        # s is a fresh string referenced only by the local variable, so
+        # += resizes it in place
+        s = 'abc'.join(['x', 'y'])
+        s += 'zz'
+        self.assertClean(s)
+        s += full
+        self.assertMerits(s, [MeritFull])
+        s += 'zz'
+        self.assertMerits(s, [MeritFull])
+        s += partial
+        self.assertMerits(s, [])
+        self.assertEqual(s, 'xabcyzzfffzzppp')
+
+        s = 'abc'.join(['x', 'y'])._cleanfor(MeritFull)._cleanfor(MeritPartial)
+        s += full
+        self.assertMerits(s, [MeritFull, MeritPartial])
+        s += partial
+        self.assertMerits(s, [MeritPartial])
+        self.assertEqual(s, 'xabcyfffppp')
+        self.assertMerits(full, [MeritFull, MeritPartial])
+        self.assertMerits(partial, [MeritPartial])
+
+        s = 'x'.join(['y', 'z'])
+        for i in xrange(1000):
+            s += full
+        self.assertMerits(s, [MeritFull])
+        self.assertEqual(len(s), 3003)
+
     def test_join(self):
         t = 'ttttt'.taint()
         u = 'uuuuu'
@@ -1,10 +1,19 @@
 import unittest
+import csv
 import itertools
 import taint
 import json
 import imp
+import marshal
+import os
 import re
+import threading
+import weakref
+import _taint
+from collections import deque
+from fractions import Fraction
 from test import test_support
+from test.script_helper import assert_python_ok, assert_python_failure
 
 CONFIG_1 = test_support.findfile('config1.json', subdir='tainttestdata')
 CONFIG_2 = test_support.findfile('config2.json', subdir='tainttestdata')
@@ -118,6 +127,193 @@ class DecoratorTest(AbstractTaintTest):
 
         self.assertTrue(snk('abc'))
 
+    def test_source_in_place(self):
+        ids = []
+
+        @taint.source
+        def fresh(value, n=1):
+            result = value * n
+            ids.append(id(result))
+            return result
+
+        kept = 'kept' * 10
+
+        @taint.source
+        def shared():
+            return kept
+
+        class StrSubclass(str):
+            pass
+
+        @taint.source
+        def subclass():
+            return StrSubclass('abc')
+
+        # nothing else references the result, so no copy is made
+        s = fresh('abc', n=100)
+        self.assertEqual(id(s), ids.pop())
+        self.assertMerits(s, [])
+        u = fresh(u'abc', 100)
+        self.assertEqual(id(u), ids.pop())
+        self.assertMerits(u, [])
+
+        t = shared()
+        self.assertEqual(t, kept)
+        self.assertMerits(t, [])
+        self.assertClean(kept)
+
+        t = fresh(intern('interned source'))
+        self.assertMerits(t, [])
+        self.assertClean(intern('interned source'))
+
+        t = subclass()
+        self.assertIs(type(t), str)
+        self.assertMerits(t, [])
+
+    def test_source_views(self):
+        rows = [("a", 1, {"k": ["x"]}), ("b", 2, {"k": ["y"]})]
+        data = {"name": "abc", "rows": rows}
+
+        def src():
+            return data
+
+        @taint.sink(MeritFull)
+        def snk(s):
+            return True
+
+        # by default, sources give plain tainted copies
+        d = taint.source(src)()
+        self.assertIs(type(d), dict)
+        self.assertIs(type(d["rows"][0]), tuple)
+        self.assertMerits(d["rows"][0][2]["k"][0], [])
+        self.assertEqual(json.dumps(d, sort_keys=True),
+                         json.dumps(data, sort_keys=True))
+        d["rows"].append(("c", 3, {}))
+        self.assertEqual(len(rows), 2)
+
+        d = taint.source(src, lazy=True)()
+        self.assertIsInstance(d, taint.TaintedDict)
+        self.assertEqual(d, data)
+        self.assertEqual(len(d), 2)
+        self.assertIn("rows", d)
+        self.assertMerits(d["name"], [])
+        self.assertMerits(d.get("name"), [])
+        self.assertIsNone(d.get("missing"))
+        self.assertCleanAll(d.keys())
+        self.assertCleanAll(d)
+        self.assertEqual(sorted(d.items()), sorted(data.items()))
+        self.assertMerits(dict(d.iteritems())["name"], [])
+
+        # nothing is copied until it's read
+        r = d["rows"]
+        self.assertIsInstance(r, taint.TaintedList)
+        self.assertEqual(r, rows)
+        self.assertIsInstance(r[0], taint.TaintedTuple)
+        self.assertMerits(r[-1][0], [])
+        self.assertEqual(r[1][1], 2)
+        self.assertMerits(r[0][2]["k"][0], [])
+        with self.assertRaises(IndexError):
+            r[2]
+        self.assertIsInstance(r[1:], taint.TaintedList)
+        self.assertMerits(r[1:][0][0], [])
+        self.assertMeritsAll([row[0] for row in r], [])
+        self.assertMerits("".join(row[0] for row in r), [])
+        self.assertEqual(hash(r[0][:2]), hash(("a", 1)))
+        self.assertCleanAll(rows[0][:1])
+        self.assertClean(data["name"])
+        with self.assertRaises(TypeError):
+            r[0] = "c"
+        with self.assertRaises(TypeError):
+            hash(r)
+
+        # views are checked like the containers they show, with their taint
+        self.assertEqual(_taint.check(r, [MeritFull]),
+                         (1, ((0, 0), "a", MeritFull)))
+        self.assertEqual(_taint.check(d, [MeritFull], 1),
+                         (1, (("name",), "abc", MeritFull)))
+        self.assertEqual(_taint.check(d, [], 1), (1, None))
+        with self.assertRaises(TaintError):
+            snk(d["name"])
+
+        m = r.materialize()
+        self.assertIs(type(m), list)
+        self.assertIs(type(m[0]), tuple)
+        self.assertIs(type(m[0][2]), dict)
+        self.assertMerits(m[0][2]["k"][0], [])
+        self.assertEqual(m, rows)
+        self.assertIs(type(d.materialize()), dict)
+
+
+    def test_source_iterators(self):
+        ids = []
+
+        def make_line(i):
+            result = "line %d" % i
+            ids.append(id(result))
+            return result
+
+        @taint.source
+        def lines(n):
+            for i in xrange(n):
+                yield make_line(i)
+
+        @taint.source
+        def rows():
+            received = yield ("a", ["b"])
+            while True:
+                received = yield (received, u"c")
+
+        it = lines(3)
+        self.assertIsInstance(it, taint.TaintedIterator)
+        self.assertIs(iter(it), it)
+        # nothing else references the lines, so they aren't copied
+        line = next(it)
+        self.assertEqual(id(line), ids.pop())
+        self.assertMerits(line, [])
+        self.assertMeritsAll(list(it), [])
+        self.assertEqual(list(it), [])
+
+        it = rows()
+        row = next(it)
+        self.assertIs(type(row), tuple)
+        self.assertMerits(row[1][0], [])
+        row = it.send("x")
+        self.assertEqual(row, ("x", u"c"))
+        self.assertMeritsAll(row, [])
+        self.assertRaises(ValueError, it.throw, ValueError)
+        self.assertRaises(StopIteration, next, it)
+        it = rows()
+        self.assertFalse(it.gi_running)
+        self.assertEqual(it.__name__, "rows")
+        next(it)
+        self.assertIsNotNone(it.gi_frame)
+        it.close()
+        self.assertRaises(StopIteration, next, it)
+        self.assertIsNone(it.gi_frame)
+
+        # iterators of builtin collections are bare too
+        for obj in (["a"], ("a",), {"a": 1}, set("a"), xrange(1), "a"):
+            self.assertIsInstance(taint.source(lambda: iter(obj))(),
+                                  taint.TaintedIterator)
+        self.assertMeritsAll(taint.source(lambda: reversed(["a"]))(), [])
+        self.assertMeritsAll(taint.source(lambda: {"a": "b"}.itervalues())(),
+                             [])
+
+        # other iterators have more to them, so they are proxied
+        reader = taint.source(lambda: csv.reader(["a,b", "c,d"]))()
+        self.assertIsInstance(reader, taint.Propagator)
+        self.assertMeritsAll(next(reader), [])
+        self.assertEqual(reader.line_num, 1)
+        self.assertEqual(reader.dialect.delimiter, ",")
+        it = taint.source(lambda: itertools.imap(make_line, xrange(2)))()
+        self.assertIsInstance(it, taint.Propagator)
+        self.assertMeritsAll(it, [])
+
+        # iterators of proxies taint the items the same way
+        p = taint.Propagator(["a", "b"], [MeritFull])
+        it = iter(p)
+        self.assertIsInstance(it, taint.TaintedIterator)
+        self.assertMeritsAll(it, [MeritFull])
 
 class SimplePatcherTest(AbstractTaintTest):
     class InnerClass(object):
@@ -228,6 +424,94 @@ class ImportedObjectsPatchingTest(AbstractTaintTest):
                           [MockModule.MeritX])
 
 
+class PolicyCacheTest(AbstractTaintTest):
+    config = {"sources": ["policy_source"],
+              "sinks": [{"merit": "MeritFull"}, "policy_sink",
+                        {"policy_complex_sink": {
+                            "args": ["a", {"b": ["MeritFull", "MeritPart"]}],
+                            "kwargs": [{"c": "MeritPart"}]}}],
+              "cleaners": [{"merit": "MeritFull"}, "policy_cleaner"]}
+
+    def setUp(self):
+        self.cache = test_support.TESTFN + "c"
+        self.write_config(self.config)
+
+    def tearDown(self):
+        test_support.unlink(test_support.TESTFN)
+        test_support.unlink(self.cache)
+
+    def write_config(self, config):
+        with open(test_support.TESTFN, "w") as config_handle:
+            json.dump(config, config_handle)
+        os.utime(test_support.TESTFN, (1000000000, 1000000000))
+
+    def testCompiled(self):
+        policy = taint._load_policy(test_support.TESTFN)
+        self.assertEqual(policy["sources"], [(("policy_source",), None)])
+        self.assertEqual(policy["sinks"], [
+            (("policy_sink",), ("MeritFull",), None, None),
+            (("policy_complex_sink",), None,
+             [[], [("MeritFull",), ("MeritPart",)]], {"c": [("MeritPart",)]})])
+        self.assertEqual(policy["cleaners"],
+                         [(("policy_cleaner",), ("MeritFull",))])
+        self.assertEqual(policy["propagators"], [])
+        self.assertEqual(policy["options"], [])
+
+        self.assertTrue(os.path.exists(self.cache))
+        taint.enable(test_support.TESTFN)
+        self.assertTainted(policy_source())
+        self.assertMerits(policy_cleaner("a".taint()), [MeritFull])
+        with self.assertRaises(TaintError):
+            policy_sink("a".taint())
+        with self.assertRaises(TaintError):
+            policy_complex_sink("a", "b"._cleanfor(MeritFull))
+        self.assertTrue(policy_complex_sink("a".taint(), "b", c="c"))
+
+    def testCacheUsed(self):
+        policy = taint._load_policy(test_support.TESTFN)
+        # the cache is used as long as the config is the same
+        with open(self.cache, "rb") as cache_handle:
+            key, cached = marshal.load(cache_handle)
+        cached["sources"] = []
+        with open(self.cache, "wb") as cache_handle:
+            marshal.dump((key, cached), cache_handle)
+        self.assertEqual(taint._load_policy(test_support.TESTFN), cached)
+
+        # it's compiled again when the contents change (even when the
+        # modification time doesn't) or when the modification time changes
+        self.write_config(dict(self.config, sources=["other_source"]))
+        self.assertEqual(taint._load_policy(test_support.TESTFN)["sources"],
+                         [(("other_source",), None)])
+        self.write_config(self.config)
+        os.utime(test_support.TESTFN, None)
+        self.assertEqual(taint._load_policy(test_support.TESTFN), policy)
+
+        # broken caches are replaced
+        with open(self.cache, "wb") as cache_handle:
+            cache_handle.write("broken")
+        self.assertEqual(taint._load_policy(test_support.TESTFN), policy)
+        with open(self.cache, "rb") as cache_handle:
+            self.assertEqual(marshal.load(cache_handle)[1], policy)
+
+    def testBrokenConfig(self):
+        self.write_config({"sinks": ["policy_sink"]})
+        self.assertRaises(ValueError, taint.enable, test_support.TESTFN)
+        self.assertFalse(os.path.exists(self.cache))
+
+
+def policy_source():
+    return "a"
+
+def policy_sink(s):
+    return True
+
+def policy_complex_sink(a, b, c=None):
+    return True
+
+def policy_cleaner(s):
+    return s
+
+
 class PropagationContextsTest(AbstractTaintTest):
     def testContexts(self):
         ut = 'ttt'
@@ -248,6 +532,297 @@ class PropagationContextsTest(AbstractTaintTest):
             self.assertMerits(tn + tn, [MeritNone])
             self.assertMerits(ut + tn, [])
 
+    def testContextsKeepMerits(self):
+        tn = 'ttt'._cleanfor(MeritNone)
+        with taint.unsafePropagationFull(MeritNone):
+            self.assertIs(MeritNone.propagation, Merit.NonePropagation)
+            self.assertMerits('u' + tn, [MeritNone])
+        self.assertIs(MeritNone.propagation, Merit.NonePropagation)
+        self.assertMerits('u' + tn, [])
+
+    def testContextsExceptionSafe(self):
+        tn = 'ttt'._cleanfor(MeritNone)
+        with self.assertRaises(KeyError):
+            with taint.unsafePropagationFull(MeritNone):
+                raise KeyError
+        self.assertMerits('u' + tn, [])
+        self.assertRaises(RuntimeError, _taint.pop_propagation)
+
+    def testContextsNested(self):
+        tn = 'ttt'._cleanfor(MeritNone)
+        tf = 'ttt'._cleanfor(MeritFull)
+        with taint.unsafePropagationFull(MeritNone):
+            with taint.unsafePropagationNone(MeritFull):
+                self.assertMerits('u' + tn, [MeritNone])
+                self.assertMerits('u' + tf, [])
+                with taint.unsafePropagationPartial(MeritNone):
+                    self.assertMerits('u' + tn, [])
+                    self.assertMerits(tn + tn, [MeritNone])
+                self.assertMerits('u' + tn, [MeritNone])
+            self.assertMerits('u' + tf, [MeritFull])
+        self.assertMerits('u' + tn, [])
+
+    def testContextsSubclasses(self):
+        class Inheriting(MeritNone):
+            pass
+        class Own(MeritNone):
+            propagation = Merit.NonePropagation
+        ti = 'ttt'._cleanfor(Inheriting)
+        to = 'ttt'._cleanfor(Own)
+        with taint.unsafePropagationFull(MeritNone):
+            self.assertMerits('u' + ti, [Inheriting])
+            self.assertMerits('u' + to, [])
+
+    def testContextsThreadLocal(self):
+        tn = 'ttt'._cleanfor(MeritNone)
+        results = []
+        entered = threading.Event()
+        done = threading.Event()
+        def other():
+            entered.wait()
+            results.append(('u' + tn)._merits())
+            done.set()
+        thread = threading.Thread(target=other)
+        thread.start()
+        with taint.unsafePropagationFull(MeritNone):
+            entered.set()
+            done.wait()
+            self.assertMerits('u' + tn, [MeritNone])
+        thread.join()
+        self.assertEqual(results, [set()])
+
+    def testContextsInvalid(self):
+        with self.assertRaises(TypeError):
+            with taint.unsafePropagationFull(str):
+                pass
+        self.assertRaises(TypeError, _taint.push_propagation, MeritNone, None)
+
+
+class EnableSwitchTest(AbstractTaintTest):
+    def setUp(self):
+        taint.set_enabled(False)
+
+    def tearDown(self):
+        taint.set_enabled(True)
+
+    def testDisabled(self):
+        self.assertFalse(taint.is_enabled())
+        self.assertClean('abc'.taint())
+        self.assertClean(u'abc'.taint())
+        self.assertClean('abc'._cleanfor(MeritFull))
+        self.assertClean(u'abc'._cleanfor(MeritFull))
+        self.assertClean(taint.source(lambda: 'abc')())
+        self.assertCleanAll(taint.source(lambda: ['a', u'b'])())
+
+    def testNoPropagation(self):
+        taint.set_enabled(True)
+        t = 'abc'._cleanfor(MeritFull)
+        u = u'abc'._cleanfor(MeritFull)
+        taint.set_enabled(False)
+        self.assertMerits(t, [MeritFull])
+        self.assertMerits(u, [MeritFull])
+        self.assertClean(t + 'x')
+        self.assertClean(u + u'x')
+        self.assertClean(t.upper())
+        self.assertClean(u.upper())
+        self.assertClean('-'.join([t, t]))
+        self.assertClean(u'-'.join([u, u]))
+        self.assertClean('%s!' % t)
+        self.assertCleanAll(t.split('b'))
+        self.assertCleanAll(u.split(u'b'))
+
+    def testNoPropagationCopy(self):
+        taint.set_enabled(True)
+        t = 'abc'._cleanfor(MeritFull)
+        u = u'abc'._cleanfor(MeritFull)
+        taint.set_enabled(False)
+        self.assertClean(t * 2)
+        self.assertClean(u * 2)
+        self.assertClean(t.lower())
+        self.assertClean(u.lower())
+        self.assertClean(t.center(20))
+        self.assertClean(u.center(20))
+        self.assertClean(t.zfill(20))
+        self.assertClean(u.zfill(20))
+
+    def testNoPropagationPartition(self):
+        taint.set_enabled(True)
+        t = 'abc'._cleanfor(MeritFull)
+        u = u'abc'._cleanfor(MeritFull)
+        taint.set_enabled(False)
+        self.assertCleanAll(t.partition('b'))
+        self.assertCleanAll(t.rpartition('b'))
+        self.assertCleanAll(u.partition(u'b'))
+        self.assertCleanAll(u.rpartition(u'b'))
+        head, sep, tail = u'xabcx'.partition(u)
+        self.assertCleanAll([head, tail])
+        head, sep, tail = u'xabcx'.rpartition(u)
+        self.assertCleanAll([head, tail])
+
+    def testReenable(self):
+        taint.set_enabled(True)
+        self.assertTrue(taint.is_enabled())
+        t = 'abc'._cleanfor(MeritFull)
+        self.assertMerits(t + 'x', [MeritFull])
+        self.assertTainted(taint.source(lambda: 'abc')())
+
+    def testStartupOptions(self):
+        code = 'import sys, taint; print sys.flags.no_taint, taint.is_enabled()'
+        rc, out, err = assert_python_ok('-c', code)
+        self.assertEqual(out.strip(), '0 True')
+        rc, out, err = assert_python_ok('-X', 'notaint', '-c', code)
+        self.assertEqual(out.strip(), '1 False')
+        rc, out, err = assert_python_ok('-c', code, PYTHONNOTAINT='1')
+        self.assertEqual(out.strip(), '1 False')
+        rc, out, err = assert_python_failure('-X', 'spam', '-c', code)
+        self.assertIn('Unknown -X option', err)
+
+
+class SamplingTest(AbstractTaintTest):
+    def setUp(self):
+        taint.reset_sink_stats()
+
+    def tearDown(self):
+        taint.reset_sink_stats()
+
+    def key_with_point(self, below=None, above=None):
+        for i in itertools.count():
+            with taint.sampling_key(i):
+                point = taint._sampling_point()
+            if ((below is None or point < below) and
+                (above is None or point >= above)):
+                return i
+
+    def testRates(self):
+        never = taint.source(lambda: 'abc', rate=0)
+        always = taint.source(lambda: 'abc', rate=1)
+        for i in range(20):
+            with taint.sampling_key(i):
+                self.assertClean(never())
+                self.assertTainted(always())
+                self.assertTainted(taint.source(lambda: 'abc')())
+        self.assertRaises(ValueError, taint.source, lambda: 'abc', rate=2)
+        self.assertRaises(ValueError, taint.source, 'abc', rate=-0.5)
+
+    def testDeterministic(self):
+        src = taint.source(lambda: ['abc', u'def'], rate=0.5)
+        value = taint.source('abc', rate=0.5)
+        with taint.sampling_key(self.key_with_point(below=0.5)):
+            for i in range(10):
+                self.assertTaintedAll(src())
+        with taint.sampling_key(self.key_with_point(above=0.5)):
+            for i in range(10):
+                self.assertCleanAll(src())
+            self.assertClean(taint.source('abc', rate=0.5))
+        key = self.key_with_point(above=0.1, below=0.2)
+        with taint.sampling_key(key):
+            self.assertClean(taint.source('abc', rate=0.1))
+            self.assertTainted(taint.source('abc', rate=0.2))
+        taint.set_sampling_key(key)
+        try:
+            self.assertClean(taint.source('abc', rate=0.1))
+            self.assertTainted(taint.source('abc', rate=0.2))
+        finally:
+            taint.set_sampling_key(None)
+
+    def testFraction(self):
+        src = taint.source(lambda: 'abc', rate=0.1)
+        tainted = 0
+        for i in range(2000):
+            with taint.sampling_key('request-%d' % i):
+                tainted += src().istainted()
+        self.assertTrue(100 < tainted < 300, tainted)
+
+    def testThreadKey(self):
+        src = taint.source(lambda: 'abc', rate=0.5)
+        results = []
+        def other():
+            results.append(taint._sampling_point())
+            results.append([src().istainted() for i in range(5)])
+        thread = threading.Thread(target=other)
+        thread.start()
+        thread.join()
+        point, tainted = results
+        self.assertEqual(tainted, [point < 0.5] * 5)
+
+    def testSinkStats(self):
+        src = taint.source(lambda: 'abc', rate=0.5)
+        snk = taint.sink(MeritFull)(lambda *args, **kwargs: True)
+        with taint.sampling_key(self.key_with_point(below=0.5)):
+            s = src()
+            self.assertRaises(TaintError, snk, s)
+            self.assertTrue(snk(s._cleanfor(MeritFull), x='abc'))
+        with taint.sampling_key(self.key_with_point(above=0.5)):
+            self.assertTrue(snk(src()))
+        stats = taint.sink_stats()
+        self.assertEqual(stats[MeritFull],
+                         {"checks": 4, "sampled": 3, "violations": 1})
+        taint.reset_sink_stats()
+        self.assertEqual(taint.sink_stats(), {})
+
+    def testComplexSinkStats(self):
+        src = taint.source(lambda: 'abc', rate=0.5)
+        snk = taint._complex_sink([[MeritFull, MeritPart]],
+                                  {"x": [MeritFull]})(
+            lambda *args, **kwargs: True)
+        with taint.sampling_key(self.key_with_point(below=0.5)):
+            s = src()
+            self.assertRaises(TaintError, snk, s)
+            self.assertTrue(snk('abc', x=s._cleanfor(MeritFull)))
+        with taint.sampling_key(self.key_with_point(above=0.5)):
+            self.assertTrue(snk(src(), y=src()))
+        stats = taint.sink_stats()
+        self.assertEqual(stats[MeritFull],
+                         {"checks": 4, "sampled": 3, "violations": 1})
+        self.assertEqual(stats[MeritPart],
+                         {"checks": 3, "sampled": 2, "violations": 0})
+        taint.reset_sink_stats()
+        self.assertEqual(taint.sink_stats(), {})
+
+    def testSinkStatsKept(self):
+        # counters of sinks which are gone still count
+        snk = taint.sink(MeritFull)(lambda *args: True)
+        csnk = taint._complex_sink([[MeritPart]], {})(lambda *args: True)
+        self.assertRaises(TaintError, snk, 'abc'.taint(), 'def')
+        self.assertTrue(csnk('abc'))
+        del snk, csnk
+        test_support.gc_collect()
+        stats = taint.sink_stats()
+        self.assertEqual(stats[MeritFull],
+                         {"checks": 2, "sampled": 0, "violations": 1})
+        self.assertEqual(stats[MeritPart],
+                         {"checks": 1, "sampled": 0, "violations": 0})
+        snk = taint.sink(MeritFull)(lambda *args: True)
+        self.assertTrue(snk('abc'))
+        self.assertEqual(taint.sink_stats()[MeritFull]["checks"], 3)
+        taint.reset_sink_stats()
+        self.assertEqual(taint.sink_stats(), {})
+
+    def testConfig(self):
+        config = {"sources": [{"rate": 0}, "sampled_never_source",
+                              {"rate": 1}, "sampled_always_source"]}
+        with open(test_support.TESTFN, "w") as config_handle:
+            json.dump(config, config_handle)
+        try:
+            taint.enable(test_support.TESTFN)
+        finally:
+            test_support.unlink(test_support.TESTFN)
+            test_support.unlink(test_support.TESTFN + "c")
+        self.assertClean(sampled_never_source())
+        self.assertTainted(sampled_always_source())
+
+    def testValidator(self):
+        extra = {"rate": 0.1, "foo": 1}
+        config = {"sources": [{"rate": 0.5}, "f", {"rate": 2}, {"rate": "x"},
+                              extra, 5]}
+        warnings, errors = taint.Validator(config).validate()
+        self.assertEqual(warnings, [])
+        self.assertEqual(errors, [
+            "Malformed sampling rate 2 in sources.",
+            "Malformed sampling rate x in sources.",
+            "Malformed sampling rate description {}".format(extra),
+            "Unexpected object in sources: 5."])
+
 
 class ConfigValidation(unittest.TestCase):
     def setUp(self):
@@ -475,6 +1050,386 @@ class PropagatorTest(AbstractTaintTest):
         self.assertMeritsAll(taint._taint_object(d, [MeritFull]).values(),
                              [MeritFull])
 
+    def test_proxy(self):
+        class Obj(object):
+            def __unicode__(self):
+                return u"\xe9"
+
+        merits = [MeritFull, MeritPart]
+        d = deque(["a", "b"])
+        p = taint.Propagator(d, merits)
+        self.assertIsInstance(p, taint.Taintable)
+        self.assertEqual(_taint.get_taint(p), set(merits))
+        self.assertEqual((str(p), repr(p)), (str(d), repr(d)))
+        self.assertEqual(len(p), 2)
+        self.assertTrue(p)
+        self.assertIn("a", p)
+        self.assertEqual(p, deque(["a", "b"]))
+        self.assertIs(weakref.ref(p)(), p)
+
+        # attributes keep the taint of the proxy, results of calls and
+        # operators get the taint propagated from it and the arguments
+        self.assertIsNone(p.maxlen)
+        self.assertMerits(p[0], [MeritFull])
+        self.assertMeritsAll(p, [MeritFull])
+        self.assertMeritsAll(reversed(p), [MeritFull])
+        p.append("c".taint())
+        self.assertTainted(d[2])
+        p[2] = "c"
+        p.rotate(1)
+        self.assertEqual(list(d), ["c", "a", "b"])
+        del p[0]
+        self.assertMerits(p.pop(), [MeritFull])
+        q = p.__copy__()
+        self.assertEqual(_taint.get_taint(q), set([MeritFull]))
+        self.assertEqual(q, deque(["a"]))
+
+        obj = Obj()
+        p = taint.Propagator(obj, merits)
+        p.attr = "x"
+        self.assertEqual(obj.attr, "x")
+        self.assertMerits(p.attr, merits)
+        del p.attr
+        self.assertFalse(hasattr(p, "attr"))
+        self.assertEqual(unicode(p), u"\xe9")
+
+        half = Fraction(1, 2)
+        p = taint.Propagator(half, [MeritPart])
+        self.assertEqual(hash(p), hash(half))
+        self.assertEqual(_taint.get_taint(p + 1), set())
+        self.assertEqual(_taint.get_taint(1 - p), set())
+        self.assertEqual(_taint.get_taint(p * p), set([MeritPart]))
+        self.assertEqual(p ** 2, Fraction(1, 4))
+
+        # the modulus of three argument pow() is an operand too
+        class Power(object):
+            def __pow__(self, exp, mod=None):
+                return self
+        base = taint.Propagator(Power(), None)
+        self.assertIsNone(_taint.get_taint(pow(base, 2, 7)))
+        self.assertEqual(_taint.get_taint(pow(base, 2, "m".taint())), set())
+        self.assertEqual(
+            _taint.get_taint(pow(base, 2, taint.Propagator(7, [MeritFull]))),
+            set([MeritFull]))
+        self.assertTrue(p < 1)
+        self.assertEqual(taint.Propagator(3, None) + 4, 7)
+        self.assertIs(type(taint.Propagator(3, None) + 4), int)
+
+        f = taint.Propagator(lambda *args, **kwargs: args + (kwargs,),
+                             [MeritFull])
+        self.assertMeritsAll(f("a", "b")[:2], [MeritFull])
+        self.assertMeritsAll(f("a".taint())[:1], [])
+        self.assertMerits(f(x="a".taint())[0]["x"], [])
+
+        class Cls(object):
+            method = taint.Propagator(lambda self: self.value, merits)
+            value = "v"
+        self.assertMerits(Cls().method(), [MeritFull])
+        self.assertRaises(TypeError, taint.Propagator)
+        self.assertRaises(TypeError, taint.Propagator, d, [1])
+
+    def test_proxy_class_cache(self):
+        class New(object): pass
+        class Old: pass
+
+        for cls in (New, Old):
+            proxy = taint._proxy_class(cls)
+            self.assertIs(taint._proxy_class(cls), proxy)
+            self.assertIs(type(proxy()), proxy)
+            self.assertEqual(proxy.__name__, cls.__name__)
+            self.assertEqual(repr(proxy), repr(cls) + " (tainted)")
+        self.assertIsNot(taint._proxy_class(New), taint._proxy_class(Old))
+
+        # the cache keeps neither of them alive
+        ref = weakref.ref(New)
+        del New, cls, proxy
+        test_support.gc_collect()
+        self.assertIsNone(ref())
+
+class NativeHelpersTest(AbstractTaintTest):
+    def test_get_taint(self):
+        self.assertIsNone(_taint.get_taint("abc"))
+        self.assertIsNone(_taint.get_taint(u"abc"))
+        self.assertIsNone(_taint.get_taint(42))
+        self.assertEqual(_taint.get_taint("abc".taint()), set())
+        self.assertEqual(_taint.get_taint(u"abc"._cleanfor(MeritFull)),
+                         set([MeritFull]))
+        p = taint._taint_object(object(), [MeritPart, MeritNone])
+        self.assertEqual(_taint.get_taint(p), set([MeritPart, MeritNone]))
+        self.assertIsNone(_taint.get_taint(taint._taint_object(object(),
+                                                               None)))
+
+    def test_propagate(self):
+        all_merits = [MeritFull, MeritPart, MeritNone]
+        self.assertIsNone(_taint.propagate(None, None))
+        self.assertEqual(_taint.propagate(all_merits, None), set([MeritFull]))
+        self.assertEqual(_taint.propagate(None, all_merits), set([MeritFull]))
+        self.assertEqual(_taint.propagate(all_merits, all_merits),
+                         set([MeritFull, MeritPart]))
+        self.assertEqual(_taint.propagate((MeritFull, MeritPart), [MeritPart]),
+                         set([MeritPart]))
+        self.assertEqual(_taint.propagate(set(), all_merits), set())
+        self.assertRaises(TypeError, _taint.propagate, [str], None)
+        self.assertRaises(TypeError, _taint.propagate, None, 1)
+
+    def test_collect_taint(self):
+        t_full = "abc"._cleanfor(MeritFull)._cleanfor(MeritPart)
+        t_part = u"abc"._cleanfor(MeritPart)
+        p = taint._taint_object(object(), [MeritFull, MeritPart])
+        self.assertIsNone(_taint.collect_taint([]))
+        self.assertIsNone(_taint.collect_taint(["a", u"b", 1]))
+        self.assertEqual(_taint.collect_taint([t_part]), set([MeritPart]))
+        self.assertEqual(_taint.collect_taint((t_full, t_part)),
+                         set([MeritPart]))
+        self.assertEqual(_taint.collect_taint([t_full, 1, p]),
+                         set([MeritFull]))
+        self.assertEqual(_taint.collect_taint([p], {"a": t_part}),
+                         set([MeritPart]))
+        self.assertEqual(_taint.collect_taint((), {"a": t_full, "b": "x"}),
+                         set([MeritFull]))
+        self.assertRaises(TypeError, _taint.collect_taint, 1)
+        self.assertRaises(TypeError, _taint.collect_taint, [], [])
+
+    def test_taint_object(self):
+        wrapped = []
+        def wrapper(obj, taint):
+            wrapped.append((obj, taint))
+            return obj
+
+        merits = [MeritFull, MeritPart]
+        obj = {1: ["a", (u"b", 2)], 2: set(["c"]), 3: frozenset([u"d"])}
+        res = _taint.taint_object(obj, merits, wrapper)
+        self.assertMeritsAll([res[1][0], res[1][1][0]], merits)
+        self.assertMeritsAll(res[2], merits)
+        self.assertMeritsAll(res[3], merits)
+        self.assertEqual(res, obj)
+        self.assertEqual([type(res[k]) for k in (1, 2, 3)],
+                         [list, set, frozenset])
+        self.assertEqual(wrapped, [(2, merits)])
+        self.assertClean(obj[1][0])
+
+        del wrapped[:]
+        res = _taint.taint_object(["a", 1], None, wrapper)
+        self.assertClean(res[0])
+        self.assertEqual(wrapped, [(1, None)])
+
+        s = "abc".withmerits(merits)
+        self.assertIs(_taint.taint_object(s, merits, wrapper), s)
+        self.assertMerits(_taint.taint_object(s, (), wrapper), [])
+        # merits are only checked when a string has to be tainted
+        self.assertEqual(_taint.taint_object(1, [1], wrapper), 1)
+        self.assertRaises(TypeError, _taint.taint_object, ["a"], [1], wrapper)
+
+        # without a wrapper, objects are put in proxies
+        res = _taint.taint_object([1, None, 2.5, True, 3L, object()], merits)
+        self.assertEqual(res[:5], [1, None, 2.5, True, 3L])
+        self.assertIs(type(res[5]), taint.Propagator)
+        self.assertEqual(_taint.get_taint(res[5]), set(merits))
+        self.assertIs(type(_taint.taint_object(object(), None, None)),
+                      taint.Propagator)
+
+        # in lazy mode, lists, tuples and dicts are given as views, and sets
+        # are tainted right away
+        res = _taint.taint_object(obj, merits, None, True)
+        self.assertIs(type(res), taint.TaintedDict)
+        self.assertIs(type(res[1]), taint.TaintedList)
+        self.assertIs(type(res[1][1]), taint.TaintedTuple)
+        self.assertIs(type(res[2]), set)
+        self.assertMeritsAll(res[2], merits)
+        self.assertMerits(res[1][1][0], merits)
+        self.assertClean(_taint.taint_object(res[1], None, None, True)[0])
+        self.assertIs(type(_taint.taint_object(s, merits, None, True)), str)
+
+        # iterators taint their items as they come out
+        res = _taint.taint_object(iter(["a", ("b",)]), merits)
+        self.assertIs(type(res), taint.TaintedIterator)
+        self.assertMerits(next(res), merits)
+        self.assertIs(type(next(res)), tuple)
+        res = _taint.taint_object(iter([["a"]]), merits, None, True)
+        self.assertIs(type(next(res)), taint.TaintedList)
+        res = _taint.taint_object(res, None)
+        self.assertEqual(list(res), [])
+        self.assertClean(next(_taint.taint_object(iter(["a"]), None)))
+
+    def test_wrappers(self):
+        def func(value, suffix=""):
+            "Docstring."
+            return value + suffix
+        func.attr = 1
+
+        for w in (_taint.SourceWrapper(func),
+                  _taint.CleanerWrapper(func, MeritFull),
+                  _taint.PropagatorWrapper(func)):
+            self.assertEqual(w.__name__, "func")
+            self.assertEqual(w.__doc__, "Docstring.")
+            self.assertEqual(w.__module__, __name__)
+            self.assertIs(w.__wrapped__, func)
+            self.assertEqual(w.attr, 1)
+            self.assertIn("of <function func", repr(w))
+            self.assertEqual(w("a", suffix="b"), "ab")
+            self.assertIs(weakref.ref(w)(), w)
+
+        sampling = threading.local()
+        src = _taint.SourceWrapper(func, None, sampling)
+        self.assertMerits(src("a", "b"), [])
+        self.assertTrue(sampling.sampled)
+        self.assertMerits(src(["a"], [])[0], [])
+        self.assertIs(type(src(["a"], [])), list)
+        src = _taint.SourceWrapper(func, lazy=True)
+        self.assertIs(type(src(["a"], [])), taint.TaintedList)
+        sample = []
+        src = _taint.SourceWrapper(func, lambda: sample)
+        self.assertClean(src("a", "b"))
+        sample.append(1)
+        self.assertMerits(src("a", "b"), [])
+
+        cln = _taint.CleanerWrapper(func, MeritFull)
+        self.assertMerits(cln("a"), [MeritFull])
+        self.assertMerits(cln(u"a".taint(), u"b"), [MeritFull])
+        self.assertMerits(cln("a"._cleanfor(MeritPart)),
+                          [MeritFull, MeritPart])
+        self.assertClean("a")
+        self.assertRaises(TypeError, _taint.CleanerWrapper(func, 1), "a")
+        self.assertRaises(AttributeError, cln, 1, 2)
+
+        prop = _taint.PropagatorWrapper(func)
+        self.assertClean(prop("a", "b"))
+        self.assertMerits(prop("a"._cleanfor(MeritFull),
+                               suffix="b"._cleanfor(MeritFull)), [MeritFull])
+        prop = _taint.PropagatorWrapper(func, True, False)
+        self.assertMerits(prop("a", "b"), [])
+        self.assertIs(type(prop(["a"], [])), list)
+        self.assertIs(type(_taint.PropagatorWrapper(func)(["a"], [])), list)
+        prop = _taint.PropagatorWrapper(func, lazy=True)
+        self.assertIs(type(prop(["a"], [])), taint.TaintedList)
+
+        # wrappers are bound like functions
+        class A(object):
+            def get(self, value):
+                return value * 2
+            get = _taint.CleanerWrapper(get, MeritFull)
+        self.assertMerits(A().get("a"), [MeritFull])
+        self.assertMerits(A.get(A(), "a"), [MeritFull])
+        self.assertRaises(TypeError, A.get, "a")
+
+        self.assertRaises(TypeError, _taint.SourceWrapper, 1)
+
+    def test_check(self):
+        class Dict(dict): pass
+        class List(list): pass
+
+        ok = "a"._cleanfor(MeritFull)._cleanfor(MeritPart)
+        bad = u"b"._cleanfor(MeritFull)
+        merits = [MeritFull, MeritPart]
+        self.assertEqual(_taint.check("a", merits), (1, None))
+        self.assertEqual(_taint.check(ok, merits), (1, None))
+        self.assertEqual(_taint.check(bad, merits), (1, ((), bad, MeritPart)))
+        self.assertEqual(_taint.check(None, merits), (0, None))
+        self.assertEqual(_taint.check(bad, []), (1, None))
+
+        obj = {"x": ["a", ok, (None, set([ok]))], "y": frozenset([u"a"])}
+        self.assertEqual(_taint.check(obj, merits), (4, None))
+        obj["x"][2] = (None, set([ok]), {"z": bad})
+        self.assertEqual(_taint.check(obj, merits)[1],
+                         (("x", 2, 2, "z"), bad, MeritPart))
+        self.assertEqual(_taint.check(obj, [MeritPart, MeritNone])[1],
+                         (("x", 1), ok, MeritNone))
+        self.assertEqual(_taint.check(Dict(a=List(["a", bad])), merits),
+                         (2, (("a", 1), bad, MeritPart)))
+
+        # containers deeper than depth aren't entered
+        self.assertEqual(_taint.check([ok, [bad]], merits, 1), (1, None))
+        self.assertEqual(_taint.check([ok, [bad]], merits, 2)[1],
+                         ((1, 0), bad, MeritPart))
+        self.assertEqual(_taint.check([bad], merits, 0), (0, None))
+
+        loop = []
+        loop.append(loop)
+        self.assertRaises(RuntimeError, _taint.check, loop, merits)
+        self.assertRaises(TypeError, _taint.check, ok, [1])
+        self.assertRaises(TypeError, _taint.check, ok, 1)
+        self.assertRaises(ValueError, _taint.check, ok, merits, -1)
+
+    def test_complex_sink_message(self):
+        snk = taint._complex_sink([[MeritFull]], {"q": [MeritPart]})(
+            lambda *args, **kwargs: True)
+        self.assertTrue(snk(["a"._cleanfor(MeritFull)],
+                            q={"a": "b"._cleanfor(MeritPart)}))
+        with self.assertRaises(TaintError) as cm:
+            snk(["a"._cleanfor(MeritFull)], q={"a": ["b".taint()]})
+        self.assertEqual(str(cm.exception),
+                         "Object \"b\" (at ['a'][0]) has no merit {}."
+                         .format(MeritPart))
+        with self.assertRaises(TaintError) as cm:
+            snk("a".taint())
+        self.assertEqual(str(cm.exception),
+                         "Object \"a\" has no merit {}.".format(MeritFull))
+
+    def test_sink_plan(self):
+        ok = "a"._cleanfor(MeritFull)
+        bad = "b".taint()
+        plan = _taint.SinkPlan([[MeritFull], [], [MeritFull]],
+                               {"x": [MeritFull], "y": []})
+        self.assertFalse(plan.empty)
+        self.assertIsNone(plan.check((ok, bad), {}, False))
+        self.assertIsNone(plan.check((ok, bad, ok), {"x": ok}, False))
+        self.assertEqual(plan.check((ok, bad, [bad]), {}, False),
+                         ((0,), bad, MeritFull))
+        self.assertEqual(plan.check((), {"x": {"a": bad}}, False),
+                         (("a",), bad, MeritFull))
+        # arguments not listed in the spec aren't checked
+        self.assertIsNone(plan.check((ok, ok, ok, bad), {"y": bad, "z": bad},
+                                     False))
+        self.assertRaises(TypeError, plan.check, [ok], {}, False)
+        self.assertRaises(TypeError, _taint.SinkPlan, [[1]], {})
+        self.assertRaises(TypeError, _taint.SinkPlan, [], [])
+
+        self.assertTrue(_taint.SinkPlan([[], []], {"x": []}).empty)
+        func = lambda: True
+        self.assertIs(taint._complex_sink([[]], {"x": ()})(func), func)
+
+        snk = taint._complex_sink([[MeritFull]], {"x": [MeritFull]})(
+            lambda *args, **kwargs: True)
+        self.assertTrue(snk(ok, bad, y=bad))
+        self.assertRaises(TaintError, snk, ok, x=bad)
+
+        # checked positional arguments are checked when passed by keyword
+        plan = _taint.SinkPlan([[MeritFull], [], [MeritFull]],
+                               {"c": [MeritPart]}, None, ["a", "b", "c"])
+        self.assertEqual(plan.check((), {"a": bad}, False),
+                         ((), bad, MeritFull))
+        self.assertIsNone(plan.check((), {"b": bad}, False))
+        # the keyword's own checks take precedence
+        self.assertIsNone(plan.check((), {"c": ok._cleanfor(MeritPart)},
+                                     False))
+        self.assertRaises(TypeError, _taint.SinkPlan, [], {}, None, 1)
+
+        def run(cmd, flag=None):
+            return True
+        snk = taint._complex_sink([[MeritFull]], {"flag": [MeritFull]})(run)
+        self.assertRaises(TaintError, snk, bad)
+        self.assertRaises(TaintError, snk, cmd=bad)
+        self.assertRaises(TaintError, snk, ok, flag=bad)
+        self.assertTrue(snk(cmd=ok, flag=ok))
+        # names are found through other wrappers, and not for builtins
+        snk = taint._complex_sink([[MeritFull]], {})(taint.propagator(run))
+        self.assertRaises(TaintError, snk, cmd=bad)
+        self.assertEqual(taint._argnames(len), [])
+
+        # merits for all the arguments are checked on strings passed
+        # directly, and all of them are counted
+        plan = _taint.SinkPlan([], {}, [MeritFull])
+        self.assertFalse(plan.empty)
+        self.assertIsNone(plan.check((ok, [bad], 1), {"x": ok}, True))
+        self.assertEqual(plan.check((ok, bad), {"x": bad, "y": ok}, False),
+                         ((), bad, MeritFull))
+        self.assertEqual(plan.stats(), {MeritFull: (6, 2, 2)})
+        plan = _taint.SinkPlan([[MeritPart]], {}, [MeritFull])
+        self.assertEqual(plan.check((ok,), {}, False),
+                         ((), ok, MeritPart))
+        self.assertTrue(_taint.SinkPlan([], {}, []).empty)
+
+
 class OptionsTest(AbstractTaintTest):
     def setUp(self):
         taint.enable(CONFIG_4)
@@ -974,9 +1929,22 @@ def toplevel_sink(s):
 def toplevel_propagator(s):
     return "abc"
 
+def sampled_never_source():
+    return "abc"
+
+def sampled_always_source():
+    return "abc"
+
 def test_main():
-    taint.enable(CONFIG_1)
-    test_support.run_unittest(DecoratorTest, SimplePatcherTest,
-                              ImportedObjectsPatchingTest, ConfigValidation,
-                              PropagationContextsTest, PropagatorTest,
-                              OptionsTest)
+    try:
+        taint.enable(CONFIG_1)
+        test_support.run_unittest(DecoratorTest, SimplePatcherTest,
+                                  ImportedObjectsPatchingTest,
+                                  ConfigValidation, PolicyCacheTest,
+                                  PropagationContextsTest, EnableSwitchTest,
+                                  SamplingTest, PropagatorTest,
+                                  NativeHelpersTest, OptionsTest)
+    finally:
+        # compiled policies are cached next to the configs
+        for config in (CONFIG_1, CONFIG_2, CONFIG_3, CONFIG_4):
+            test_support.unlink(config + "c")
@@ -1,5 +1,6 @@
 import unittest, string
 import sys
+import _taint
 from test import test_support, string_tests
 
 
@@ -63,6 +64,105 @@ class TaintTest(AbstractTaintTest):
         self.assertTainted(u'\u0230x'.taint())
         self.assertClean(u'\u0230x')
 
+    def test_shared_chars(self):
+        t = u'a\u0230c'.taint()
+        f = u'a\u0230c'._cleanfor(MeritFull)
+        self.assertIs(t[0], t[0])
+        self.assertIs(t[1], t[1:2])
+        self.assertIs(t[1], u'x\u0230x'.taint()[1])
+        self.assertIs(t[1:1], f[:0].taint())
+        self.assertIsNot(t[0], u'a')
+        self.assertIsNot(t[1], f[1])
+        self.assertMerits(t[1], [])
+        self.assertMerits(f[1], [MeritFull])
+        self.assertMerits(f[2:2], [MeritFull])
+        self.assertClean(u'a')
+
+        # shared objects are never modified in place
+        c = t[1]
+        self.assertMerits(c._cleanfor(MeritFull), [MeritFull])
+        self.assertMerits(c.center(3, f[0]), [])
+        self.assertMerits(c.zfill(2), [])
+        self.assertMerits(f[1].center(1), [MeritFull])
+        self.assertMerits(c, [])
+        c += f[0]
+        self.assertMerits(t[1], [])
+        self.assertIsNot(c, t[1])
+
+        _taint.tainted_chars_clear()
+        self.assertMerits(t[1], [])
+        self.assertIs(t[1], t[1])
+
+    def test_canonical_merits(self):
+        # equal merit sets share one taint object however they were built;
+        # withmerits() returns a string unchanged only if its taint object
+        # is the one for the given merits
+        def assertCanonical(s, merits):
+            self.assertEqual(s._merits(), set(merits))
+            self.assertIs(s.withmerits(merits), s)
+
+        s = u'\u0230 longer string'
+        assertCanonical(s.taint(), [])
+        assertCanonical(s._cleanfor(MeritFull).taint(), [])
+        assertCanonical(s._cleanfor(MeritFull).withmerits(()), [])
+        f = s._cleanfor(MeritFull)
+        fp = f._cleanfor(MeritPartial)
+        for t in (f, s.taint()._cleanfor(MeritFull), fp + f, f + fp[:1],
+                  fp._propagate(f), f._cleanfor(MeritFull)):
+            assertCanonical(t, [MeritFull])
+        for t in (fp, s._cleanfor(MeritPartial)._cleanfor(MeritFull),
+                  f.withmerits((MeritPartial, MeritFull, MeritPartial)),
+                  fp + fp, fp._propagate(fp)):
+            assertCanonical(t, [MeritFull, MeritPartial])
+
+        # shared chars are looked up by the taint object, so they are
+        # shared between equal merit sets too
+        f2 = s.taint()._cleanfor(MeritFull)
+        self.assertIs(f[0], f2[0])
+        fp2 = (f2 + fp)._cleanfor(MeritPartial)
+        self.assertIs(fp[0], fp2[0])
+        self.assertIsNot(f[0], fp2[0])
+
+        # once the strings are gone, new ones share a new object
+        del f, f2, fp, fp2, t
+        _taint.tainted_chars_clear()
+        f = s._cleanfor(MeritFull)
+        assertCanonical(f, [MeritFull])
+        assertCanonical(s.taint()._cleanfor(MeritFull), [MeritFull])
+
+    def test_many_tainted(self):
+        strings = [(u'\u0230%d' % i)._cleanfor(MeritFull)
+                   for i in xrange(5000)]
+        strings += [(u'\u0230%d' % i)._cleanfor(MeritPartial)
+                    for i in xrange(5000)]
+        del strings[::2]
+        clean = [u'c%d' % i for i in xrange(5000)]
+        for s in strings[:2500]:
+            self.assertMerits(s, [MeritFull])
+        for s in strings[2500:]:
+            self.assertMerits(s, [MeritPartial])
+        for s in clean:
+            self.assertClean(s)
+        del strings
+        clean += [u'd%d' % i for i in xrange(5000)]
+        for s in clean:
+            self.assertClean(s)
+
+    def test_hash_kept(self):
+        s = u'\u0230key ' * 300
+        expected = hash(u''.join([u'\u0230key '] * 300))
+        self.assertEqual(hash(s), expected)
+        f = s._cleanfor(MeritFull)
+        copies = [s.taint(), f, f._cleanfor(MeritPartial), s._propagate(f),
+                  f.zfill(10), f.ljust(10), f.rjust(10), f.center(10),
+                  u''.join([f]), unicode(f)]
+        for c in copies:
+            self.assertEqual(c, s)
+            self.assertEqual(hash(c), expected)
+        d = dict.fromkeys(copies)
+        self.assertEqual(len(d), 1)
+        self.assertIn(s, d)
+
     def test_from_string(self):
         u = unicode('ttttt')
         t = unicode('ttttt'.taint())
@@ -85,6 +185,67 @@ class TaintTest(AbstractTaintTest):
         self.assertMerits(t_part, [MeritPartial])
         self.assertMerits(t_none, [MeritNone])
         self.assertMerits(t_all, [MeritFull, MeritPartial, MeritNone])
+    def test_withmerits(self):
+        s = u'a longer string that will be tainted'
+        self.assertMerits(s.withmerits([]), [])
+        self.assertMerits(s.withmerits([MeritFull]), [MeritFull])
+        t = s.withmerits((MeritFull, MeritPartial, MeritFull))
+        self.assertEqual(t, s)
+        self.assertMerits(t, [MeritFull, MeritPartial])
+        self.assertEqual(t, s.taint()._cleanfor(MeritFull)
+                              ._cleanfor(MeritPartial))
+        # merits of S are replaced, not extended
+        self.assertMerits(t.withmerits(iter([MeritNone])), [MeritNone])
+        self.assertMerits(t.withmerits(set()), [])
+        self.assertIs(t.withmerits([MeritPartial, MeritFull]), t)
+        self.assertMerits(u'x'.withmerits([MeritNone]), [MeritNone])
+        self.assertMerits(u''.withmerits([MeritNone]), [MeritNone])
+
+        many = [type('MeritWith%d' % i, (Merit,), {}) for i in range(600)]
+        self.assertMerits(s.withmerits(many), many)
+        self.assertMerits(t.withmerits(many[::-7]), many[::-7])
+
+        self.assertRaises(TypeError, s.withmerits, None)
+        self.assertRaises(TypeError, s.withmerits, [MeritFull, unicode])
+        self.assertRaises(TypeError, s.withmerits, [Merit.FullPropagation])
+        self.assertRaises(ZeroDivisionError, s.withmerits,
+                          (MeritFull if i else 1 / i for i in (1, 0)))
+
+    def test_taint_in_place(self):
+        ids = []
+        def fresh(n):
+            s = u'x' * n
+            ids.append(id(s))
+            return s
+
+        # only the bound method references the string, so it's not copied
+        t = fresh(100).taint()
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [])
+        t = fresh(100)._cleanfor(MeritFull)
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [MeritFull])
+        t = fresh(100).withmerits([MeritPartial, MeritNone])
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [MeritPartial, MeritNone])
+        t = fresh(100)._cleanfor(MeritFull)._cleanfor(MeritPartial)
+        self.assertEqual(id(t), ids.pop())
+        self.assertMerits(t, [MeritFull, MeritPartial])
+
+        s = fresh(100)
+        t = s._cleanfor(MeritFull)
+        self.assertNotEqual(id(t), id(s))
+        self.assertClean(s)
+        self.assertMerits(t, [MeritFull])
+        self.assertMerits(t.taint(), [])
+        self.assertMerits(t, [MeritFull])
+
+        # shared strings are always copied
+        self.assertMerits(fresh(1).taint(), [])
+        self.assertClean(u'x')
+        self.assertMerits(fresh(0).taint(), [])
+        self.assertClean(u'')
+
 
 class MeritsTest(AbstractTaintTest):
     def test_propagate(self):
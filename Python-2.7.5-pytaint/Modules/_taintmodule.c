@@ -0,0 +1,3045 @@
+/* Low level helpers for the taint module. */
+
+#include "Python.h"
+#include "structmember.h"
+
+/* Taint is represented in Python code (taint.py) either by None, for clean
+   objects, or by a collection of merits. The functions below convert it to
+   taint objects, so that propagation is done by taintobject.c. */
+
+/* Taint propagating proxy (taint.Propagator). It wraps an object which can't
+   carry taint itself and forwards attribute access and special methods to it,
+   tainting their results. Defined below. */
+typedef struct {
+    PyObject_HEAD
+    PyObject *px_obj;           /* the wrapped object */
+    PyTaintObject *px_taint;    /* its taint, NULL when clean */
+    PyObject *px_weakreflist;
+} ProxyObject;
+
+static PyTypeObject Proxy_Type;
+
+#define Proxy_Check(op) PyObject_TypeCheck(op, &Proxy_Type)
+
+/* Lazy views of lists, tuples and dicts (taint.TaintedList and others), which
+   taint items of the container when they are read. Defined below. */
+typedef struct {
+    PyObject_HEAD
+    PyObject *tv_obj;           /* the list, tuple or dict */
+    PyTaintObject *tv_taint;    /* taint given to its items, NULL when clean */
+    PyObject *tv_weakreflist;
+} TaintedViewObject;
+
+static PyTypeObject TaintedList_Type;
+static PyTypeObject TaintedTuple_Type;
+static PyTypeObject TaintedDict_Type;
+
+#define TaintedView_Check(op) (Py_TYPE(op) == &TaintedList_Type || \
+                               Py_TYPE(op) == &TaintedTuple_Type || \
+                               Py_TYPE(op) == &TaintedDict_Type)
+
+/* Iterators tainting items of other iterators (taint.TaintedIterator). */
+typedef struct {
+    PyObject_HEAD
+    PyObject *ti_iter;
+    PyTaintObject *ti_taint;    /* taint given to the items */
+    int ti_pairs;               /* items are (key, value) pairs, of which only
+                                   values are tainted */
+    int ti_lazy;                /* give views of lists, tuples and dicts */
+} TaintedIterObject;
+
+static PyTypeObject TaintedIterator_Type;
+
+/* Store the taint object with merits from collection merits (a new
+   reference), or NULL if merits is None, in *taint. Returns 0 on success, -1
+   on failure. */
+static int
+taint_from_merits(PyObject *merits, PyTaintObject **taint)
+{
+    if (merits == Py_None) {
+        *taint = NULL;
+        return 0;
+    }
+    *taint = _PyTaint_AddMerits(NULL, merits);
+    return *taint == NULL ? -1 : 0;
+}
+
+/* Return Python representation of taint - a set of its merits, or None when
+   taint is NULL. Steals the reference to taint. */
+static PyObject *
+merits_from_taint(PyTaintObject *taint)
+{
+    PyObject *merits;
+
+    if (taint == NULL)
+        Py_RETURN_NONE;
+    merits = _PyTaint_GetMerits(taint);
+    Py_DECREF(taint);
+    return merits;
+}
+
+/* Store taint of obj (a new reference) in *taint. It's NULL when obj is clean
+   or isn't taintable at all. Returns 0 on success, -1 on failure. */
+static int
+object_taint(PyObject *obj, PyTaintObject **taint)
+{
+    if (PyString_Check(obj)) {
+        *taint = PyString_GET_MERITS(obj);
+        Py_XINCREF(*taint);
+        return 0;
+    }
+#ifdef Py_USING_UNICODE
+    if (PyUnicode_Check(obj)) {
+        *taint = PyUnicode_GET_MERITS(obj);
+        Py_XINCREF(*taint);
+        return 0;
+    }
+#endif
+    *taint = NULL;
+    if (Proxy_Check(obj)) {
+        *taint = ((ProxyObject *)obj)->px_taint;
+        Py_XINCREF(*taint);
+    }
+    return 0;
+}
+
+PyDoc_STRVAR(get_taint_doc,
+"get_taint(obj) -> set of merits or None\n\
+\n\
+Return taint of obj: the set of its merits if it's a tainted string, unicode\n\
+or taint propagating proxy, None otherwise.");
+
+static PyObject *
+get_taint(PyObject *self, PyObject *obj)
+{
+    PyTaintObject *taint;
+
+    if (object_taint(obj, &taint) < 0)
+        return NULL;
+    return merits_from_taint(taint);
+}
+
+PyDoc_STRVAR(propagate_doc,
+"propagate(a, b) -> set of merits or None\n\
+\n\
+Return the result of taint propagation between taints a and b (each being\n\
+None or a collection of merits).");
+
+static PyObject *
+propagate(PyObject *self, PyObject *args)
+{
+    PyObject *a, *b;
+    PyTaintObject *ta, *tb, *result = NULL;
+    int r;
+
+    if (!PyArg_UnpackTuple(args, "propagate", 2, 2, &a, &b))
+        return NULL;
+    if (taint_from_merits(a, &ta) < 0)
+        return NULL;
+    if (taint_from_merits(b, &tb) < 0) {
+        Py_XDECREF(ta);
+        return NULL;
+    }
+    r = PyTaint_PropagationResult(&result, ta, tb);
+    Py_XDECREF(ta);
+    Py_XDECREF(tb);
+    if (r == -1)
+        return NULL;
+    return merits_from_taint(result);
+}
+
+/* Fold taints of all items of sequence seq into acc. Returns 0 on success,
+   -1 on failure. */
+static int
+accumulate_items(PyTaint_Accumulator *acc, PyObject *seq)
+{
+    PyTaintObject *taint;
+    Py_ssize_t i;
+    int r;
+
+    for (i = 0; i < PySequence_Fast_GET_SIZE(seq); i++) {
+        if (object_taint(PySequence_Fast_GET_ITEM(seq, i), &taint) < 0)
+            return -1;
+        r = PyTaint_AccumulatorAdd(acc, taint);
+        Py_XDECREF(taint);
+        if (r == -1)
+            return -1;
+    }
+    return 0;
+}
+
+/* Store the result of taint propagation across items of args (a tuple) and
+   values of kwargs (a dict, may be NULL) in *taint (a new reference, NULL
+   when clean). Returns 0 on success, -1 on failure. */
+static int
+collect_args(PyObject *args, PyObject *kwargs, PyTaintObject **taint)
+{
+    PyTaint_Accumulator acc;
+    PyTaintObject *value_taint;
+    PyObject *key, *value;
+    Py_ssize_t pos = 0;
+    int r;
+
+    PyTaint_AccumulatorInit(&acc);
+    if (accumulate_items(&acc, args) < 0)
+        goto error;
+    while (kwargs != NULL && PyDict_Next(kwargs, &pos, &key, &value)) {
+        if (object_taint(value, &value_taint) < 0)
+            goto error;
+        r = PyTaint_AccumulatorAdd(&acc, value_taint);
+        Py_XDECREF(value_taint);
+        if (r == -1)
+            goto error;
+    }
+    *taint = NULL;
+    if (PyTaint_AccumulatorResult(&acc, taint) == -1)
+        goto error;
+    PyTaint_AccumulatorClear(&acc);
+    return 0;
+
+error:
+    PyTaint_AccumulatorClear(&acc);
+    return -1;
+}
+
+PyDoc_STRVAR(collect_taint_doc,
+"collect_taint(objects[, kwargs]) -> set of merits or None\n\
+\n\
+Return the result of taint propagation across objects from given sequence,\n\
+followed by values of dict kwargs, if it's given.");
+
+static PyObject *
+collect_taint(PyObject *self, PyObject *args)
+{
+    PyObject *objects, *kwargs = NULL, *seq;
+    PyTaintObject *result;
+    int r;
+
+    if (!PyArg_ParseTuple(args, "O|O!:collect_taint",
+                          &objects, &PyDict_Type, &kwargs))
+        return NULL;
+    seq = PySequence_Fast(objects, "collect_taint() argument must be "
+                                   "a sequence");
+    if (seq == NULL)
+        return NULL;
+    r = collect_args(seq, kwargs, &result);
+    Py_DECREF(seq);
+    if (r < 0)
+        return NULL;
+    return merits_from_taint(result);
+}
+
+/* State of a taint_object call. */
+typedef struct {
+    PyObject *merits;       /* taint as given - None or collection of merits */
+    PyTaintObject *taint;   /* merits as taint object, made on first use */
+    int converted;
+    PyObject *wrapper;      /* called for objects which aren't taintable, NULL
+                               to wrap them in proxies */
+    int lazy;               /* give views of lists, tuples and dicts instead
+                               of copies */
+} taint_target;
+
+static PyObject *taint_value(PyObject *obj, taint_target *target);
+static PyObject *proxy_wrap(PyObject *obj, PyTaintObject *taint);
+static PyObject *view_new(PyTypeObject *type, PyObject *obj,
+                          PyTaintObject *taint);
+static PyObject *tainted_iter(PyObject *iterable, PyTaintObject *taint,
+                              int pairs, int lazy);
+
+/* Types of iterators which are nothing more than that, so that tainted
+   iterators can stand in for them: generators and iterators of builtin
+   sequences, dicts and sets. Most of them aren't exported, so they are found
+   when the module is initialized. */
+#define MAX_BARE_ITER_TYPES 16
+static PyTypeObject *bare_iter_types[MAX_BARE_ITER_TYPES];
+static int bare_iter_count = 0;
+
+static int
+is_bare_iter(PyObject *obj)
+{
+    int i;
+
+    for (i = 0; i < bare_iter_count; i++)
+        if (Py_TYPE(obj) == bare_iter_types[i])
+            return 1;
+    return 0;
+}
+
+/* Add the type of the iterator of iterable to the bare iterator types.
+   Steals the reference to iterable, which may be NULL (then -1 is returned).
+   Returns 0 on success, -1 on failure. */
+static int
+add_bare_iter_type(PyObject *iterable)
+{
+    PyObject *iter;
+
+    if (iterable == NULL)
+        return -1;
+    iter = PyObject_GetIter(iterable);
+    Py_DECREF(iterable);
+    if (iter == NULL)
+        return -1;
+    assert(bare_iter_count < MAX_BARE_ITER_TYPES);
+    if (!is_bare_iter(iter))
+        bare_iter_types[bare_iter_count++] = Py_TYPE(iter);
+    Py_DECREF(iter);
+    return 0;
+}
+
+/* Set up target for tainting with taint (borrowed, may be NULL) from C, with
+   the default wrapper. */
+static void
+target_init(taint_target *target, PyTaintObject *taint, int lazy)
+{
+    target->merits = taint == NULL ? Py_None : NULL;
+    target->taint = taint;
+    target->converted = 1;
+    target->wrapper = NULL;
+    target->lazy = lazy;
+}
+
+/* Store the taint of target (a borrowed reference) in *taint. Returns 0 on
+   success, -1 on failure. */
+static int
+target_taint(taint_target *target, PyTaintObject **taint)
+{
+    if (!target->converted) {
+        if (taint_from_merits(target->merits, &target->taint) < 0)
+            return -1;
+        target->converted = 1;
+    }
+    *taint = target->taint;
+    return 0;
+}
+
+/* Return a list of items of obj (an iterable) tainted with taint_value. */
+static PyObject *
+taint_items(PyObject *obj, taint_target *target)
+{
+    PyObject *iter, *item, *tainted, *result;
+
+    result = PyList_New(0);
+    if (result == NULL)
+        return NULL;
+    iter = PyObject_GetIter(obj);
+    if (iter == NULL)
+        goto error;
+    while ((item = PyIter_Next(iter)) != NULL) {
+        tainted = taint_value(item, target);
+        Py_DECREF(item);
+        if (tainted == NULL || PyList_Append(result, tainted) < 0) {
+            Py_XDECREF(tainted);
+            goto error;
+        }
+        Py_DECREF(tainted);
+    }
+    Py_DECREF(iter);
+    if (PyErr_Occurred()) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    return result;
+
+error:
+    Py_XDECREF(iter);
+    Py_DECREF(result);
+    return NULL;
+}
+
+/* Return a copy of dict obj with values tainted with taint_value. */
+static PyObject *
+taint_values(PyObject *obj, taint_target *target)
+{
+    PyObject *items, *result, *pair, *value;
+    Py_ssize_t i;
+
+    items = PyDict_Items(obj);
+    if (items == NULL)
+        return NULL;
+    result = PyDict_New();
+    if (result == NULL)
+        goto done;
+    for (i = 0; i < PyList_GET_SIZE(items); i++) {
+        pair = PyList_GET_ITEM(items, i);
+        value = taint_value(PyTuple_GET_ITEM(pair, 1), target);
+        if (value == NULL ||
+            PyDict_SetItem(result, PyTuple_GET_ITEM(pair, 0), value) < 0) {
+            Py_XDECREF(value);
+            Py_CLEAR(result);
+            break;
+        }
+        Py_DECREF(value);
+    }
+done:
+    Py_DECREF(items);
+    return result;
+}
+
+static PyObject *
+taint_value(PyObject *obj, taint_target *target)
+{
+    PyObject *items, *result;
+    PyTaintObject *taint;
+    int lazy;
+
+    if (PyString_Check(obj) || PyUnicode_Check(obj)) {
+        if (target->merits == Py_None) {
+            Py_INCREF(obj);
+            return obj;
+        }
+        if (target_taint(target, &taint) < 0)
+            return NULL;
+        /* same as obj.withmerits(merits) */
+        if (PyString_Check(obj)) {
+            if (PyString_CheckExact(obj) && _PyTaint_Enabled &&
+                PyString_GET_MERITS(obj) == taint) {
+                Py_INCREF(obj);
+                return obj;
+            }
+            return _PyString_CopyWithMerits((PyStringObject *)obj, taint);
+        }
+        if (PyUnicode_CheckExact(obj) && _PyTaint_Enabled &&
+            PyUnicode_GET_MERITS(obj) == taint) {
+            Py_INCREF(obj);
+            return obj;
+        }
+        return _PyUnicode_CopyWithMerits((PyUnicodeObject *)obj, taint);
+    }
+    /* views are tainted as the containers they show */
+    if (TaintedView_Check(obj))
+        obj = ((TaintedViewObject *)obj)->tv_obj;
+    if (target->lazy &&
+        (PyList_CheckExact(obj) || PyTuple_CheckExact(obj) ||
+         PyDict_CheckExact(obj))) {
+        if (target_taint(target, &taint) < 0)
+            return NULL;
+        return view_new(PyList_CheckExact(obj) ? &TaintedList_Type :
+                        PyTuple_CheckExact(obj) ? &TaintedTuple_Type :
+                        &TaintedDict_Type, obj, taint);
+    }
+    if (PyList_CheckExact(obj))
+        return taint_items(obj, target);
+    if (PyTuple_CheckExact(obj)) {
+        items = taint_items(obj, target);
+        if (items == NULL)
+            return NULL;
+        result = PyList_AsTuple(items);
+        Py_DECREF(items);
+        return result;
+    }
+    if (Py_TYPE(obj) == &PySet_Type || PyFrozenSet_CheckExact(obj)) {
+        /* set items are hashed, so they are tainted right away */
+        lazy = target->lazy;
+        target->lazy = 0;
+        items = taint_items(obj, target);
+        target->lazy = lazy;
+        if (items == NULL)
+            return NULL;
+        if (Py_TYPE(obj) == &PySet_Type)
+            result = PySet_New(items);
+        else
+            result = PyFrozenSet_New(items);
+        Py_DECREF(items);
+        return result;
+    }
+    if (PyDict_CheckExact(obj))
+        return taint_values(obj, target);
+    if (target->wrapper != NULL)
+        return PyObject_CallFunctionObjArgs(target->wrapper, obj,
+                                           target->merits, NULL);
+    /* iterators which are nothing more than that (like generators) taint
+       their items as they come out; others (like csv readers) have more to
+       them, so they are proxied (and iterating the proxy does the same) */
+    if (is_bare_iter(obj)) {
+        if (target_taint(target, &taint) < 0)
+            return NULL;
+        if (Py_TYPE(obj) == &TaintedIterator_Type &&
+            !((TaintedIterObject *)obj)->ti_pairs)
+            obj = ((TaintedIterObject *)obj)->ti_iter;
+        return tainted_iter(obj, taint, 0, target->lazy);
+    }
+    /* numbers and None are left alone */
+    if (obj == Py_None || PyInt_CheckExact(obj) || PyBool_Check(obj) ||
+        PyLong_CheckExact(obj) || PyFloat_CheckExact(obj)) {
+        Py_INCREF(obj);
+        return obj;
+    }
+    if (target_taint(target, &taint) < 0)
+        return NULL;
+    return proxy_wrap(obj, taint);
+}
+
+PyDoc_STRVAR(taint_object_doc,
+"taint_object(obj, taint[, wrapper[, lazy]]) -> object\n\
+\n\
+Return obj tainted with taint (None or a collection of merits). Strings and\n\
+unicode objects get a copy with exactly these merits (or themselves, when\n\
+taint is None). Builtin collections are copied with their items tainted\n\
+recursively (only values, for dicts). With lazy set, lists, tuples and dicts\n\
+are given as TaintedList, TaintedTuple and TaintedDict views instead, which\n\
+taint the items when they are read. Other objects are passed to\n\
+wrapper(obj, taint). Without a wrapper (or when it's None), generators and\n\
+iterators of builtin collections are given as TaintedIterator, tainting\n\
+their items as they come out, None and numbers are returned as they are\n\
+and everything else is wrapped in a Proxy.");
+
+static PyObject *
+taint_object(PyObject *self, PyObject *args)
+{
+    taint_target target;
+    PyObject *obj, *result;
+
+    target.wrapper = NULL;
+    target.lazy = 0;
+    if (!PyArg_ParseTuple(args, "OO|Oi:taint_object", &obj, &target.merits,
+                          &target.wrapper, &target.lazy))
+        return NULL;
+    if (target.wrapper == Py_None)
+        target.wrapper = NULL;
+    target.taint = NULL;
+    target.converted = 0;
+    result = taint_value(obj, &target);
+    Py_XDECREF(target.taint);
+    return result;
+}
+
+/* Proxies. Results of operations on a proxy get the taint propagated between
+   its own taint and the taint of the other operands, the same way results of
+   string operations do. Objects which can't carry taint themselves are
+   wrapped in proxies again. */
+
+#define UNWRAP(op) (Proxy_Check(op) ? ((ProxyObject *)(op))->px_obj : (op))
+
+/* Return a new proxy of obj with given taint (borrowed, may be NULL). */
+static PyObject *
+proxy_wrap(PyObject *obj, PyTaintObject *taint)
+{
+    ProxyObject *px;
+
+    px = (ProxyObject *)Proxy_Type.tp_alloc(&Proxy_Type, 0);
+    if (px == NULL)
+        return NULL;
+    Py_INCREF(obj);
+    px->px_obj = obj;
+    Py_XINCREF(taint);
+    px->px_taint = taint;
+    return (PyObject *)px;
+}
+
+/* Return result tainted with taint (borrowed, may be NULL), as taint_object
+   without a wrapper does. Results of operations are often modified by the
+   caller, so builtin collections are copied rather than given as views.
+   Steals the reference to result, which may be NULL (then NULL is
+   returned). */
+static PyObject *
+taint_with(PyObject *result, PyTaintObject *taint)
+{
+    taint_target target;
+    PyObject *tainted;
+
+    if (result == NULL)
+        return NULL;
+    target_init(&target, taint, 0);
+    tainted = taint_value(result, &target);
+    Py_DECREF(result);
+    return tainted;
+}
+
+/* Same as taint_with, with the result of propagation between taints a and
+   b. */
+static PyObject *
+taint_result(PyObject *result, PyTaintObject *a, PyTaintObject *b)
+{
+    PyTaintObject *taint = NULL;
+
+    if (result == NULL)
+        return NULL;
+    if (PyTaint_PropagationResult(&taint, a, b) == -1) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    result = taint_with(result, taint);
+    Py_XDECREF(taint);
+    return result;
+}
+
+/* Same as taint_result, with taints of objects v and w. */
+static PyObject *
+taint_binary_result(PyObject *result, PyObject *v, PyObject *w)
+{
+    PyTaintObject *tv, *tw;
+
+    if (result == NULL)
+        return NULL;
+    if (object_taint(v, &tv) < 0 || object_taint(w, &tw) < 0) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    result = taint_result(result, tv, tw);
+    Py_XDECREF(tv);
+    Py_XDECREF(tw);
+    return result;
+}
+
+static PyObject *
+proxy_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"obj", "taint", NULL};
+    PyObject *obj, *merits;
+    PyTaintObject *taint;
+    ProxyObject *px;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OO:Proxy", kwlist,
+                                     &obj, &merits))
+        return NULL;
+    if (taint_from_merits(merits, &taint) < 0)
+        return NULL;
+    px = (ProxyObject *)type->tp_alloc(type, 0);
+    if (px == NULL) {
+        Py_XDECREF(taint);
+        return NULL;
+    }
+    Py_INCREF(obj);
+    px->px_obj = obj;
+    px->px_taint = taint;
+    return (PyObject *)px;
+}
+
+static void
+proxy_dealloc(ProxyObject *px)
+{
+    PyObject_GC_UnTrack(px);
+    if (px->px_weakreflist != NULL)
+        PyObject_ClearWeakRefs((PyObject *)px);
+    Py_XDECREF(px->px_obj);
+    Py_XDECREF(px->px_taint);
+    Py_TYPE(px)->tp_free((PyObject *)px);
+}
+
+static int
+proxy_traverse(ProxyObject *px, visitproc visit, void *arg)
+{
+    Py_VISIT(px->px_obj);
+    return 0;
+}
+
+static PyObject *
+proxy_repr(ProxyObject *px)
+{
+    return PyObject_Repr(px->px_obj);
+}
+
+static PyObject *
+proxy_str(ProxyObject *px)
+{
+    return PyObject_Str(px->px_obj);
+}
+
+static long
+proxy_hash(ProxyObject *px)
+{
+    return PyObject_Hash(px->px_obj);
+}
+
+static PyObject *
+proxy_getattro(ProxyObject *px, PyObject *name)
+{
+    /* attributes get the taint of the proxy as it is */
+    return taint_with(PyObject_GetAttr(px->px_obj, name), px->px_taint);
+}
+
+static int
+proxy_setattro(ProxyObject *px, PyObject *name, PyObject *value)
+{
+    return PyObject_SetAttr(px->px_obj, name, value);
+}
+
+static PyObject *
+proxy_call(ProxyObject *px, PyObject *args, PyObject *kwargs)
+{
+    PyObject *result;
+    PyTaintObject *taint;
+
+    result = PyObject_Call(px->px_obj, args, kwargs);
+    if (result == NULL)
+        return NULL;
+    if (collect_args(args, kwargs, &taint) < 0) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    result = taint_result(result, taint, px->px_taint);
+    Py_XDECREF(taint);
+    return result;
+}
+
+static PyObject *
+proxy_richcompare(PyObject *v, PyObject *w, int op)
+{
+    return taint_binary_result(PyObject_RichCompare(UNWRAP(v), UNWRAP(w), op),
+                               v, w);
+}
+
+static PyObject *
+proxy_iter(ProxyObject *px)
+{
+    PyObject *iter, *result;
+    PyTaintObject *taint = NULL;
+
+    iter = PyObject_GetIter(px->px_obj);
+    if (iter == NULL)
+        return NULL;
+    if (PyTaint_PropagationResult(&taint, NULL, px->px_taint) == -1) {
+        Py_DECREF(iter);
+        return NULL;
+    }
+    /* a tainted iterator is enough for looping, even when the iterator is
+       something more (like a file), and it's a lot cheaper than a proxy */
+    result = tainted_iter(iter, taint, 0, 0);
+    Py_XDECREF(taint);
+    Py_DECREF(iter);
+    return result;
+}
+
+static PyObject *
+proxy_iternext(ProxyObject *px)
+{
+    PyObject *obj = px->px_obj;
+
+    if (!PyIter_Check(obj)) {
+        PyErr_Format(PyExc_TypeError, "'%.200s' object is not an iterator",
+                     Py_TYPE(obj)->tp_name);
+        return NULL;
+    }
+    return taint_result((*Py_TYPE(obj)->tp_iternext)(obj), NULL,
+                        px->px_taint);
+}
+
+static PyObject *
+proxy_descr_get(ProxyObject *px, PyObject *obj, PyObject *type)
+{
+    descrgetfunc get = Py_TYPE(px->px_obj)->tp_descr_get;
+
+    if (get == NULL) {
+        Py_INCREF(px);
+        return (PyObject *)px;
+    }
+    return taint_result(get(px->px_obj, obj, type), NULL, px->px_taint);
+}
+
+static Py_ssize_t
+proxy_length(ProxyObject *px)
+{
+    return PyObject_Size(px->px_obj);
+}
+
+static PyObject *
+proxy_subscript(ProxyObject *px, PyObject *key)
+{
+    return taint_binary_result(PyObject_GetItem(px->px_obj, key),
+                               (PyObject *)px, key);
+}
+
+static int
+proxy_ass_subscript(ProxyObject *px, PyObject *key, PyObject *value)
+{
+    if (value == NULL)
+        return PyObject_DelItem(px->px_obj, key);
+    return PyObject_SetItem(px->px_obj, key, value);
+}
+
+static int
+proxy_contains(ProxyObject *px, PyObject *value)
+{
+    return PySequence_Contains(px->px_obj, value);
+}
+
+static int
+proxy_nonzero(ProxyObject *px)
+{
+    return PyObject_IsTrue(px->px_obj);
+}
+
+/* Binary operations are done on the wrapped objects of any proxies among
+   the operands. */
+#define PROXY_BINARY(name, func) \
+    static PyObject * \
+    name(PyObject *v, PyObject *w) \
+    { \
+        return taint_binary_result(func(UNWRAP(v), UNWRAP(w)), v, w); \
+    }
+
+PROXY_BINARY(proxy_add, PyNumber_Add)
+PROXY_BINARY(proxy_subtract, PyNumber_Subtract)
+PROXY_BINARY(proxy_multiply, PyNumber_Multiply)
+PROXY_BINARY(proxy_divide, PyNumber_Divide)
+PROXY_BINARY(proxy_remainder, PyNumber_Remainder)
+PROXY_BINARY(proxy_divmod, PyNumber_Divmod)
+PROXY_BINARY(proxy_lshift, PyNumber_Lshift)
+PROXY_BINARY(proxy_rshift, PyNumber_Rshift)
+PROXY_BINARY(proxy_and, PyNumber_And)
+PROXY_BINARY(proxy_xor, PyNumber_Xor)
+PROXY_BINARY(proxy_or, PyNumber_Or)
+PROXY_BINARY(proxy_floor_divide, PyNumber_FloorDivide)
+PROXY_BINARY(proxy_true_divide, PyNumber_TrueDivide)
+PROXY_BINARY(proxy_inplace_add, PyNumber_InPlaceAdd)
+PROXY_BINARY(proxy_inplace_subtract, PyNumber_InPlaceSubtract)
+PROXY_BINARY(proxy_inplace_multiply, PyNumber_InPlaceMultiply)
+PROXY_BINARY(proxy_inplace_divide, PyNumber_InPlaceDivide)
+PROXY_BINARY(proxy_inplace_true_divide, PyNumber_InPlaceTrueDivide)
+
+static PyObject *
+proxy_power(PyObject *v, PyObject *w, PyObject *z)
+{
+    PyObject *result, *operands;
+    PyTaintObject *taint;
+
+    result = PyNumber_Power(UNWRAP(v), UNWRAP(w), UNWRAP(z));
+    if (z == Py_None || result == NULL)
+        return taint_binary_result(result, v, w);
+    /* the modulus is an operand too */
+    operands = PyTuple_Pack(3, v, w, z);
+    if (operands == NULL || collect_args(operands, NULL, &taint) < 0) {
+        Py_XDECREF(operands);
+        Py_DECREF(result);
+        return NULL;
+    }
+    Py_DECREF(operands);
+    result = taint_with(result, taint);
+    Py_XDECREF(taint);
+    return result;
+}
+
+static PyObject *
+proxy_unicode(ProxyObject *px)
+{
+    return PyObject_Unicode(px->px_obj);
+}
+
+static PyObject *
+proxy_reversed(ProxyObject *px)
+{
+    return taint_result(
+        PyObject_CallFunctionObjArgs((PyObject *)&PyReversed_Type,
+                                     px->px_obj, NULL),
+        NULL, px->px_taint);
+}
+
+static PyMethodDef proxy_methods[] = {
+    {"__unicode__", (PyCFunction)proxy_unicode, METH_NOARGS, NULL},
+    {"__reversed__", (PyCFunction)proxy_reversed, METH_NOARGS, NULL},
+    {NULL, NULL} /* sentinel */
+};
+
+static PyNumberMethods proxy_as_number = {
+    proxy_add,                          /* nb_add */
+    proxy_subtract,                     /* nb_subtract */
+    proxy_multiply,                     /* nb_multiply */
+    proxy_divide,                       /* nb_divide */
+    proxy_remainder,                    /* nb_remainder */
+    proxy_divmod,                       /* nb_divmod */
+    proxy_power,                        /* nb_power */
+    0,                                  /* nb_negative */
+    0,                                  /* nb_positive */
+    0,                                  /* nb_absolute */
+    (inquiry)proxy_nonzero,             /* nb_nonzero */
+    0,                                  /* nb_invert */
+    proxy_lshift,                       /* nb_lshift */
+    proxy_rshift,                       /* nb_rshift */
+    proxy_and,                          /* nb_and */
+    proxy_xor,                          /* nb_xor */
+    proxy_or,                           /* nb_or */
+    0,                                  /* nb_coerce */
+    0,                                  /* nb_int */
+    0,                                  /* nb_long */
+    0,                                  /* nb_float */
+    0,                                  /* nb_oct */
+    0,                                  /* nb_hex */
+    proxy_inplace_add,                  /* nb_inplace_add */
+    proxy_inplace_subtract,             /* nb_inplace_subtract */
+    proxy_inplace_multiply,             /* nb_inplace_multiply */
+    proxy_inplace_divide,               /* nb_inplace_divide */
+    0,                                  /* nb_inplace_remainder */
+    0,                                  /* nb_inplace_power */
+    0,                                  /* nb_inplace_lshift */
+    0,                                  /* nb_inplace_rshift */
+    0,                                  /* nb_inplace_and */
+    0,                                  /* nb_inplace_xor */
+    0,                                  /* nb_inplace_or */
+    proxy_floor_divide,                 /* nb_floor_divide */
+    proxy_true_divide,                  /* nb_true_divide */
+    0,                                  /* nb_inplace_floor_divide */
+    proxy_inplace_true_divide,          /* nb_inplace_true_divide */
+};
+
+static PySequenceMethods proxy_as_sequence = {
+    0,                                  /* sq_length */
+    0,                                  /* sq_concat */
+    0,                                  /* sq_repeat */
+    0,                                  /* sq_item */
+    0,                                  /* sq_slice */
+    0,                                  /* sq_ass_item */
+    0,                                  /* sq_ass_slice */
+    (objobjproc)proxy_contains,         /* sq_contains */
+};
+
+static PyMappingMethods proxy_as_mapping = {
+    (lenfunc)proxy_length,              /* mp_length */
+    (binaryfunc)proxy_subscript,        /* mp_subscript */
+    (objobjargproc)proxy_ass_subscript, /* mp_ass_subscript */
+};
+
+PyDoc_STRVAR(proxy_doc,
+"Proxy(obj, taint)\n\
+\n\
+Taint propagating proxy of obj, tainted with taint (None or a collection of\n\
+merits). Attribute access and special methods are forwarded to obj. Their\n\
+results are tainted with taint propagated from the proxy and the arguments\n\
+(attributes get the taint of the proxy as it is), and wrapped in proxies\n\
+themselves, unless they are strings, builtin collections, numbers or None.\n\
+Slicing goes through __getitem__ with a slice object.");
+
+static PyTypeObject Proxy_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.Proxy",                             /* tp_name */
+    sizeof(ProxyObject),                        /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)proxy_dealloc,                  /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)proxy_repr,                       /* tp_repr */
+    &proxy_as_number,                           /* tp_as_number */
+    &proxy_as_sequence,                         /* tp_as_sequence */
+    &proxy_as_mapping,                          /* tp_as_mapping */
+    (hashfunc)proxy_hash,                       /* tp_hash */
+    (ternaryfunc)proxy_call,                    /* tp_call */
+    (reprfunc)proxy_str,                        /* tp_str */
+    (getattrofunc)proxy_getattro,               /* tp_getattro */
+    (setattrofunc)proxy_setattro,               /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC | Py_TPFLAGS_BASETYPE |
+        Py_TPFLAGS_CHECKTYPES,                  /* tp_flags */
+    proxy_doc,                                  /* tp_doc */
+    (traverseproc)proxy_traverse,               /* tp_traverse */
+    0,                                          /* tp_clear */
+    proxy_richcompare,                          /* tp_richcompare */
+    offsetof(ProxyObject, px_weakreflist),      /* tp_weaklistoffset */
+    (getiterfunc)proxy_iter,                    /* tp_iter */
+    (iternextfunc)proxy_iternext,               /* tp_iternext */
+    proxy_methods,                              /* tp_methods */
+    0,                                          /* tp_members */
+    0,                                          /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    (descrgetfunc)proxy_descr_get,              /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    0,                                          /* tp_dictoffset */
+    0,                                          /* tp_init */
+    PyType_GenericAlloc,                        /* tp_alloc */
+    proxy_new,                                  /* tp_new */
+    PyObject_GC_Del,                            /* tp_free */
+};
+
+/* Tainted views. taint_object copies containers to taint their items, which
+   costs the same however little of the result is used. A view keeps the
+   container instead and taints each item when it's read (containers among
+   the items are given as views again). Views are read only, and equal to the
+   containers they show. */
+
+#define VIEW_UNWRAP(op) \
+    (TaintedView_Check(op) ? ((TaintedViewObject *)(op))->tv_obj : (op))
+
+/* Return a new view of obj (a list, tuple or dict) with given taint (borrowed,
+   may be NULL). */
+static PyObject *
+view_new(PyTypeObject *type, PyObject *obj, PyTaintObject *taint)
+{
+    TaintedViewObject *view;
+
+    view = PyObject_GC_New(TaintedViewObject, type);
+    if (view == NULL)
+        return NULL;
+    Py_INCREF(obj);
+    view->tv_obj = obj;
+    Py_XINCREF(taint);
+    view->tv_taint = taint;
+    view->tv_weakreflist = NULL;
+    PyObject_GC_Track(view);
+    return (PyObject *)view;
+}
+
+/* Return item of the container shown by view (borrowed), tainted. */
+static PyObject *
+view_item(TaintedViewObject *view, PyObject *item)
+{
+    taint_target target;
+    PyObject *result;
+
+    target_init(&target, view->tv_taint, 1);
+    Py_INCREF(item);
+    result = taint_value(item, &target);
+    Py_DECREF(item);
+    return result;
+}
+
+static void
+view_dealloc(TaintedViewObject *view)
+{
+    PyObject_GC_UnTrack(view);
+    if (view->tv_weakreflist != NULL)
+        PyObject_ClearWeakRefs((PyObject *)view);
+    Py_XDECREF(view->tv_obj);
+    Py_XDECREF(view->tv_taint);
+    PyObject_GC_Del(view);
+}
+
+static int
+view_traverse(TaintedViewObject *view, visitproc visit, void *arg)
+{
+    Py_VISIT(view->tv_obj);
+    return 0;
+}
+
+static PyObject *
+view_repr(TaintedViewObject *view)
+{
+    return PyObject_Repr(view->tv_obj);
+}
+
+static PyObject *
+view_richcompare(PyObject *v, PyObject *w, int op)
+{
+    return PyObject_RichCompare(VIEW_UNWRAP(v), VIEW_UNWRAP(w), op);
+}
+
+static Py_ssize_t
+view_length(TaintedViewObject *view)
+{
+    return PyObject_Size(view->tv_obj);
+}
+
+static int
+view_contains(TaintedViewObject *view, PyObject *value)
+{
+    return PySequence_Contains(view->tv_obj, value);
+}
+
+PyDoc_STRVAR(materialize_doc,
+"materialize() -> list, tuple or dict\n\
+\n\
+Return a copy of the container with all its items tainted, the same as\n\
+taint_object makes when it isn't lazy.");
+
+static PyObject *
+view_materialize(TaintedViewObject *view)
+{
+    taint_target target;
+
+    target_init(&target, view->tv_taint, 0);
+    return taint_value(view->tv_obj, &target);
+}
+
+/* TaintedList and TaintedTuple */
+
+static PyObject *
+seqview_item(TaintedViewObject *view, Py_ssize_t i)
+{
+    if (i < 0 || i >= Py_SIZE(view->tv_obj)) {
+        PyErr_SetString(PyExc_IndexError, "index out of range");
+        return NULL;
+    }
+    return view_item(view, PySequence_Fast_GET_ITEM(view->tv_obj, i));
+}
+
+static PyObject *
+seqview_subscript(TaintedViewObject *view, PyObject *key)
+{
+    PyObject *items, *result;
+    Py_ssize_t i;
+
+    if (PyIndex_Check(key)) {
+        i = PyNumber_AsSsize_t(key, PyExc_IndexError);
+        if (i == -1 && PyErr_Occurred())
+            return NULL;
+        if (i < 0)
+            i += Py_SIZE(view->tv_obj);
+        return seqview_item(view, i);
+    }
+    if (PySlice_Check(key)) {
+        items = PyObject_GetItem(view->tv_obj, key);
+        if (items == NULL)
+            return NULL;
+        result = view_new(Py_TYPE(view), items, view->tv_taint);
+        Py_DECREF(items);
+        return result;
+    }
+    PyErr_Format(PyExc_TypeError, "indices must be integers, not %.200s",
+                 Py_TYPE(key)->tp_name);
+    return NULL;
+}
+
+static PyObject *
+seqview_iter(TaintedViewObject *view)
+{
+    return tainted_iter(view->tv_obj, view->tv_taint, 0, 1);
+}
+
+static long
+seqview_hash(TaintedViewObject *view)
+{
+    return PyObject_Hash(view->tv_obj);
+}
+
+static PyObject *
+seqview_count(TaintedViewObject *view, PyObject *value)
+{
+    return PyObject_CallMethod(view->tv_obj, "count", "O", value);
+}
+
+static PyObject *
+seqview_index(TaintedViewObject *view, PyObject *args)
+{
+    PyObject *method, *result;
+
+    method = PyObject_GetAttrString(view->tv_obj, "index");
+    if (method == NULL)
+        return NULL;
+    result = PyObject_Call(method, args, NULL);
+    Py_DECREF(method);
+    return result;
+}
+
+static PySequenceMethods seqview_as_sequence = {
+    (lenfunc)view_length,               /* sq_length */
+    0,                                  /* sq_concat */
+    0,                                  /* sq_repeat */
+    (ssizeargfunc)seqview_item,         /* sq_item */
+    0,                                  /* sq_slice */
+    0,                                  /* sq_ass_item */
+    0,                                  /* sq_ass_slice */
+    (objobjproc)view_contains,          /* sq_contains */
+};
+
+static PyMappingMethods seqview_as_mapping = {
+    (lenfunc)view_length,               /* mp_length */
+    (binaryfunc)seqview_subscript,      /* mp_subscript */
+    0,                                  /* mp_ass_subscript */
+};
+
+static PyMethodDef seqview_methods[] = {
+    {"count", (PyCFunction)seqview_count, METH_O, NULL},
+    {"index", (PyCFunction)seqview_index, METH_VARARGS, NULL},
+    {"materialize", (PyCFunction)view_materialize,
+        METH_NOARGS, materialize_doc},
+    {NULL, NULL} /* sentinel */
+};
+
+PyDoc_STRVAR(tainted_list_doc,
+"Read only view of a list, tainting its items when they are read.");
+
+static PyTypeObject TaintedList_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.TaintedList",                       /* tp_name */
+    sizeof(TaintedViewObject),                  /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)view_dealloc,                   /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)view_repr,                        /* tp_repr */
+    0,                                          /* tp_as_number */
+    &seqview_as_sequence,                       /* tp_as_sequence */
+    &seqview_as_mapping,                        /* tp_as_mapping */
+    PyObject_HashNotImplemented,                /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    tainted_list_doc,                           /* tp_doc */
+    (traverseproc)view_traverse,                /* tp_traverse */
+    0,                                          /* tp_clear */
+    view_richcompare,                           /* tp_richcompare */
+    offsetof(TaintedViewObject, tv_weakreflist),/* tp_weaklistoffset */
+    (getiterfunc)seqview_iter,                  /* tp_iter */
+    0,                                          /* tp_iternext */
+    seqview_methods,                            /* tp_methods */
+};
+
+PyDoc_STRVAR(tainted_tuple_doc,
+"Read only view of a tuple, tainting its items when they are read.");
+
+static PyTypeObject TaintedTuple_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.TaintedTuple",                      /* tp_name */
+    sizeof(TaintedViewObject),                  /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)view_dealloc,                   /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)view_repr,                        /* tp_repr */
+    0,                                          /* tp_as_number */
+    &seqview_as_sequence,                       /* tp_as_sequence */
+    &seqview_as_mapping,                        /* tp_as_mapping */
+    (hashfunc)seqview_hash,                     /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    tainted_tuple_doc,                          /* tp_doc */
+    (traverseproc)view_traverse,                /* tp_traverse */
+    0,                                          /* tp_clear */
+    view_richcompare,                           /* tp_richcompare */
+    offsetof(TaintedViewObject, tv_weakreflist),/* tp_weaklistoffset */
+    (getiterfunc)seqview_iter,                  /* tp_iter */
+    0,                                          /* tp_iternext */
+    seqview_methods,                            /* tp_methods */
+};
+
+/* TaintedDict. Only values are tainted, as taint_object does for dicts. */
+
+static PyObject *
+dictview_subscript(TaintedViewObject *view, PyObject *key)
+{
+    PyObject *value, *result;
+
+    value = PyObject_GetItem(view->tv_obj, key);
+    if (value == NULL)
+        return NULL;
+    result = view_item(view, value);
+    Py_DECREF(value);
+    return result;
+}
+
+static PyObject *
+dictview_iter(TaintedViewObject *view)
+{
+    return PyObject_GetIter(view->tv_obj);
+}
+
+static PyObject *
+dictview_get(TaintedViewObject *view, PyObject *args)
+{
+    PyObject *key, *failobj = Py_None, *value;
+
+    if (!PyArg_UnpackTuple(args, "get", 1, 2, &key, &failobj))
+        return NULL;
+    value = PyObject_GetItem(view->tv_obj, key);
+    if (value == NULL) {
+        if (!PyErr_ExceptionMatches(PyExc_KeyError))
+            return NULL;
+        PyErr_Clear();
+        Py_INCREF(failobj);
+        return failobj;
+    }
+    key = view_item(view, value);
+    Py_DECREF(value);
+    return key;
+}
+
+static PyObject *
+dictview_has_key(TaintedViewObject *view, PyObject *key)
+{
+    int r = PyDict_Contains(view->tv_obj, key);
+
+    if (r < 0)
+        return NULL;
+    return PyBool_FromLong(r);
+}
+
+static PyObject *
+dictview_keys(TaintedViewObject *view)
+{
+    return PyDict_Keys(view->tv_obj);
+}
+
+static PyObject *
+dictview_values(TaintedViewObject *view)
+{
+    PyObject *values, *result;
+
+    values = PyDict_Values(view->tv_obj);
+    if (values == NULL)
+        return NULL;
+    result = view_new(&TaintedList_Type, values, view->tv_taint);
+    Py_DECREF(values);
+    return result;
+}
+
+static PyObject *
+dictview_items(TaintedViewObject *view)
+{
+    PyObject *result, *key, *value, *item;
+    Py_ssize_t pos = 0;
+
+    result = PyList_New(0);
+    if (result == NULL)
+        return NULL;
+    while (PyDict_Next(view->tv_obj, &pos, &key, &value)) {
+        value = view_item(view, value);
+        if (value == NULL)
+            goto error;
+        item = PyTuple_Pack(2, key, value);
+        Py_DECREF(value);
+        if (item == NULL || PyList_Append(result, item) < 0) {
+            Py_XDECREF(item);
+            goto error;
+        }
+        Py_DECREF(item);
+    }
+    return result;
+
+error:
+    Py_DECREF(result);
+    return NULL;
+}
+
+static PyObject *
+dictview_iterkeys(TaintedViewObject *view)
+{
+    return PyObject_GetIter(view->tv_obj);
+}
+
+static PyObject *
+dictview_itervalues(TaintedViewObject *view)
+{
+    PyObject *values, *result;
+
+    values = PyObject_CallMethod(view->tv_obj, "itervalues", NULL);
+    if (values == NULL)
+        return NULL;
+    result = tainted_iter(values, view->tv_taint, 0, 1);
+    Py_DECREF(values);
+    return result;
+}
+
+static PyObject *
+dictview_iteritems(TaintedViewObject *view)
+{
+    PyObject *items, *result;
+
+    items = PyObject_CallMethod(view->tv_obj, "iteritems", NULL);
+    if (items == NULL)
+        return NULL;
+    result = tainted_iter(items, view->tv_taint, 1, 1);
+    Py_DECREF(items);
+    return result;
+}
+
+static PyMappingMethods dictview_as_mapping = {
+    (lenfunc)view_length,               /* mp_length */
+    (binaryfunc)dictview_subscript,     /* mp_subscript */
+    0,                                  /* mp_ass_subscript */
+};
+
+static PySequenceMethods dictview_as_sequence = {
+    0,                                  /* sq_length */
+    0,                                  /* sq_concat */
+    0,                                  /* sq_repeat */
+    0,                                  /* sq_item */
+    0,                                  /* sq_slice */
+    0,                                  /* sq_ass_item */
+    0,                                  /* sq_ass_slice */
+    (objobjproc)view_contains,          /* sq_contains */
+};
+
+static PyMethodDef dictview_methods[] = {
+    {"get", (PyCFunction)dictview_get, METH_VARARGS, NULL},
+    {"has_key", (PyCFunction)dictview_has_key, METH_O, NULL},
+    {"keys", (PyCFunction)dictview_keys, METH_NOARGS, NULL},
+    {"values", (PyCFunction)dictview_values, METH_NOARGS, NULL},
+    {"items", (PyCFunction)dictview_items, METH_NOARGS, NULL},
+    {"iterkeys", (PyCFunction)dictview_iterkeys, METH_NOARGS, NULL},
+    {"itervalues", (PyCFunction)dictview_itervalues, METH_NOARGS, NULL},
+    {"iteritems", (PyCFunction)dictview_iteritems, METH_NOARGS, NULL},
+    {"materialize", (PyCFunction)view_materialize,
+        METH_NOARGS, materialize_doc},
+    {NULL, NULL} /* sentinel */
+};
+
+PyDoc_STRVAR(tainted_dict_doc,
+"Read only view of a dict, tainting its values when they are read.");
+
+static PyTypeObject TaintedDict_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.TaintedDict",                       /* tp_name */
+    sizeof(TaintedViewObject),                  /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)view_dealloc,                   /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)view_repr,                        /* tp_repr */
+    0,                                          /* tp_as_number */
+    &dictview_as_sequence,                      /* tp_as_sequence */
+    &dictview_as_mapping,                       /* tp_as_mapping */
+    PyObject_HashNotImplemented,                /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    tainted_dict_doc,                           /* tp_doc */
+    (traverseproc)view_traverse,                /* tp_traverse */
+    0,                                          /* tp_clear */
+    view_richcompare,                           /* tp_richcompare */
+    offsetof(TaintedViewObject, tv_weakreflist),/* tp_weaklistoffset */
+    (getiterfunc)dictview_iter,                 /* tp_iter */
+    0,                                          /* tp_iternext */
+    dictview_methods,                           /* tp_methods */
+};
+
+/* Tainted iterators. Iterators (generators, cursors, iterators of files and
+   of views) can't be tainted as a whole, so items are tainted one by one as
+   they come out, all with the same taint. Strings nothing else refers to are
+   tainted in place. */
+
+/* Return an iterator over iterable with items tainted with taint (borrowed,
+   may be NULL), as taint_object does with the given lazy flag. */
+static PyObject *
+tainted_iter(PyObject *iterable, PyTaintObject *taint, int pairs, int lazy)
+{
+    TaintedIterObject *ti;
+    PyObject *iter;
+
+    iter = PyObject_GetIter(iterable);
+    if (iter == NULL)
+        return NULL;
+    ti = PyObject_GC_New(TaintedIterObject, &TaintedIterator_Type);
+    if (ti == NULL) {
+        Py_DECREF(iter);
+        return NULL;
+    }
+    ti->ti_iter = iter;
+    Py_XINCREF(taint);
+    ti->ti_taint = taint;
+    ti->ti_pairs = pairs;
+    ti->ti_lazy = lazy;
+    PyObject_GC_Track(ti);
+    return (PyObject *)ti;
+}
+
+/* Return item tainted with the taint of ti. Steals the reference to item,
+   which may be NULL (then NULL is returned). */
+static PyObject *
+taintediter_item(TaintedIterObject *ti, PyObject *item)
+{
+    PyObject *value, *result;
+    taint_target target;
+
+    if (item == NULL)
+        return NULL;
+    if (ti->ti_taint == NULL && (PyString_Check(item) ||
+                                 PyUnicode_Check(item)))
+        return item;
+    if (!ti->ti_pairs &&
+        (PyString_CheckExact(item) || PyUnicode_CheckExact(item))) {
+        /* steals the reference to item when it succeeds */
+        result = PyTaint_AssignToObject(item, ti->ti_taint);
+        if (result == NULL)
+            Py_DECREF(item);
+        return result;
+    }
+    target_init(&target, ti->ti_taint, ti->ti_lazy);
+    if (!ti->ti_pairs) {
+        result = taint_value(item, &target);
+        Py_DECREF(item);
+        return result;
+    }
+    if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2) {
+        PyErr_SetString(PyExc_TypeError, "iteritems() must return pairs");
+        Py_DECREF(item);
+        return NULL;
+    }
+    value = taint_value(PyTuple_GET_ITEM(item, 1), &target);
+    if (value == NULL) {
+        Py_DECREF(item);
+        return NULL;
+    }
+    result = PyTuple_Pack(2, PyTuple_GET_ITEM(item, 0), value);
+    Py_DECREF(value);
+    Py_DECREF(item);
+    return result;
+}
+
+static void
+taintediter_dealloc(TaintedIterObject *ti)
+{
+    PyObject_GC_UnTrack(ti);
+    Py_XDECREF(ti->ti_iter);
+    Py_XDECREF(ti->ti_taint);
+    PyObject_GC_Del(ti);
+}
+
+static int
+taintediter_traverse(TaintedIterObject *ti, visitproc visit, void *arg)
+{
+    Py_VISIT(ti->ti_iter);
+    return 0;
+}
+
+static PyObject *
+taintediter_next(TaintedIterObject *ti)
+{
+    return taintediter_item(ti,
+                            (*Py_TYPE(ti->ti_iter)->tp_iternext)(ti->ti_iter));
+}
+
+static PyObject *
+taintediter_send(TaintedIterObject *ti, PyObject *value)
+{
+    return taintediter_item(ti, PyObject_CallMethod(ti->ti_iter, "send",
+                                                    "O", value));
+}
+
+static PyObject *
+taintediter_throw(TaintedIterObject *ti, PyObject *args)
+{
+    PyObject *method;
+
+    method = PyObject_GetAttrString(ti->ti_iter, "throw");
+    if (method == NULL)
+        return NULL;
+    args = PyObject_Call(method, args, NULL);
+    Py_DECREF(method);
+    return taintediter_item(ti, args);
+}
+
+static PyObject *
+taintediter_close(TaintedIterObject *ti)
+{
+    if (!PyObject_HasAttrString(ti->ti_iter, "close"))
+        Py_RETURN_NONE;
+    return PyObject_CallMethod(ti->ti_iter, "close", NULL);
+}
+
+static PyObject *
+taintediter_length_hint(TaintedIterObject *ti)
+{
+    return PyInt_FromSsize_t(_PyObject_LengthHint(ti->ti_iter, 0));
+}
+
+/* Attributes the tainted iterator doesn't have (like gi_frame) are looked up
+   on the wrapped iterator. */
+static PyObject *
+taintediter_getattro(TaintedIterObject *ti, PyObject *name)
+{
+    PyObject *result;
+
+    result = PyObject_GenericGetAttr((PyObject *)ti, name);
+    if (result == NULL && PyErr_ExceptionMatches(PyExc_AttributeError)) {
+        PyErr_Clear();
+        result = PyObject_GetAttr(ti->ti_iter, name);
+    }
+    return result;
+}
+
+static PyMethodDef taintediter_methods[] = {
+    {"send", (PyCFunction)taintediter_send, METH_O, NULL},
+    {"throw", (PyCFunction)taintediter_throw, METH_VARARGS, NULL},
+    {"close", (PyCFunction)taintediter_close, METH_NOARGS, NULL},
+    {"__length_hint__", (PyCFunction)taintediter_length_hint,
+        METH_NOARGS, NULL},
+    {NULL, NULL} /* sentinel */
+};
+
+PyDoc_STRVAR(tainted_iterator_doc,
+"Iterator tainting the items of another iterator as they come out.\n\
+\n\
+send, throw and close are passed to the wrapped iterator (when it's a\n\
+generator), and what send and throw return is tainted too. Other attributes\n\
+(like gi_frame) are those of the wrapped iterator, untainted.");
+
+static PyTypeObject TaintedIterator_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.TaintedIterator",                   /* tp_name */
+    sizeof(TaintedIterObject),                  /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)taintediter_dealloc,            /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    (getattrofunc)taintediter_getattro,         /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    tainted_iterator_doc,                       /* tp_doc */
+    (traverseproc)taintediter_traverse,         /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    PyObject_SelfIter,                          /* tp_iter */
+    (iternextfunc)taintediter_next,             /* tp_iternext */
+    taintediter_methods,                        /* tp_methods */
+};
+
+/* State of a check call. */
+typedef struct {
+    PyTaintObject *required;    /* all the merits to check for */
+    PyObject *merits;           /* the same merits, as a sequence */
+    int depth;                  /* how many container levels can be entered */
+    Py_ssize_t count;           /* number of strings checked so far */
+    PyObject *path;             /* keys leading to the violation, reversed
+                                   (made when one is found) */
+    PyObject *value;            /* string violating the check */
+} check_state;
+
+/* Add key to the path of a violation found in st. */
+static int
+add_to_path(check_state *st, PyObject *key)
+{
+    if (st->path == NULL) {
+        st->path = PyList_New(0);
+        if (st->path == NULL)
+            return -1;
+    }
+    return PyList_Append(st->path, key);
+}
+
+/* Returns 1 if taint is clean or has all the merits of required. */
+static int
+has_all_merits(PyTaintObject *taint, PyTaintObject *required)
+{
+    Py_ssize_t i;
+    PyTaint_Word have;
+
+    if (taint == NULL)
+        return 1;
+    for (i = 0; i < Py_SIZE(required); i++) {
+        have = i < Py_SIZE(taint) ? taint->ob_bits[i] : 0;
+        if (required->ob_bits[i] & ~have)
+            return 0;
+    }
+    return 1;
+}
+
+static int check_value(PyObject *obj, check_state *st);
+
+/* Check item of a container, which can be found under key (borrowed
+   reference). Returns the same as check_value. */
+static int
+check_item(PyObject *item, PyObject *key, check_state *st)
+{
+    int r;
+
+    Py_INCREF(item);
+    r = check_value(item, st);
+    Py_DECREF(item);
+    if (r == 1 && add_to_path(st, key) < 0)
+        return -1;
+    return r;
+}
+
+/* Same as check_item, with key being an index. */
+static int
+check_indexed_item(PyObject *item, Py_ssize_t i, check_state *st)
+{
+    PyObject *key;
+    int r;
+
+    Py_INCREF(item);
+    r = check_value(item, st);
+    Py_DECREF(item);
+    if (r == 1) {
+        key = PyInt_FromSsize_t(i);
+        if (key == NULL || add_to_path(st, key) < 0)
+            r = -1;
+        Py_XDECREF(key);
+    }
+    return r;
+}
+
+/* Check items of an arbitrary iterable (or its (key, value) pairs, when
+   pairs is set). */
+static int
+check_iterable(PyObject *iterable, int pairs, check_state *st)
+{
+    PyObject *iter, *item;
+    Py_ssize_t i;
+    int r = 0;
+
+    iter = PyObject_GetIter(iterable);
+    if (iter == NULL)
+        return -1;
+    for (i = 0; r == 0 && (item = PyIter_Next(iter)) != NULL; i++) {
+        if (!pairs)
+            r = check_indexed_item(item, i, st);
+        else if (!PyTuple_Check(item) || PyTuple_GET_SIZE(item) != 2) {
+            PyErr_SetString(PyExc_TypeError,
+                            "iteritems() must return pairs");
+            r = -1;
+        }
+        else
+            r = check_item(PyTuple_GET_ITEM(item, 1),
+                           PyTuple_GET_ITEM(item, 0), st);
+        Py_DECREF(item);
+    }
+    Py_DECREF(iter);
+    if (r == 0 && PyErr_Occurred())
+        return -1;
+    return r;
+}
+
+/* Check obj, recursing into builtin containers (and their subclasses). Returns
+   1 when a string without some of the merits was found, 0 if there is none,
+   -1 on failure. */
+static int
+check_value(PyObject *obj, check_state *st)
+{
+    PyObject *key, *value;
+    Py_ssize_t i, pos;
+    long hash;
+    int r = 0;
+
+    if (PyString_Check(obj) || PyUnicode_Check(obj)) {
+        st->count++;
+        if (has_all_merits(PyString_Check(obj) ?
+                           PyString_GET_MERITS(obj) :
+                           PyUnicode_GET_MERITS(obj), st->required))
+            return 0;
+        Py_INCREF(obj);
+        st->value = obj;
+        return 1;
+    }
+    if (st->depth == 0 ||
+        !(PyDict_Check(obj) || PyList_Check(obj) || PyTuple_Check(obj) ||
+          PyAnySet_Check(obj) || TaintedView_Check(obj)))
+        return 0;
+
+    if (Py_EnterRecursiveCall(" while checking taint"))
+        return -1;
+    st->depth--;
+    if (PyDict_CheckExact(obj)) {
+        pos = 0;
+        while (r == 0 && PyDict_Next(obj, &pos, &key, &value)) {
+            Py_INCREF(key);
+            r = check_item(value, key, st);
+            Py_DECREF(key);
+        }
+    }
+    else if (PyList_CheckExact(obj)) {
+        for (i = 0; r == 0 && i < PyList_GET_SIZE(obj); i++)
+            r = check_indexed_item(PyList_GET_ITEM(obj, i), i, st);
+    }
+    else if (PyTuple_CheckExact(obj)) {
+        for (i = 0; r == 0 && i < PyTuple_GET_SIZE(obj); i++)
+            r = check_indexed_item(PyTuple_GET_ITEM(obj, i), i, st);
+    }
+    else if (PyAnySet_CheckExact(obj)) {
+        pos = 0;
+        for (i = 0; r == 0 && _PySet_NextEntry(obj, &pos, &key, &hash); i++)
+            r = check_indexed_item(key, i, st);
+    }
+    else if (PyDict_Check(obj) || Py_TYPE(obj) == &TaintedDict_Type) {
+        /* items of views are checked as they are read, with their taint */
+        value = PyObject_CallMethod(obj, "iteritems", NULL);
+        if (value == NULL)
+            r = -1;
+        else {
+            r = check_iterable(value, 1, st);
+            Py_DECREF(value);
+        }
+    }
+    else
+        r = check_iterable(obj, 0, st);
+    st->depth++;
+    Py_LeaveRecursiveCall();
+    return r;
+}
+
+/* Check obj for merits (a list or tuple), which are also given as taint
+   object required. At most depth levels of containers are entered. The number
+   of checked strings is added to *count. Returns the violation - None or
+   (path, value, merit), in which case the index of merit is stored in *index
+   - or NULL on failure. */
+static PyObject *
+check_object(PyObject *obj, PyObject *merits, PyTaintObject *required,
+             int depth, Py_ssize_t *count, Py_ssize_t *index)
+{
+    PyObject *violation = NULL, *path;
+    PyTaintObject *taint;
+    check_state st;
+    Py_ssize_t i, n;
+    int r;
+
+    st.required = required;
+    st.merits = merits;
+    st.depth = depth;
+    st.count = 0;
+    st.path = NULL;
+    st.value = NULL;
+    r = check_value(obj, &st);
+    *count += st.count;
+    if (r <= 0) {
+        if (r == 0) {
+            violation = Py_None;
+            Py_INCREF(violation);
+        }
+        goto done;
+    }
+
+    /* find the first merit the string lacks */
+    taint = PyString_Check(st.value) ? PyString_GET_MERITS(st.value) :
+                                       PyUnicode_GET_MERITS(st.value);
+    n = PySequence_Fast_GET_SIZE(merits);
+    for (i = 0; i < n - 1; i++)
+        if (_PyTaint_HasMerit(taint, PySequence_Fast_GET_ITEM(merits, i)) == 0)
+            break;
+    *index = i;
+    if (st.path == NULL)
+        path = PyTuple_New(0);
+    else if (PyList_Reverse(st.path) < 0)
+        goto done;
+    else
+        path = PyList_AsTuple(st.path);
+    if (path == NULL)
+        goto done;
+    violation = PyTuple_Pack(3, path, st.value,
+                             PySequence_Fast_GET_ITEM(merits, i));
+    Py_DECREF(path);
+
+done:
+    Py_XDECREF(st.path);
+    Py_XDECREF(st.value);
+    return violation;
+}
+
+PyDoc_STRVAR(check_doc,
+"check(obj, merits[, depth]) -> (count, violation)\n\
+\n\
+Check that all strings and unicode objects in obj, which may be a string or\n\
+nested dicts (only values are checked), lists, tuples and sets of them, are\n\
+either clean or have all of the merits. Containers nested deeper than depth\n\
+levels are skipped. count is the number of strings checked. violation is\n\
+None if all of them passed, otherwise the check stops at the first string\n\
+which didn't and violation is a tuple (path, value, merit): the keys\n\
+(indices for lists and tuples, positions in iteration order for sets)\n\
+leading to the string, the string itself and the first of merits it lacks.");
+
+static PyObject *
+check(PyObject *self, PyObject *args)
+{
+    PyObject *obj, *merits, *violation;
+    PyTaintObject *required;
+    Py_ssize_t count = 0, index;
+    int depth = INT_MAX;
+
+    if (!PyArg_ParseTuple(args, "OO|i:check", &obj, &merits, &depth))
+        return NULL;
+    if (depth < 0) {
+        PyErr_SetString(PyExc_ValueError, "depth must not be negative");
+        return NULL;
+    }
+    merits = PySequence_Fast(merits, "merits must be a sequence");
+    if (merits == NULL)
+        return NULL;
+    required = _PyTaint_AddMerits(NULL, merits);
+    if (required == NULL) {
+        Py_DECREF(merits);
+        return NULL;
+    }
+    violation = check_object(obj, merits, required, depth, &count, &index);
+    Py_DECREF(merits);
+    Py_DECREF(required);
+    if (violation == NULL)
+        return NULL;
+    return Py_BuildValue("(nN)", count, violation);
+}
+
+/* Sink plans. A plan is made for each sink with per argument checks when
+   the config is applied, so that calls of the sink only need to look up the
+   checked arguments. It also counts the checks done. */
+
+/* A checked argument of a sink. */
+typedef struct {
+    Py_ssize_t se_position;     /* index in args, -1 for keyword arguments
+                                   and for all the arguments */
+    int se_depth;               /* container levels entered */
+    PyObject *se_merits;        /* tuple of merits to check for */
+    PyTaintObject *se_required; /* the same merits as a taint object */
+    Py_ssize_t se_checks;       /* number of strings checked */
+    Py_ssize_t se_sampled;      /* ... while data was sampled */
+    Py_ssize_t *se_violations;  /* violations, for each of se_merits */
+} sink_entry;
+
+typedef struct {
+    PyObject_HEAD
+    Py_ssize_t sp_nargs;        /* positional entries (first in sp_entries) */
+    Py_ssize_t sp_nentries;
+    sink_entry *sp_entries;
+    PyObject *sp_kwargs;        /* keyword -> index in sp_entries */
+    sink_entry *sp_all;         /* checks of all the arguments (last in
+                                   sp_entries), or NULL */
+    PyObject *sp_weakreflist;
+} SinkPlanObject;
+
+static void
+sinkplan_dealloc(SinkPlanObject *plan)
+{
+    Py_ssize_t i;
+
+    if (plan->sp_weakreflist != NULL)
+        PyObject_ClearWeakRefs((PyObject *)plan);
+    for (i = 0; i < plan->sp_nentries; i++) {
+        Py_XDECREF(plan->sp_entries[i].se_merits);
+        Py_XDECREF(plan->sp_entries[i].se_required);
+        PyMem_FREE(plan->sp_entries[i].se_violations);
+    }
+    PyMem_FREE(plan->sp_entries);
+    Py_XDECREF(plan->sp_kwargs);
+    Py_TYPE(plan)->tp_free((PyObject *)plan);
+}
+
+/* Fill entry for checking merits (a sequence). Returns 0 on success, -1 on
+   failure. */
+static int
+sink_entry_init(sink_entry *entry, Py_ssize_t position, PyObject *merits)
+{
+    Py_ssize_t n;
+
+    entry->se_position = position;
+    entry->se_depth = INT_MAX;
+    entry->se_merits = PySequence_Tuple(merits);
+    if (entry->se_merits == NULL)
+        return -1;
+    entry->se_required = _PyTaint_AddMerits(NULL, entry->se_merits);
+    if (entry->se_required == NULL)
+        return -1;
+    n = PyTuple_GET_SIZE(entry->se_merits);
+    entry->se_violations = PyMem_NEW(Py_ssize_t, n);
+    if (entry->se_violations == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    memset(entry->se_violations, 0, n * sizeof(Py_ssize_t));
+    return 0;
+}
+
+static PyObject *
+sinkplan_new(PyTypeObject *type, PyObject *args, PyObject *kwds)
+{
+    static char *kwlist[] = {"args_merits", "kwargs_merits", "merits",
+                             "argnames", NULL};
+    PyObject *args_merits, *kwargs_merits, *all_merits = Py_None;
+    PyObject *argnames = Py_None, *key, *merits, *index;
+    SinkPlanObject *plan;
+    Py_ssize_t i, n, pos, position;
+    int r;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwds, "OO!|OO:SinkPlan", kwlist,
+                                     &args_merits, &PyDict_Type,
+                                     &kwargs_merits, &all_merits, &argnames))
+        return NULL;
+    if (argnames != Py_None) {
+        argnames = PySequence_Fast(argnames, "argnames must be a sequence");
+        if (argnames == NULL)
+            return NULL;
+    }
+    else
+        Py_INCREF(argnames);
+    args_merits = PySequence_Fast(args_merits,
+                                  "args_merits must be a sequence");
+    if (args_merits == NULL) {
+        Py_DECREF(argnames);
+        return NULL;
+    }
+
+    plan = (SinkPlanObject *)type->tp_alloc(type, 0);
+    if (plan == NULL)
+        goto error;
+    n = PySequence_Fast_GET_SIZE(args_merits) + PyDict_Size(kwargs_merits) +
+        (all_merits != Py_None);
+    plan->sp_entries = PyMem_NEW(sink_entry, n > 0 ? n : 1);
+    plan->sp_kwargs = PyDict_New();
+    if (plan->sp_entries == NULL || plan->sp_kwargs == NULL) {
+        PyErr_NoMemory();
+        goto error;
+    }
+    memset(plan->sp_entries, 0, n * sizeof(sink_entry));
+
+    /* arguments without any merits to check for are left out */
+    for (i = 0; i < PySequence_Fast_GET_SIZE(args_merits); i++) {
+        merits = PySequence_Fast_GET_ITEM(args_merits, i);
+        r = PyObject_Size(merits);
+        if (r < 0)
+            goto error;
+        if (r == 0)
+            continue;
+        if (sink_entry_init(&plan->sp_entries[plan->sp_nentries++],
+                            i, merits) < 0)
+            goto error;
+    }
+    plan->sp_nargs = plan->sp_nentries;
+
+    pos = 0;
+    while (PyDict_Next(kwargs_merits, &pos, &key, &merits)) {
+        r = PyObject_Size(merits);
+        if (r < 0)
+            goto error;
+        if (r == 0)
+            continue;
+        if (sink_entry_init(&plan->sp_entries[plan->sp_nentries++],
+                            -1, merits) < 0)
+            goto error;
+        index = PyInt_FromSsize_t(plan->sp_nentries - 1);
+        if (index == NULL)
+            goto error;
+        r = PyDict_SetItem(plan->sp_kwargs, key, index);
+        Py_DECREF(index);
+        if (r < 0)
+            goto error;
+    }
+
+    /* checked positional arguments can be passed by keyword too (unless
+       there are separate checks for the keyword) */
+    for (i = 0; argnames != Py_None && i < plan->sp_nargs; i++) {
+        position = plan->sp_entries[i].se_position;
+        if (position >= PySequence_Fast_GET_SIZE(argnames))
+            break;
+        key = PySequence_Fast_GET_ITEM(argnames, position);
+        /* unpacked tuple parameters can't be passed by keyword */
+        if (!PyString_Check(key) || PyDict_GetItem(plan->sp_kwargs, key))
+            continue;
+        index = PyInt_FromSsize_t(i);
+        if (index == NULL)
+            goto error;
+        r = PyDict_SetItem(plan->sp_kwargs, key, index);
+        Py_DECREF(index);
+        if (r < 0)
+            goto error;
+    }
+
+    if (all_merits != Py_None) {
+        r = PyObject_Size(all_merits);
+        if (r < 0)
+            goto error;
+        if (r > 0) {
+            plan->sp_all = &plan->sp_entries[plan->sp_nentries++];
+            if (sink_entry_init(plan->sp_all, -1, all_merits) < 0)
+                goto error;
+            /* only strings passed directly are checked */
+            plan->sp_all->se_depth = 0;
+        }
+    }
+    Py_DECREF(args_merits);
+    Py_DECREF(argnames);
+    return (PyObject *)plan;
+
+error:
+    Py_DECREF(args_merits);
+    Py_DECREF(argnames);
+    Py_XDECREF(plan);
+    return NULL;
+}
+
+/* Check obj according to entry. Returns the same as check_object. */
+static PyObject *
+sinkplan_check_entry(sink_entry *entry, PyObject *obj, int sampled)
+{
+    PyObject *violation;
+    Py_ssize_t count = 0, index;
+
+    violation = check_object(obj, entry->se_merits, entry->se_required,
+                             entry->se_depth, &count, &index);
+    entry->se_checks += count;
+    if (sampled)
+        entry->se_sampled += count;
+    if (violation != NULL && violation != Py_None)
+        entry->se_violations[index]++;
+    return violation;
+}
+
+/* Check all the arguments according to entry. All of them are checked,
+   even after a violation, so that the counters include them. Returns the
+   first violation, or the same as check_object when there is none. */
+static PyObject *
+sinkplan_check_all(sink_entry *entry, PyObject *call_args,
+                   PyObject *call_kwargs, int sampled)
+{
+    PyObject *first = NULL, *violation, *key, *value;
+    Py_ssize_t i, pos = 0;
+
+    for (i = 0; ; i++) {
+        if (i < PyTuple_GET_SIZE(call_args))
+            value = PyTuple_GET_ITEM(call_args, i);
+        else if (!PyDict_Next(call_kwargs, &pos, &key, &value))
+            break;
+        Py_INCREF(value);
+        violation = sinkplan_check_entry(entry, value, sampled);
+        Py_DECREF(value);
+        if (violation == NULL) {
+            Py_XDECREF(first);
+            return NULL;
+        }
+        if (violation == Py_None || first != NULL)
+            Py_DECREF(violation);
+        else
+            first = violation;
+    }
+    if (first != NULL)
+        return first;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(sinkplan_check_doc,
+"check(args, kwargs, sampled) -> violation\n\
+\n\
+Check arguments of a sink call: tuple args and dict kwargs. sampled tells\n\
+whether data was sampled, for the check counters. Returns None if they pass,\n\
+otherwise the first violation found, as returned by _taint.check().");
+
+static PyObject *
+sinkplan_check(SinkPlanObject *plan, PyObject *args)
+{
+    PyObject *call_args, *call_kwargs, *key, *value, *index, *violation;
+    Py_ssize_t i, pos;
+    int sampled;
+
+    if (!PyArg_ParseTuple(args, "O!O!i:check", &PyTuple_Type, &call_args,
+                          &PyDict_Type, &call_kwargs, &sampled))
+        return NULL;
+
+    if (plan->sp_all != NULL) {
+        violation = sinkplan_check_all(plan->sp_all, call_args, call_kwargs,
+                                       sampled);
+        if (violation != Py_None)
+            return violation;
+        Py_DECREF(violation);
+    }
+
+    for (i = 0; i < plan->sp_nargs; i++) {
+        if (plan->sp_entries[i].se_position >= PyTuple_GET_SIZE(call_args))
+            break;
+        violation = sinkplan_check_entry(
+            &plan->sp_entries[i],
+            PyTuple_GET_ITEM(call_args, plan->sp_entries[i].se_position),
+            sampled);
+        if (violation != Py_None)
+            return violation;
+        Py_DECREF(violation);
+    }
+
+    if (PyDict_Size(plan->sp_kwargs) == 0)
+        Py_RETURN_NONE;
+    pos = 0;
+    while (PyDict_Next(call_kwargs, &pos, &key, &value)) {
+        index = PyDict_GetItem(plan->sp_kwargs, key);
+        if (index == NULL)
+            continue;
+        Py_INCREF(value);
+        violation = sinkplan_check_entry(
+            &plan->sp_entries[PyInt_AS_LONG(index)], value, sampled);
+        Py_DECREF(value);
+        if (violation != Py_None)
+            return violation;
+        Py_DECREF(violation);
+    }
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(sinkplan_stats_doc,
+"stats() -> dict\n\
+\n\
+Return counters of checks done by the plan: a dict mapping each merit\n\
+checked for to a tuple (checks, sampled, violations).");
+
+static PyObject *
+sinkplan_stats(SinkPlanObject *plan)
+{
+    PyObject *result, *merit, *old, *counts;
+    Py_ssize_t i, j, checks, sampled, violations;
+    sink_entry *entry;
+
+    result = PyDict_New();
+    if (result == NULL)
+        return NULL;
+    for (i = 0; i < plan->sp_nentries; i++) {
+        entry = &plan->sp_entries[i];
+        for (j = 0; j < PyTuple_GET_SIZE(entry->se_merits); j++) {
+            if (entry->se_checks == 0 && entry->se_violations[j] == 0)
+                continue;
+            merit = PyTuple_GET_ITEM(entry->se_merits, j);
+            checks = entry->se_checks;
+            sampled = entry->se_sampled;
+            violations = entry->se_violations[j];
+            old = PyDict_GetItem(result, merit);
+            if (old != NULL) {
+                checks += PyInt_AsSsize_t(PyTuple_GET_ITEM(old, 0));
+                sampled += PyInt_AsSsize_t(PyTuple_GET_ITEM(old, 1));
+                violations += PyInt_AsSsize_t(PyTuple_GET_ITEM(old, 2));
+            }
+            counts = Py_BuildValue("(nnn)", checks, sampled, violations);
+            if (counts == NULL || PyDict_SetItem(result, merit, counts) < 0) {
+                Py_XDECREF(counts);
+                Py_DECREF(result);
+                return NULL;
+            }
+            Py_DECREF(counts);
+        }
+    }
+    return result;
+}
+
+PyDoc_STRVAR(sinkplan_reset_stats_doc,
+"reset_stats()\n\
+\n\
+Zero the check counters of the plan.");
+
+static PyObject *
+sinkplan_reset_stats(SinkPlanObject *plan)
+{
+    Py_ssize_t i;
+    sink_entry *entry;
+
+    for (i = 0; i < plan->sp_nentries; i++) {
+        entry = &plan->sp_entries[i];
+        entry->se_checks = entry->se_sampled = 0;
+        memset(entry->se_violations, 0,
+               PyTuple_GET_SIZE(entry->se_merits) * sizeof(Py_ssize_t));
+    }
+    Py_RETURN_NONE;
+}
+
+static PyObject *
+sinkplan_get_empty(SinkPlanObject *plan, void *closure)
+{
+    return PyBool_FromLong(plan->sp_nentries == 0);
+}
+
+static PyMethodDef sinkplan_methods[] = {
+    {"check", (PyCFunction)sinkplan_check,
+        METH_VARARGS, sinkplan_check_doc},
+    {"stats", (PyCFunction)sinkplan_stats,
+        METH_NOARGS, sinkplan_stats_doc},
+    {"reset_stats", (PyCFunction)sinkplan_reset_stats,
+        METH_NOARGS, sinkplan_reset_stats_doc},
+    {NULL, NULL} /* sentinel */
+};
+
+static PyGetSetDef sinkplan_getset[] = {
+    {"empty", (getter)sinkplan_get_empty, NULL,
+     "True if the plan has nothing to check."},
+    {NULL} /* sentinel */
+};
+
+PyDoc_STRVAR(sinkplan_doc,
+"SinkPlan(args_merits, kwargs_merits[, merits[, argnames]])\n\
+\n\
+Checks of arguments of a sink: args_merits is a sequence of the merits\n\
+required for each positional argument, kwargs_merits a dict of merits\n\
+required for keyword arguments. Arguments which aren't listed there aren't\n\
+checked, except with merits, which are required for all the arguments\n\
+(only for strings passed directly, not for ones inside containers).\n\
+argnames are the names of the positional parameters of the sink, so that\n\
+the positional checks apply to arguments passed by keyword too.");
+
+static PyTypeObject SinkPlan_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.SinkPlan",                          /* tp_name */
+    sizeof(SinkPlanObject),                     /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)sinkplan_dealloc,               /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    0,                                          /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                         /* tp_flags */
+    sinkplan_doc,                               /* tp_doc */
+    0,                                          /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    offsetof(SinkPlanObject, sp_weakreflist),   /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    sinkplan_methods,                           /* tp_methods */
+    0,                                          /* tp_members */
+    sinkplan_getset,                            /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    0,                                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    0,                                          /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    sinkplan_new,                               /* tp_new */
+};
+
+PyDoc_STRVAR(propagation_cache_info_doc,
+"propagation_cache_info() -> dict\n\
+\n\
+Return statistics of the taint propagation cache: number of hits, misses,\n\
+evictions and invalidations, its size and the number of used entries.");
+
+static PyObject *
+propagation_cache_info(PyObject *self)
+{
+    PyTaint_PropagationCacheInfo info;
+
+    _PyTaint_GetPropagationCacheInfo(&info);
+    return Py_BuildValue("{sn,sn,sn,sn,sn,sn}",
+                         "hits", info.hits,
+                         "misses", info.misses,
+                         "evictions", info.evictions,
+                         "invalidations", info.invalidations,
+                         "size", info.size,
+                         "used", info.used);
+}
+
+PyDoc_STRVAR(propagation_cache_clear_doc,
+"propagation_cache_clear()\n\
+\n\
+Drop all entries of the taint propagation cache and reset its statistics.");
+
+static PyObject *
+propagation_cache_clear(PyObject *self)
+{
+    _PyTaint_ClearPropagationCache();
+    _PyTaint_ResetPropagationCacheInfo();
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(tainted_chars_clear_doc,
+"tainted_chars_clear()\n\
+\n\
+Drop the cached tainted one character and empty strings (str and unicode).");
+
+static PyObject *
+tainted_chars_clear(PyObject *self)
+{
+    _PyString_ClearTaintedChars();
+#ifdef Py_USING_UNICODE
+    _PyUnicode_ClearTaintedChars();
+#endif
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(push_propagation_doc,
+"push_propagation(merit, propagation)\n\
+\n\
+Make merit (and its subclasses which inherit its propagation) propagate\n\
+according to propagation (one of Merit.*Propagation) in the current thread,\n\
+until the matching pop_propagation() call. The merit classes themselves\n\
+aren't modified.");
+
+static PyObject *
+push_propagation(PyObject *self, PyObject *args)
+{
+    PyObject *merit, *propagation;
+
+    if (!PyArg_UnpackTuple(args, "push_propagation", 2, 2,
+                           &merit, &propagation))
+        return NULL;
+    if (_PyMerit_PushOverride(merit, propagation) < 0)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(pop_propagation_doc,
+"pop_propagation()\n\
+\n\
+Undo the most recent push_propagation() call of the current thread.");
+
+static PyObject *
+pop_propagation(PyObject *self)
+{
+    if (_PyMerit_PopOverride() < 0)
+        return NULL;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(set_enabled_doc,
+"set_enabled(flag)\n\
+\n\
+Turn taint tracking on or off for the whole interpreter. While it's off,\n\
+tainting and propagation give clean strings.");
+
+static PyObject *
+set_enabled(PyObject *self, PyObject *flag)
+{
+    int enabled = PyObject_IsTrue(flag);
+
+    if (enabled < 0)
+        return NULL;
+    _PyTaint_Enabled = enabled;
+    Py_RETURN_NONE;
+}
+
+PyDoc_STRVAR(is_enabled_doc,
+"is_enabled() -> bool\n\
+\n\
+Return whether taint tracking is on.");
+
+static PyObject *
+is_enabled(PyObject *self)
+{
+    return PyBool_FromLong(_PyTaint_Enabled);
+}
+
+PyDoc_STRVAR(intern_doc,
+"intern(string) -> string\n\
+\n\
+Like the intern builtin, but accepts tainted strings too. Tainted strings\n\
+are interned in a separate table, keyed by both their value and taint, so\n\
+the result always has the same merits as string.");
+
+static PyObject *
+taint_intern(PyObject *self, PyObject *s)
+{
+    if (!PyString_CheckExact(s)) {
+        PyErr_Format(PyExc_TypeError,
+                     "intern() argument must be str, not %.200s",
+                     Py_TYPE(s)->tp_name);
+        return NULL;
+    }
+    Py_INCREF(s);
+    PyString_InternInPlace(&s);
+    return s;
+}
+
+/* Wrappers of sources, cleaners and propagators. They are what the taint
+   decorators return: callables passing their arguments on to the wrapped
+   function as they are, and tainting the result. Like functools.wraps, they
+   take __module__, __name__, __doc__ and __dict__ of the wrapped function,
+   which is kept in __wrapped__. They are bound as methods like functions, so
+   that methods can be wrapped too. */
+
+typedef struct {
+    PyObject_HEAD
+    PyObject *fw_func;          /* the wrapped function */
+    PyObject *fw_merit;         /* cleaners: merit given to the result */
+    PyObject *fw_sample;        /* sources: callable deciding whether to
+                                   taint, NULL to taint always */
+    PyObject *fw_sampling;      /* sources: object to set sampled on */
+    int fw_tainted;             /* propagators: taint with no merits */
+    int fw_lazy;                /* sources and propagators: give views of
+                                   containers */
+    PyObject *fw_dict;
+    PyObject *fw_weakreflist;
+} WrapperObject;
+
+static PyTypeObject SourceWrapper_Type;
+static PyTypeObject CleanerWrapper_Type;
+static PyTypeObject PropagatorWrapper_Type;
+
+/* Return a new wrapper of func of given type, with attributes of func. */
+static WrapperObject *
+wrapper_new(PyTypeObject *type, PyObject *func)
+{
+    static char *names[] = {"__module__", "__name__", "__doc__", NULL};
+    WrapperObject *w;
+    PyObject *value;
+    char **name;
+
+    if (!PyCallable_Check(func)) {
+        PyErr_Format(PyExc_TypeError, "'%.200s' object is not callable",
+                     Py_TYPE(func)->tp_name);
+        return NULL;
+    }
+    w = (WrapperObject *)type->tp_alloc(type, 0);
+    if (w == NULL)
+        return NULL;
+    Py_INCREF(func);
+    w->fw_func = func;
+    w->fw_dict = PyDict_New();
+    if (w->fw_dict == NULL)
+        goto error;
+    value = PyObject_GetAttrString(func, "__dict__");
+    if (value == NULL)
+        PyErr_Clear();
+    else {
+        if (PyDict_Check(value) && PyDict_Update(w->fw_dict, value) < 0) {
+            Py_DECREF(value);
+            goto error;
+        }
+        Py_DECREF(value);
+    }
+    for (name = names; *name != NULL; name++) {
+        value = PyObject_GetAttrString(func, *name);
+        if (value == NULL) {
+            if (!PyErr_ExceptionMatches(PyExc_AttributeError))
+                goto error;
+            PyErr_Clear();
+            continue;
+        }
+        if (PyDict_SetItemString(w->fw_dict, *name, value) < 0) {
+            Py_DECREF(value);
+            goto error;
+        }
+        Py_DECREF(value);
+    }
+    return w;
+
+error:
+    Py_DECREF(w);
+    return NULL;
+}
+
+static int
+wrapper_clear(WrapperObject *w)
+{
+    Py_CLEAR(w->fw_func);
+    Py_CLEAR(w->fw_merit);
+    Py_CLEAR(w->fw_sample);
+    Py_CLEAR(w->fw_sampling);
+    Py_CLEAR(w->fw_dict);
+    return 0;
+}
+
+static void
+wrapper_dealloc(WrapperObject *w)
+{
+    PyObject_GC_UnTrack(w);
+    if (w->fw_weakreflist != NULL)
+        PyObject_ClearWeakRefs((PyObject *)w);
+    wrapper_clear(w);
+    Py_TYPE(w)->tp_free((PyObject *)w);
+}
+
+static int
+wrapper_traverse(WrapperObject *w, visitproc visit, void *arg)
+{
+    Py_VISIT(w->fw_func);
+    Py_VISIT(w->fw_merit);
+    Py_VISIT(w->fw_sample);
+    Py_VISIT(w->fw_sampling);
+    Py_VISIT(w->fw_dict);
+    return 0;
+}
+
+static PyObject *
+wrapper_repr(WrapperObject *w)
+{
+    PyObject *repr, *result;
+
+    repr = PyObject_Repr(w->fw_func);
+    if (repr == NULL)
+        return NULL;
+    result = PyString_FromFormat("<%s of %s>", Py_TYPE(w)->tp_name,
+                                 PyString_AsString(repr));
+    Py_DECREF(repr);
+    return result;
+}
+
+static PyObject *
+wrapper_descr_get(PyObject *w, PyObject *obj, PyObject *type)
+{
+    if (obj == Py_None)
+        obj = NULL;
+    return PyMethod_New(w, obj, type);
+}
+
+static PyObject *
+wrapper_get_dict(WrapperObject *w)
+{
+    Py_INCREF(w->fw_dict);
+    return w->fw_dict;
+}
+
+static int
+wrapper_set_dict(WrapperObject *w, PyObject *value)
+{
+    if (value == NULL || !PyDict_Check(value)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "__dict__ must be set to a dictionary");
+        return -1;
+    }
+    Py_INCREF(value);
+    Py_DECREF(w->fw_dict);
+    w->fw_dict = value;
+    return 0;
+}
+
+static PyGetSetDef wrapper_getset[] = {
+    {"__dict__", (getter)wrapper_get_dict, (setter)wrapper_set_dict},
+    {NULL} /* sentinel */
+};
+
+static PyMemberDef wrapper_members[] = {
+    {"__wrapped__", T_OBJECT, offsetof(WrapperObject, fw_func), READONLY},
+    {NULL} /* sentinel */
+};
+
+static PyObject *
+source_wrapper_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"func", "sample", "sampling", "lazy", NULL};
+    PyObject *func, *sample = Py_None, *sampling = Py_None;
+    int lazy = 0;
+    WrapperObject *w;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|OOi:SourceWrapper",
+                                     kwlist, &func, &sample, &sampling,
+                                     &lazy))
+        return NULL;
+    w = wrapper_new(type, func);
+    if (w == NULL)
+        return NULL;
+    w->fw_lazy = lazy;
+    if (sample != Py_None) {
+        Py_INCREF(sample);
+        w->fw_sample = sample;
+    }
+    if (sampling != Py_None) {
+        Py_INCREF(sampling);
+        w->fw_sampling = sampling;
+    }
+    return (PyObject *)w;
+}
+
+static PyObject *
+source_wrapper_call(WrapperObject *w, PyObject *args, PyObject *kwargs)
+{
+    static PyObject *sampled_str = NULL;
+    PyObject *result, *tainted;
+    PyTaintObject *taint;
+    taint_target target;
+    int sample;
+
+    if (!_PyTaint_Enabled)
+        return PyObject_Call(w->fw_func, args, kwargs);
+    if (w->fw_sample != NULL) {
+        result = PyObject_CallObject(w->fw_sample, NULL);
+        if (result == NULL)
+            return NULL;
+        sample = PyObject_IsTrue(result);
+        Py_DECREF(result);
+        if (sample < 0)
+            return NULL;
+        if (!sample)
+            return PyObject_Call(w->fw_func, args, kwargs);
+    }
+    if (w->fw_sampling != NULL) {
+        if (sampled_str == NULL) {
+            sampled_str = PyString_InternFromString("sampled");
+            if (sampled_str == NULL)
+                return NULL;
+        }
+        if (PyObject_SetAttr(w->fw_sampling, sampled_str, Py_True) < 0)
+            return NULL;
+    }
+
+    result = PyObject_Call(w->fw_func, args, kwargs);
+    if (result == NULL)
+        return NULL;
+    taint = PyTaint_EmptyMerits();
+    if (taint == NULL) {
+        Py_DECREF(result);
+        return NULL;
+    }
+    if (PyString_CheckExact(result) || PyUnicode_CheckExact(result)) {
+        /* tainted in place when nothing else references the result; steals
+           the reference to it when it succeeds */
+        tainted = PyTaint_AssignToObject(result, taint);
+        if (tainted == NULL)
+            Py_DECREF(result);
+    }
+    else {
+        target_init(&target, taint, w->fw_lazy);
+        tainted = taint_value(result, &target);
+        Py_DECREF(result);
+    }
+    Py_DECREF(taint);
+    return tainted;
+}
+
+PyDoc_STRVAR(source_wrapper_doc,
+"SourceWrapper(func[, sample[, sampling[, lazy]]])\n\
+\n\
+Wrapper of func returning its results tainted with no merits, as\n\
+taint_object does with the given lazy flag (strings nothing else refers to\n\
+are tainted in place). While taint tracking is off, or when sample is given\n\
+and sample() returns false, the results are returned untouched. Whenever a\n\
+result is tainted, the sampled attribute of sampling is set to True.");
+
+static PyTypeObject SourceWrapper_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.SourceWrapper",                     /* tp_name */
+    sizeof(WrapperObject),                      /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)wrapper_dealloc,                /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)wrapper_repr,                     /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    (ternaryfunc)source_wrapper_call,           /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    PyObject_GenericSetAttr,                    /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    source_wrapper_doc,                         /* tp_doc */
+    (traverseproc)wrapper_traverse,             /* tp_traverse */
+    (inquiry)wrapper_clear,                     /* tp_clear */
+    0,                                          /* tp_richcompare */
+    offsetof(WrapperObject, fw_weakreflist),    /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    0,                                          /* tp_methods */
+    wrapper_members,                            /* tp_members */
+    wrapper_getset,                             /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    wrapper_descr_get,                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    offsetof(WrapperObject, fw_dict),           /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    source_wrapper_new,                         /* tp_new */
+};
+
+static PyObject *
+cleaner_wrapper_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"func", "merit", NULL};
+    PyObject *func, *merit;
+    WrapperObject *w;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "OO:CleanerWrapper",
+                                     kwlist, &func, &merit))
+        return NULL;
+    w = wrapper_new(type, func);
+    if (w == NULL)
+        return NULL;
+    Py_INCREF(merit);
+    w->fw_merit = merit;
+    return (PyObject *)w;
+}
+
+static PyObject *
+cleaner_wrapper_call(WrapperObject *w, PyObject *args, PyObject *kwargs)
+{
+    static PyObject *cleanfor_str = NULL;
+    PyObject *result, *cleaned;
+    PyTaintObject *taint, *merits;
+
+    result = PyObject_Call(w->fw_func, args, kwargs);
+    if (result == NULL)
+        return NULL;
+    if (!(PyString_CheckExact(result) || PyUnicode_CheckExact(result))) {
+        if (cleanfor_str == NULL) {
+            cleanfor_str = PyString_InternFromString("_cleanfor");
+            if (cleanfor_str == NULL)
+                goto error;
+        }
+        cleaned = PyObject_CallMethodObjArgs(result, cleanfor_str,
+                                             w->fw_merit, NULL);
+        Py_DECREF(result);
+        return cleaned;
+    }
+
+    /* same as result._cleanfor(merit), but in place when nothing else
+       references the result */
+    if (_PyTaint_ValidMerit(w->fw_merit) == -1)
+        goto error;
+    taint = PyString_Check(result) ? PyString_GET_MERITS(result) :
+                                     PyUnicode_GET_MERITS(result);
+    if (taint == NULL) {
+        taint = PyTaint_EmptyMerits();
+        if (taint == NULL)
+            goto error;
+    }
+    else
+        Py_INCREF(taint);
+    merits = _PyTaint_AddMerit(taint, w->fw_merit);
+    Py_DECREF(taint);
+    if (merits == NULL)
+        goto error;
+    /* steals the reference to result when it succeeds */
+    cleaned = PyTaint_AssignToObject(result, merits);
+    Py_DECREF(merits);
+    if (cleaned == NULL)
+        goto error;
+    return cleaned;
+
+error:
+    Py_DECREF(result);
+    return NULL;
+}
+
+PyDoc_STRVAR(cleaner_wrapper_doc,
+"CleanerWrapper(func, merit)\n\
+\n\
+Wrapper of func returning result._cleanfor(merit) for each result of func\n\
+(strings nothing else refers to get the merit in place).");
+
+static PyTypeObject CleanerWrapper_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.CleanerWrapper",                    /* tp_name */
+    sizeof(WrapperObject),                      /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)wrapper_dealloc,                /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)wrapper_repr,                     /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    (ternaryfunc)cleaner_wrapper_call,          /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    PyObject_GenericSetAttr,                    /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    cleaner_wrapper_doc,                        /* tp_doc */
+    (traverseproc)wrapper_traverse,             /* tp_traverse */
+    (inquiry)wrapper_clear,                     /* tp_clear */
+    0,                                          /* tp_richcompare */
+    offsetof(WrapperObject, fw_weakreflist),    /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    0,                                          /* tp_methods */
+    wrapper_members,                            /* tp_members */
+    wrapper_getset,                             /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    wrapper_descr_get,                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    offsetof(WrapperObject, fw_dict),           /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    cleaner_wrapper_new,                        /* tp_new */
+};
+
+static PyObject *
+propagator_wrapper_new(PyTypeObject *type, PyObject *args, PyObject *kwargs)
+{
+    static char *kwlist[] = {"func", "tainted", "lazy", NULL};
+    PyObject *func;
+    int tainted = 0, lazy = 0;
+    WrapperObject *w;
+
+    if (!PyArg_ParseTupleAndKeywords(args, kwargs, "O|ii:PropagatorWrapper",
+                                     kwlist, &func, &tainted, &lazy))
+        return NULL;
+    w = wrapper_new(type, func);
+    if (w == NULL)
+        return NULL;
+    w->fw_tainted = tainted;
+    w->fw_lazy = lazy;
+    return (PyObject *)w;
+}
+
+static PyObject *
+propagator_wrapper_call(WrapperObject *w, PyObject *args, PyObject *kwargs)
+{
+    PyObject *result, *tainted;
+    PyTaintObject *taint = NULL, *empty, *propagated = NULL;
+    taint_target target;
+    int r;
+
+    if (collect_args(args, kwargs, &taint) < 0)
+        return NULL;
+    if (w->fw_tainted) {
+        /* propagated with no merits, so clean arguments give no merits */
+        empty = PyTaint_EmptyMerits();
+        if (empty == NULL)
+            goto error;
+        r = PyTaint_PropagationResult(&propagated, taint, empty);
+        Py_DECREF(empty);
+        if (r == -1)
+            goto error;
+        Py_XDECREF(taint);
+        taint = propagated;
+    }
+    result = PyObject_Call(w->fw_func, args, kwargs);
+    if (result == NULL)
+        goto error;
+    target_init(&target, taint, w->fw_lazy);
+    tainted = taint_value(result, &target);
+    Py_DECREF(result);
+    Py_XDECREF(taint);
+    return tainted;
+
+error:
+    Py_XDECREF(taint);
+    return NULL;
+}
+
+PyDoc_STRVAR(propagator_wrapper_doc,
+"PropagatorWrapper(func[, tainted[, lazy]])\n\
+\n\
+Wrapper of func returning its results tainted with taint propagated from\n\
+the arguments (and from no merits, when tainted is set), as taint_object\n\
+does with the given lazy flag.");
+
+static PyTypeObject PropagatorWrapper_Type = {
+    PyVarObject_HEAD_INIT(NULL, 0)
+    "_taint.PropagatorWrapper",                 /* tp_name */
+    sizeof(WrapperObject),                      /* tp_basicsize */
+    0,                                          /* tp_itemsize */
+    (destructor)wrapper_dealloc,                /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    (reprfunc)wrapper_repr,                     /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    (ternaryfunc)propagator_wrapper_call,       /* tp_call */
+    0,                                          /* tp_str */
+    PyObject_GenericGetAttr,                    /* tp_getattro */
+    PyObject_GenericSetAttr,                    /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_HAVE_GC,    /* tp_flags */
+    propagator_wrapper_doc,                     /* tp_doc */
+    (traverseproc)wrapper_traverse,             /* tp_traverse */
+    (inquiry)wrapper_clear,                     /* tp_clear */
+    0,                                          /* tp_richcompare */
+    offsetof(WrapperObject, fw_weakreflist),    /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    0,                                          /* tp_methods */
+    wrapper_members,                            /* tp_members */
+    wrapper_getset,                             /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    wrapper_descr_get,                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    offsetof(WrapperObject, fw_dict),           /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    propagator_wrapper_new,                     /* tp_new */
+};
+
+static PyMethodDef taint_methods[] = {
+    {"get_taint", (PyCFunction)get_taint,
+        METH_O, get_taint_doc},
+    {"propagate", (PyCFunction)propagate,
+        METH_VARARGS, propagate_doc},
+    {"collect_taint", (PyCFunction)collect_taint,
+        METH_VARARGS, collect_taint_doc},
+    {"taint_object", (PyCFunction)taint_object,
+        METH_VARARGS, taint_object_doc},
+    {"check", (PyCFunction)check,
+        METH_VARARGS, check_doc},
+    {"propagation_cache_info", (PyCFunction)propagation_cache_info,
+        METH_NOARGS, propagation_cache_info_doc},
+    {"propagation_cache_clear", (PyCFunction)propagation_cache_clear,
+        METH_NOARGS, propagation_cache_clear_doc},
+    {"tainted_chars_clear", (PyCFunction)tainted_chars_clear,
+        METH_NOARGS, tainted_chars_clear_doc},
+    {"push_propagation", (PyCFunction)push_propagation,
+        METH_VARARGS, push_propagation_doc},
+    {"pop_propagation", (PyCFunction)pop_propagation,
+        METH_NOARGS, pop_propagation_doc},
+    {"set_enabled", (PyCFunction)set_enabled,
+        METH_O, set_enabled_doc},
+    {"is_enabled", (PyCFunction)is_enabled,
+        METH_NOARGS, is_enabled_doc},
+    {"intern", (PyCFunction)taint_intern,
+        METH_O, intern_doc},
+    {NULL, NULL} /* sentinel */
+};
+
+PyDoc_STRVAR(module_doc,
+"Low level helpers for taint tracking.\n\
+\n\
+This module exposes internals of the taint propagation machinery. Use the\n\
+taint module instead.\n");
+
+PyMODINIT_FUNC
+init_taint(void)
+{
+    PyObject *m;
+
+    m = Py_InitModule3("_taint", taint_methods, module_doc);
+    if (m == NULL)
+        return;
+    if (PyType_Ready(&SinkPlan_Type) < 0)
+        return;
+    Py_INCREF(&SinkPlan_Type);
+    PyModule_AddObject(m, "SinkPlan", (PyObject *)&SinkPlan_Type);
+    if (PyType_Ready(&Proxy_Type) < 0)
+        return;
+    Py_INCREF(&Proxy_Type);
+    PyModule_AddObject(m, "Proxy", (PyObject *)&Proxy_Type);
+    if (PyType_Ready(&TaintedList_Type) < 0 ||
+        PyType_Ready(&TaintedTuple_Type) < 0 ||
+        PyType_Ready(&TaintedDict_Type) < 0 ||
+        PyType_Ready(&TaintedIterator_Type) < 0)
+        return;
+    Py_INCREF(&TaintedList_Type);
+    PyModule_AddObject(m, "TaintedList", (PyObject *)&TaintedList_Type);
+    Py_INCREF(&TaintedTuple_Type);
+    PyModule_AddObject(m, "TaintedTuple", (PyObject *)&TaintedTuple_Type);
+    Py_INCREF(&TaintedDict_Type);
+    PyModule_AddObject(m, "TaintedDict", (PyObject *)&TaintedDict_Type);
+    Py_INCREF(&TaintedIterator_Type);
+    PyModule_AddObject(m, "TaintedIterator",
+                       (PyObject *)&TaintedIterator_Type);
+    if (bare_iter_count == 0) {
+        PyObject *list;
+
+        bare_iter_types[bare_iter_count++] = &TaintedIterator_Type;
+        bare_iter_types[bare_iter_count++] = &PyGen_Type;
+        bare_iter_types[bare_iter_count++] = &PySeqIter_Type;
+        bare_iter_types[bare_iter_count++] = &PyCallIter_Type;
+        bare_iter_types[bare_iter_count++] = &PyDictIterKey_Type;
+        bare_iter_types[bare_iter_count++] = &PyDictIterValue_Type;
+        bare_iter_types[bare_iter_count++] = &PyDictIterItem_Type;
+        list = PyList_New(0);
+        if (list == NULL)
+            return;
+        if (add_bare_iter_type(PyObject_CallMethod(list, "__reversed__",
+                                                   NULL)) < 0) {
+            Py_DECREF(list);
+            return;
+        }
+        if (add_bare_iter_type(list) < 0 ||
+            add_bare_iter_type(PyTuple_New(0)) < 0 ||
+            add_bare_iter_type(PySet_New(NULL)) < 0 ||
+            add_bare_iter_type(PyObject_CallFunction(
+                                (PyObject *)&PyRange_Type, "i", 0)) < 0)
+            return;
+    }
+    if (PyType_Ready(&SourceWrapper_Type) < 0 ||
+        PyType_Ready(&CleanerWrapper_Type) < 0 ||
+        PyType_Ready(&PropagatorWrapper_Type) < 0)
+        return;
+    Py_INCREF(&SourceWrapper_Type);
+    PyModule_AddObject(m, "SourceWrapper", (PyObject *)&SourceWrapper_Type);
+    Py_INCREF(&CleanerWrapper_Type);
+    PyModule_AddObject(m, "CleanerWrapper",
+                       (PyObject *)&CleanerWrapper_Type);
+    Py_INCREF(&PropagatorWrapper_Type);
+    PyModule_AddObject(m, "PropagatorWrapper",
+                       (PyObject *)&PropagatorWrapper_Type);
+}
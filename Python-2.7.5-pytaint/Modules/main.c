@@ -40,7 +40,7 @@ static char **orig_argv;
 static int  orig_argc;
 
 /* command line options */
-#define BASE_OPTS "3bBc:dEhiJm:OQ:RsStuUvVW:xX?"
+#define BASE_OPTS "3bBc:dEhiJm:OQ:RsStuUvVW:xX:?"
 
 #ifndef RISCOS
 #define PROGRAM_OPTS BASE_OPTS
@@ -88,6 +88,7 @@ static char *usage_3 = "\
 -W arg : warning control; arg is action:message:category:module:lineno\n\
          also PYTHONWARNINGS=arg\n\
 -x     : skip first line of source, allowing use of non-Unix forms of #!cmd\n\
+-X notaint : disable taint tracking; also PYTHONNOTAINT=x\n\
 ";
 static char *usage_4 = "\
 -3     : warn about Python 3.x incompatibilities that 2to3 cannot trivially fix\n\
@@ -409,7 +410,15 @@ Py_Main(int argc, char **argv)
             skipfirstline = 1;
             break;
 
-        /* case 'X': reserved for implementation-specific arguments */
+        case 'X':
+            /* implementation-specific arguments */
+            if (strcmp(_PyOS_optarg, "notaint") == 0)
+                Py_NoTaintFlag++;
+            else {
+                fprintf(stderr, "Unknown -X option: %s\n", _PyOS_optarg);
+                return usage(2, argv[0]);
+            }
+            break;
 
         case 'U':
             Py_UnicodeFlag++;
@@ -1,41 +1,74 @@
 #define PY_SSIZE_T_CLEAN
 
 #include <Python.h>
+#include "structmember.h"
 
 typedef struct {
     PyObject_HEAD
-} PyMeritObject;
+    char ob_strat;
+} PyPropagationObject;
 
 static void
-Merit_dealloc(PyObject* self)
+Propagation_dealloc(PyObject* self)
 {
     Py_TYPE(self)->tp_free(self);
 }
 
+static char *propagation_names[3] = {
+    "Full",
+    "None",
+    "Partial"
+};
+
+#define PROPAGATION_NAMES_SIZE \
+    (sizeof(propagation_names)/sizeof(*propagation_names))
+
+PyObject *
+Propagation_repr(PyObject* self) {
+    int s = (int)((PyPropagationObject*)self)->ob_strat;
+    if (s >= 0 && s < PROPAGATION_NAMES_SIZE)
+        return PyString_FromFormat("<taint.Merit.%sPropagation>",
+                                   propagation_names[s]);
+
+    // TODO(marcinf) what should happen here - exception or exit?
+    return NULL;
+}
+
+PyObject *
+Propagation_str(PyObject* self) {
+    int s = (int)((PyPropagationObject*)self)->ob_strat;
+    if (s >= 0 && s < PROPAGATION_NAMES_SIZE)
+        return PyString_FromFormat("<%sPropagation>",
+                                   propagation_names[s]);
+
+    // TODO(marcinf) what should happen here - exception or exit?
+    return NULL;
+}
+
 
-PyTypeObject PyMerit_MeritType = {
+PyTypeObject PyMerit_PropagationType = {
     PyObject_HEAD_INIT(NULL)
     0,                                          /* ob_size */
-    "taint.Merit",                              /* tp_name */
-    sizeof(PyMeritObject),                      /* tp_basicsize */
+    "taint.Propagation",                        /* tp_name */
+    sizeof(PyPropagationObject),                /* tp_basicsize */
     0,                                          /* tp_itemsize */
-    (destructor)Merit_dealloc,                  /* tp_dealloc */
+    (destructor)Propagation_dealloc,            /* tp_dealloc */
     0,                                          /* tp_print */
     0,                                          /* tp_getattr */
     0,                                          /* tp_setattr */
     0,                                          /* tp_compare */
-    0,                                          /* tp_repr */
+    Propagation_repr,                           /* tp_repr */
     0,                                          /* tp_as_number */
     0,                                          /* tp_as_sequence */
     0,                                          /* tp_as_mapping */
     0,                                          /* tp_hash */
     0,                                          /* tp_call */
-    0,                                          /* tp_str */
+    Propagation_str,                            /* tp_str */
     0,                                          /* tp_getattro */
     0,                                          /* tp_setattro */
     0,                                          /* tp_as_buffer */
     Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,   /* tp_flags */
-    "Merit object",                             /* tp_doc */
+    "Propagation object",                       /* tp_doc */
     0,                                          /* tp_traverse */
     0,                                          /* tp_clear */
     0,                                          /* tp_richcompare */
@@ -56,72 +89,483 @@ PyTypeObject PyMerit_MeritType = {
     0,                                          /* tp_free */
 };
 
-typedef struct {
-    PyObject_HEAD
-    char ob_strat;
-} PyPropagationObject;
+PyObject *_PyMerit_FullPropagation;
+PyObject *_PyMerit_PartialPropagation;
+PyObject *_PyMerit_NonePropagation;
 
-static void
-Propagation_dealloc(PyObject* self)
+static PyObject *propagation_str = NULL;
+
+static int
+strategy_of_propagation(PyObject *p)
 {
-    Py_TYPE(self)->tp_free(self);
+    if (p != NULL && Py_TYPE(p) == &PyMerit_PropagationType)
+        return (int)((PyPropagationObject*)p)->ob_strat;
+    return PyMerit_STRATEGY_INVALID;
 }
 
-static char *propagation_names[3] = {
-    "Full",
-    "None",
-    "Partial"
-};
+int
+_PyMerit_GetStrategy(PyObject *m)
+{
+    PyObject *p;
+    int strategy;
 
-#define PROPAGATION_NAMES_SIZE \
-    (sizeof(propagation_names)/sizeof(*propagation_names))
+    if (PyMerit_Check(m))
+        return ((PyMeritTypeObject*)m)->mt_strategy;
 
-PyObject *
-Propagation_repr(PyObject* self) {
-    int s = (int)((PyPropagationObject*)self)->ob_strat;
-    if (s >= 0 && s < PROPAGATION_NAMES_SIZE)
-        return PyString_FromFormat("<taint.Merit.%sPropagation>",
-                                   propagation_names[s]);
+    p = PyObject_GetAttrString(m, "propagation");
+    if (p == NULL) {
+        PyErr_Clear();
+        return PyMerit_STRATEGY_INVALID;
+    }
+    strategy = strategy_of_propagation(p);
+    Py_DECREF(p);
+    return strategy;
+}
 
-    // TODO(marcinf) what should happen here - exception or exit?
-    return NULL;
+/* Registry of merit classes, indexed by their ids. It holds borrowed
+   references - a merit class removes itself from it when deallocated. Ids
+   are never reused, since dead merits' bits may still be set in existing
+   taint objects. */
+static PyObject **merit_registry = NULL;
+static Py_ssize_t merit_registry_size = 0;
+static Py_ssize_t merit_registry_allocated = 0;
+
+PyTaint_Word *_PyMerit_FullMask = NULL;
+PyTaint_Word *_PyMerit_KeepMask = NULL;
+PyTaint_Word *_PyMerit_InvalidMask = NULL;
+Py_ssize_t _PyMerit_MaskVersion = 0;
+
+static int
+resize_mask(PyTaint_Word **mask, Py_ssize_t old_words, Py_ssize_t new_words)
+{
+    PyTaint_Word *m = PyMem_RESIZE(*mask, PyTaint_Word, new_words);
+    if (m == NULL)
+        return -1;
+    memset(m + old_words, 0, (new_words - old_words) * sizeof(PyTaint_Word));
+    *mask = m;
+    return 0;
+}
+
+/* Assign a new id to merit class m. Returns -1 (with MemoryError set) on
+   failure, 0 on success. */
+static int
+merit_register(PyMeritTypeObject *m)
+{
+    Py_ssize_t allocated, old_words, new_words;
+    PyObject **registry;
+
+    if (merit_registry_size == merit_registry_allocated) {
+        allocated = merit_registry_allocated ?
+            2 * merit_registry_allocated : PyTaint_WORD_BITS;
+        registry = PyMem_RESIZE(merit_registry, PyObject*, allocated);
+        if (registry == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        merit_registry = registry;
+        old_words = merit_registry_allocated / PyTaint_WORD_BITS;
+        new_words = allocated / PyTaint_WORD_BITS;
+        if (resize_mask(&_PyMerit_FullMask, old_words, new_words) < 0 ||
+            resize_mask(&_PyMerit_KeepMask, old_words, new_words) < 0 ||
+            resize_mask(&_PyMerit_InvalidMask, old_words, new_words) < 0) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        merit_registry_allocated = allocated;
+        _PyMerit_MaskVersion++;
+    }
+    m->mt_id = merit_registry_size++;
+    merit_registry[m->mt_id] = (PyObject*)m;
+    return 0;
 }
 
 PyObject *
-Propagation_str(PyObject* self) {
-    int s = (int)((PyPropagationObject*)self)->ob_strat;
-    if (s >= 0 && s < PROPAGATION_NAMES_SIZE)
-        return PyString_FromFormat("<%sPropagation>",
-                                   propagation_names[s]);
+_PyMerit_FromId(Py_ssize_t id)
+{
+    if (id < 0 || id >= merit_registry_size)
+        return NULL;
+    return merit_registry[id];
+}
 
-    // TODO(marcinf) what should happen here - exception or exit?
-    return NULL;
+/* Set bit of merit id in the masks according to strategy. */
+static void
+masks_set_strategy(PyTaint_Word *full, PyTaint_Word *keep,
+                   PyTaint_Word *invalid, Py_ssize_t id, int strategy)
+{
+    Py_ssize_t w = PyTaint_WORD_INDEX(id);
+    PyTaint_Word bit = PyTaint_WORD_BIT(id);
+
+    full[w] &= ~bit;
+    keep[w] &= ~bit;
+    invalid[w] &= ~bit;
+    switch (strategy) {
+    case PyMerit_STRATEGY_FULL:
+        full[w] |= bit;
+        keep[w] |= bit;
+        break;
+    case PyMerit_STRATEGY_PARTIAL:
+        keep[w] |= bit;
+        break;
+    case PyMerit_STRATEGY_NONE:
+        break;
+    default:
+        invalid[w] |= bit;
+    }
 }
 
+/* Set strategy of merit class m and update the strategy masks accordingly. */
+static void
+merit_set_strategy(PyMeritTypeObject *m, int strategy)
+{
+    m->mt_strategy = strategy;
+    _PyMerit_MaskVersion++;
+    masks_set_strategy(_PyMerit_FullMask, _PyMerit_KeepMask,
+                       _PyMerit_InvalidMask, m->mt_id, strategy);
+}
 
-PyTypeObject PyMerit_PropagationType = {
-    PyObject_HEAD_INIT(NULL)
+/* Recompute cached propagation strategy of merit class type and all of its
+   subclasses (which might inherit the propagation attribute from it). */
+static void
+merittype_update_strategy(PyTypeObject *type)
+{
+    PyObject *subclasses, *ref;
+    PyTypeObject *subclass;
+    Py_ssize_t i, n;
+    int strategy;
+
+    assert(PyMerit_Check(type));
+    strategy = strategy_of_propagation(_PyType_Lookup(type, propagation_str));
+    if (((PyMeritTypeObject*)type)->mt_strategy != strategy) {
+        merit_set_strategy((PyMeritTypeObject*)type, strategy);
+        /* Cached propagation results may depend on the old strategy. */
+        _PyTaint_ClearPropagationCache();
+    }
+
+    subclasses = type->tp_subclasses;
+    if (subclasses == NULL)
+        return;
+    assert(PyList_Check(subclasses));
+    n = PyList_GET_SIZE(subclasses);
+    for (i = 0; i < n; i++) {
+        ref = PyList_GET_ITEM(subclasses, i);
+        assert(PyWeakref_CheckRef(ref));
+        subclass = (PyTypeObject *)PyWeakref_GET_OBJECT(ref);
+        if ((PyObject *)subclass == Py_None || !PyMerit_Check(subclass))
+            continue;
+        merittype_update_strategy(subclass);
+    }
+}
+
+static PyObject *
+merittype_new(PyTypeObject *metatype, PyObject *args, PyObject *kwds)
+{
+    PyObject *type = PyType_Type.tp_new(metatype, args, kwds);
+
+    if (type == NULL || !PyMerit_Check(type))
+        return type;
+    ((PyMeritTypeObject*)type)->mt_id = -1;
+    if (merit_register((PyMeritTypeObject*)type) < 0) {
+        Py_DECREF(type);
+        return NULL;
+    }
+    /* A fresh merit isn't part of any taint yet, so there is no need to
+       invalidate the propagation cache. */
+    merit_set_strategy((PyMeritTypeObject*)type,
+        strategy_of_propagation(_PyType_Lookup((PyTypeObject*)type,
+                                               propagation_str)));
+    return type;
+}
+
+static void
+merittype_dealloc(PyMeritTypeObject *type)
+{
+    if (_PyMerit_FromId(type->mt_id) == (PyObject*)type) {
+        merit_set_strategy(type, PyMerit_STRATEGY_NONE);
+        merit_registry[type->mt_id] = NULL;
+        _PyTaint_ClearPropagationCache();
+    }
+    PyType_Type.tp_dealloc((PyObject*)type);
+}
+
+static int
+merittype_setattro(PyTypeObject *type, PyObject *name, PyObject *value)
+{
+    if (PyType_Type.tp_setattro((PyObject*)type, name, value) < 0)
+        return -1;
+    /* Any assignment (to propagation itself, or to __bases__ which changes
+       the mro) may alter the strategy. */
+    merittype_update_strategy(type);
+    return 0;
+}
+
+/* --- Propagation overrides ---------------------------------------------- */
+
+static int
+override_add_id(PyMerit_Override *o, Py_ssize_t id)
+{
+    Py_ssize_t *ids;
+
+    /* mo_nids is a power of two whenever the array is full */
+    if (o->mo_nids >= 4 && (o->mo_nids & (o->mo_nids - 1)) == 0) {
+        ids = PyMem_RESIZE(o->mo_ids, Py_ssize_t, 2 * o->mo_nids);
+        if (ids == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        o->mo_ids = ids;
+    }
+    o->mo_ids[o->mo_nids++] = id;
+    return 0;
+}
+
+/* Add ids of type and of its subclasses which inherit the propagation
+   attribute from it to o. */
+static int
+override_collect(PyMerit_Override *o, PyTypeObject *type)
+{
+    PyObject *subclasses, *ref;
+    PyTypeObject *subclass;
+    Py_ssize_t i;
+
+    if (override_add_id(o, ((PyMeritTypeObject*)type)->mt_id) < 0)
+        return -1;
+    subclasses = type->tp_subclasses;
+    if (subclasses == NULL)
+        return 0;
+    assert(PyList_Check(subclasses));
+    for (i = 0; i < PyList_GET_SIZE(subclasses); i++) {
+        ref = PyList_GET_ITEM(subclasses, i);
+        assert(PyWeakref_CheckRef(ref));
+        subclass = (PyTypeObject *)PyWeakref_GET_OBJECT(ref);
+        if ((PyObject *)subclass == Py_None || !PyMerit_Check(subclass))
+            continue;
+        if (PyDict_GetItem(subclass->tp_dict, propagation_str) != NULL)
+            continue;
+        if (override_collect(o, subclass) < 0)
+            return -1;
+    }
+    return 0;
+}
+
+/* Bring the masks of o (and of all entries below it) up to date with the
+   global ones. */
+static int
+override_update(PyMerit_Override *o)
+{
+    Py_ssize_t words = merit_registry_allocated / PyTaint_WORD_BITS, i;
+    PyTaint_Word *full, *keep, *invalid, *masks;
+
+    if (o->mo_version == _PyMerit_MaskVersion)
+        return 0;
+    if (o->mo_prev != NULL) {
+        if (override_update(o->mo_prev) < 0)
+            return -1;
+        full = o->mo_prev->mo_full;
+        keep = o->mo_prev->mo_keep;
+        invalid = o->mo_prev->mo_invalid;
+    } else {
+        full = _PyMerit_FullMask;
+        keep = _PyMerit_KeepMask;
+        invalid = _PyMerit_InvalidMask;
+    }
+    if (words != o->mo_words) {
+        masks = PyMem_RESIZE(o->mo_full, PyTaint_Word, 3 * words);
+        if (masks == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        o->mo_full = masks;
+        o->mo_keep = masks + words;
+        o->mo_invalid = masks + 2 * words;
+        o->mo_words = words;
+    }
+    memcpy(o->mo_full, full, words * sizeof(PyTaint_Word));
+    memcpy(o->mo_keep, keep, words * sizeof(PyTaint_Word));
+    memcpy(o->mo_invalid, invalid, words * sizeof(PyTaint_Word));
+    for (i = 0; i < o->mo_nids; i++)
+        masks_set_strategy(o->mo_full, o->mo_keep, o->mo_invalid,
+                           o->mo_ids[i], o->mo_strategy);
+    o->mo_version = _PyMerit_MaskVersion;
+    return 0;
+}
+
+static void
+override_free(PyMerit_Override *o)
+{
+    PyMem_FREE(o->mo_ids);
+    PyMem_FREE(o->mo_full);
+    PyMem_FREE(o);
+}
+
+int
+_PyMerit_PushOverride(PyObject *merit, PyObject *propagation)
+{
+    PyThreadState *tstate = PyThreadState_GET();
+    PyMerit_Override *o;
+    int strategy = strategy_of_propagation(propagation);
+
+    if (!PyMerit_Check(merit)) {
+        PyErr_SetString(PyExc_TypeError, "Invalid merit object passed.");
+        return -1;
+    }
+    if (strategy == PyMerit_STRATEGY_INVALID) {
+        PyErr_SetString(PyExc_TypeError,
+                        "Invalid taint propagation strategy.");
+        return -1;
+    }
+
+    o = PyMem_NEW(PyMerit_Override, 1);
+    if (o == NULL) {
+        PyErr_NoMemory();
+        return -1;
+    }
+    o->mo_prev = tstate->merit_overrides;
+    o->mo_strategy = strategy;
+    o->mo_nids = 0;
+    o->mo_ids = PyMem_NEW(Py_ssize_t, 4);
+    o->mo_version = -1;
+    o->mo_words = 0;
+    o->mo_full = o->mo_keep = o->mo_invalid = NULL;
+    if (o->mo_ids == NULL) {
+        PyErr_NoMemory();
+        override_free(o);
+        return -1;
+    }
+    if (override_collect(o, (PyTypeObject *)merit) < 0 ||
+        override_update(o) < 0) {
+        override_free(o);
+        return -1;
+    }
+    tstate->merit_overrides = o;
+    return 0;
+}
+
+int
+_PyMerit_PopOverride(void)
+{
+    PyThreadState *tstate = PyThreadState_GET();
+    PyMerit_Override *o = tstate->merit_overrides;
+
+    if (o == NULL) {
+        PyErr_SetString(PyExc_RuntimeError,
+                        "no taint propagation override to pop");
+        return -1;
+    }
+    tstate->merit_overrides = o->mo_prev;
+    override_free(o);
+    return 0;
+}
+
+void
+_PyMerit_ClearOverrides(PyThreadState *tstate)
+{
+    PyMerit_Override *o;
+
+    while ((o = tstate->merit_overrides) != NULL) {
+        tstate->merit_overrides = o->mo_prev;
+        override_free(o);
+    }
+}
+
+int
+_PyMerit_GetMasks(PyTaint_Word **full, PyTaint_Word **keep,
+                  PyTaint_Word **invalid)
+{
+    PyMerit_Override *o = PyThreadState_GET()->merit_overrides;
+
+    if (o == NULL) {
+        *full = _PyMerit_FullMask;
+        *keep = _PyMerit_KeepMask;
+        *invalid = _PyMerit_InvalidMask;
+        return 0;
+    }
+    if (override_update(o) < 0)
+        return -1;
+    *full = o->mo_full;
+    *keep = o->mo_keep;
+    *invalid = o->mo_invalid;
+    return 0;
+}
+
+PyTypeObject PyMerit_MetaType = {
+    PyObject_HEAD_INIT(&PyType_Type)
     0,                                          /* ob_size */
-    "taint.Propagation",                        /* tp_name */
-    sizeof(PyPropagationObject),                /* tp_basicsize */
+    "taint.MeritType",                          /* tp_name */
+    sizeof(PyMeritTypeObject),                  /* tp_basicsize */
+    sizeof(PyMemberDef),                        /* tp_itemsize */
+    (destructor)merittype_dealloc,              /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    0,                                          /* tp_getattro */
+    (setattrofunc)merittype_setattro,           /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,   /* tp_flags */
+    "Metatype of merit classes",                /* tp_doc */
+    0,                                          /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    0,                                          /* tp_methods */
+    0,                                          /* tp_members */
+    0,                                          /* tp_getset */
+    &PyType_Type,                               /* tp_base */
+    0,                                          /* tp_dict */
+    0,                                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    0,                                          /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    merittype_new,                              /* tp_new */
+    0,                                          /* tp_free */
+};
+
+typedef struct {
+    PyObject_HEAD
+} PyMeritObject;
+
+static void
+Merit_dealloc(PyObject* self)
+{
+    Py_TYPE(self)->tp_free(self);
+}
+
+
+PyMeritTypeObject _PyMerit_MeritObject = {
+  {
+    {
+    PyObject_HEAD_INIT(&PyMerit_MetaType)
+    0,                                          /* ob_size */
+    "taint.Merit",                              /* tp_name */
+    sizeof(PyMeritObject),                      /* tp_basicsize */
     0,                                          /* tp_itemsize */
-    (destructor)Propagation_dealloc,            /* tp_dealloc */
+    (destructor)Merit_dealloc,                  /* tp_dealloc */
     0,                                          /* tp_print */
     0,                                          /* tp_getattr */
     0,                                          /* tp_setattr */
     0,                                          /* tp_compare */
-    Propagation_repr,                           /* tp_repr */
+    0,                                          /* tp_repr */
     0,                                          /* tp_as_number */
     0,                                          /* tp_as_sequence */
     0,                                          /* tp_as_mapping */
     0,                                          /* tp_hash */
     0,                                          /* tp_call */
-    Propagation_str,                            /* tp_str */
+    0,                                          /* tp_str */
     0,                                          /* tp_getattro */
     0,                                          /* tp_setattro */
     0,                                          /* tp_as_buffer */
     Py_TPFLAGS_DEFAULT | Py_TPFLAGS_BASETYPE,   /* tp_flags */
-    "Propagation object",                       /* tp_doc */
+    "Merit object",                             /* tp_doc */
     0,                                          /* tp_traverse */
     0,                                          /* tp_clear */
     0,                                          /* tp_richcompare */
@@ -140,25 +584,44 @@ PyTypeObject PyMerit_PropagationType = {
     0,                                          /* tp_alloc */
     0,                                          /* tp_new */
     0,                                          /* tp_free */
+    }
+  },
+  PyMerit_STRATEGY_NONE,                        /* mt_strategy */
+  0                                             /* mt_id */
 };
 
-PyObject *_PyMerit_FullPropagation;
-PyObject *_PyMerit_PartialPropagation;
-PyObject *_PyMerit_NonePropagation;
 
 void
 _PyTaint_Init(void)
 {
+    _PyTaint_Enabled = !Py_NoTaintFlag;
+
+    propagation_str = PyString_InternFromString("propagation");
+    if (propagation_str == NULL) {
+        return;
+    }
+
+    if (PyType_Ready(&PyMerit_MetaType) < 0) {
+        return;
+    }
+
     PyMerit_MeritType.tp_new = PyType_GenericNew;
     if (PyType_Ready(&PyMerit_MeritType) < 0) {
         return;
     }
+    if (merit_register(&_PyMerit_MeritObject) < 0) {
+        return;
+    }
 
     PyMerit_PropagationType.tp_new = PyType_GenericNew;
     if (PyType_Ready(&PyMerit_PropagationType) < 0) {
         return;
     }
 
+    if (PyType_Ready(&PyTaint_Type) < 0) {
+        return;
+    }
+
     _PyMerit_FullPropagation = (PyObject*)PyObject_New(PyPropagationObject,
                                                   &PyMerit_PropagationType);
     ((PyPropagationObject*)_PyMerit_FullPropagation)->ob_strat = 0;
@@ -48,7 +48,7 @@ typedef struct {
 static PyObject *
 build_string(SubString *input, PyObject *args, PyObject *kwargs,
              int recursion_depth, AutoNumber *auto_number,
-             PyTaintObject **taint_obj);
+             PyTaint_Accumulator *taint_acc);
 
 
 
@@ -562,7 +562,7 @@ error:
 */
 static int
 render_field(PyObject *fieldobj, SubString *format_spec, OutputString *output,
-             PyTaintObject **taintobj)
+             PyTaint_Accumulator *taint_acc)
 {
     int ok = 0;
     PyObject *result = NULL;
@@ -593,9 +593,9 @@ render_field(PyObject *fieldobj, SubString *format_spec, OutputString *output,
     else if (PyFloat_CheckExact(fieldobj))
         formatter = _PyFloat_FormatAdvanced;
 #endif
-    if (PyTaint_IsTaintable(fieldobj)) {
-        PyTaint_PropagateTo(taintobj, _PyTaint_GetFromObject(fieldobj));
-    }
+    if (PyTaint_IsTaintable(fieldobj) &&
+        PyTaint_AccumulatorAddObject(taint_acc, fieldobj) == -1)
+        goto done;
 
     if (formatter) {
         /* we know exactly which formatter will be called when __format__ is
@@ -891,7 +891,7 @@ output_markup(SubString *field_name, SubString *format_spec,
               int format_spec_needs_expanding, STRINGLIB_CHAR conversion,
               OutputString *output, PyObject *args, PyObject *kwargs,
               int recursion_depth, AutoNumber *auto_number,
-              PyTaintObject **taint_obj)
+              PyTaint_Accumulator *taint_acc)
 {
     PyObject *tmp = NULL;
     PyObject *fieldobj = NULL;
@@ -918,18 +918,10 @@ output_markup(SubString *field_name, SubString *format_spec,
     /* if needed, recurively compute the format_spec */
     if (format_spec_needs_expanding) {
         tmp = build_string(format_spec, args, kwargs, recursion_depth-1,
-                           auto_number, taint_obj);
+                           auto_number, taint_acc);
         if (tmp == NULL)
             goto done;
 
-        Py_XINCREF(*taint_obj);
-        // build_string will steal reference to *taint_obj, possibly modify it,
-        // and assign to tmp. however, we want to reuse *taint_obj in
-        // render_field, so incref. (Also *taint_obj can not be increfed before
-        // calling build_string, because it may be swapped with a new object)
-
-        assert(_PyTaint_GetFromObject(tmp) == *taint_obj);
-
         /* note that in the case we're expanding the format string,
            tmp must be kept around until after the call to
            render_field. */
@@ -940,7 +932,7 @@ output_markup(SubString *field_name, SubString *format_spec,
     else
         actual_format_spec = format_spec;
 
-    if (render_field(fieldobj, actual_format_spec, output, taint_obj) == 0)
+    if (render_field(fieldobj, actual_format_spec, output, taint_acc) == 0)
         goto done;
 
     result = 1;
@@ -961,7 +953,7 @@ done:
 static int
 do_markup(SubString *input, PyObject *args, PyObject *kwargs,
           OutputString *output, int recursion_depth, AutoNumber *auto_number,
-          PyTaintObject **taint_obj)
+          PyTaint_Accumulator *taint_acc)
 {
     MarkupIterator iter;
     int format_spec_needs_expanding;
@@ -983,7 +975,7 @@ do_markup(SubString *input, PyObject *args, PyObject *kwargs,
             if (!output_markup(&field_name, &format_spec,
                                format_spec_needs_expanding, conversion, output,
                                args, kwargs, recursion_depth, auto_number,
-                               taint_obj))
+                               taint_acc))
                 return 0;
     }
     return result;
@@ -997,10 +989,11 @@ do_markup(SubString *input, PyObject *args, PyObject *kwargs,
 static PyObject *
 build_string(SubString *input, PyObject *args, PyObject *kwargs,
              int recursion_depth, AutoNumber *auto_number,
-             PyTaintObject **taint_obj)
+             PyTaint_Accumulator *taint_acc)
 {
     OutputString output;
     PyObject *result = NULL;
+    PyTaintObject *taint = NULL;
     Py_ssize_t count;
 
     output.obj = NULL; /* needed so cleanup code always works */
@@ -1020,7 +1013,7 @@ build_string(SubString *input, PyObject *args, PyObject *kwargs,
         goto done;
 
     if (!do_markup(input, args, kwargs, &output, recursion_depth,
-                   auto_number, taint_obj)) {
+                   auto_number, taint_acc)) {
         goto done;
     }
 
@@ -1029,13 +1022,17 @@ build_string(SubString *input, PyObject *args, PyObject *kwargs,
         goto done;
     }
 
+    /* taint of everything formatted so far */
+    if (PyTaint_AccumulatorResult(taint_acc, &taint) == -1)
+        goto done;
+
     /* transfer ownership to result */
-    result = output.obj;
-    output.obj = NULL;
-    result = PyTaint_AssignToObject(result, *taint_obj);
+    result = PyTaint_AssignToObject(output.obj, taint);
+    if (result != NULL)
+        output.obj = NULL;
 
 done:
-    Py_XDECREF(*taint_obj);
+    Py_XDECREF(taint);
     Py_XDECREF(output.obj);
     return result;
 }
@@ -1049,7 +1046,9 @@ static PyObject *
 do_string_format(PyObject *self, PyObject *args, PyObject *kwargs)
 {
     SubString input;
-    PyTaintObject *taint = NULL;
+    PyTaint_Accumulator taint_acc;
+    PyTaintObject *taint;
+    PyObject *result;
 
     /* PEP 3101 says only 2 levels, so that
        "{0:{1}}".format('abc', 's')            # works
@@ -1066,10 +1065,15 @@ do_string_format(PyObject *self, PyObject *args, PyObject *kwargs)
 #else
     taint = PyString_GET_MERITS(self);
 #endif
-    Py_XINCREF(taint);
 
-    return build_string(&input, args, kwargs, recursion_depth, &auto_number,
-                        &taint);
+    PyTaint_AccumulatorInit(&taint_acc);
+    if (PyTaint_AccumulatorAdd(&taint_acc, taint) == -1)
+        result = NULL;
+    else
+        result = build_string(&input, args, kwargs, recursion_depth,
+                              &auto_number, &taint_acc);
+    PyTaint_AccumulatorClear(&taint_acc);
+    return result;
 }
 
 
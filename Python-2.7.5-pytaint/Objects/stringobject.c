@@ -13,6 +13,15 @@ Py_ssize_t null_strings, one_strings;
 static PyStringObject *characters[UCHAR_MAX + 1];
 static PyStringObject *nullstring;
 
+/* Tainted one character and empty strings are shared too, through a direct
+   mapped cache keyed by the (canonical) taint object and the character.
+   Each entry owns a reference to its string, and is replaced by the newer
+   string on collision. */
+#ifndef TAINTED_CHARS_SIZE
+#define TAINTED_CHARS_SIZE 1024
+#endif
+static PyStringObject *tainted_chars[TAINTED_CHARS_SIZE];
+
 /* This dictionary holds all interned strings.  Note that references to
    strings in this dictionary are *not* counted in the string's ob_refcnt.
    When the interned string reaches a refcnt of 0 the string deallocation
@@ -21,11 +30,51 @@ static PyStringObject *nullstring;
    Another way to look at this is that to say that the actual reference
    count of a string is:  s->ob_refcnt + (s->ob_sstate?2:0)
 
-   Note that only untainted strings can be interned. (Passing a tainted string
-   to `intern` python builtin will cause TypeError, whereas C API Python
-   functions like PyString_InternInPlace will ignore tainted strings).
+   Only untainted strings are kept here. Tainted strings are interned in
+   tainted_interned instead: it maps each taint object to a dictionary of
+   interned strings with exactly that taint, which works the same way as
+   interned. Interning never changes the taint of a string, so equal strings
+   with different taints are interned separately. (The `intern` builtin
+   still refuses tainted strings - use taint.intern for them.)
 */
 static PyObject *interned;
+static PyObject *tainted_interned;
+
+/* Return the dictionary in which string s is (or would be) interned, or
+   NULL if there is none yet. When create is non-zero, the dictionary is
+   created if needed; NULL is returned (with exception set) on failure
+   then. Returns a borrowed reference. */
+static PyObject *
+interned_dict(PyObject *s, int create)
+{
+    PyTaintObject *taint = PyString_GET_MERITS(s);
+    PyObject *table;
+
+    if (taint == NULL) {
+        if (interned == NULL && create)
+            interned = PyDict_New();
+        return interned;
+    }
+    if (tainted_interned == NULL) {
+        if (!create)
+            return NULL;
+        tainted_interned = PyDict_New();
+        if (tainted_interned == NULL)
+            return NULL;
+    }
+    table = PyDict_GetItem(tainted_interned, (PyObject *)taint);
+    if (table == NULL && create) {
+        table = PyDict_New();
+        if (table == NULL)
+            return NULL;
+        if (PyDict_SetItem(tainted_interned, (PyObject *)taint, table) < 0) {
+            Py_DECREF(table);
+            return NULL;
+        }
+        Py_DECREF(table);
+    }
+    return table;
+}
 
 /* PyStringObject_SIZE gives the basic size of a string; any memory allocation
    for a string of length n should request PyStringObject_SIZE + n bytes.
@@ -53,7 +102,7 @@ unsafe_build_string(const char *str, Py_ssize_t size)
     if (str != NULL)
         Py_MEMCPY(op->ob_sval, str, size);
     op->ob_sval[size] = '\0';
-    op->ob_merits = NULL;
+    _PyString_INIT_MERITS(op);
 
     return op;
 }
@@ -213,11 +262,42 @@ PyString_FromStringAndSizeNoIntern(const char *str, Py_ssize_t size)
     if (op == NULL)
         return NULL;
 
-    op->ob_merits = NULL;
+    _PyString_SET_MERITS(op, NULL);
 
     return (PyObject *) op;
 }
 
+/* Return a string of size 0 or 1 with contents str and (non-NULL) taint
+   merits, shared through tainted_chars. */
+static PyObject *
+tainted_char(const char *str, Py_ssize_t size, PyTaintObject *merits)
+{
+    PyStringObject *op, *old;
+    size_t i;
+
+    assert(size == 0 || size == 1);
+    i = (size_t)merits->ob_hash + (size ? (*str & UCHAR_MAX) + 1 : 0);
+    i &= TAINTED_CHARS_SIZE - 1;
+    op = tainted_chars[i];
+    if (op != NULL && PyString_GET_MERITS(op) == merits &&
+        Py_SIZE(op) == size && (size == 0 || op->ob_sval[0] == *str)) {
+#ifdef COUNT_ALLOCS
+        one_strings++;
+#endif
+        Py_INCREF(op);
+        return (PyObject *)op;
+    }
+    op = (PyStringObject *)PyString_FromStringAndSizeNoIntern(str, size);
+    if (op == NULL)
+        return NULL;
+    PyString_ASSIGN_MERITS(op, merits);
+    Py_INCREF(op);
+    old = tainted_chars[i];
+    tainted_chars[i] = op;
+    Py_XDECREF(old);
+    return (PyObject *)op;
+}
+
 /*
    PyString_FromStringAndSizeSameMerits works the same as
    PyString_FromStringAndSize when NULL merits are passed. If the merits are
@@ -232,8 +312,12 @@ PyString_FromStringAndSizeSameMerits(const char *str, Py_ssize_t size,
 {
     register PyObject *op;
 
+    if (!_PyTaint_Enabled)
+        merits = NULL;
     if (merits == NULL) {
         op = PyString_FromStringAndSize(str, size);
+    } else if (size <= 1 && str != NULL) {
+        return tainted_char(str, size, merits);
     } else {
         op = PyString_FromStringAndSizeNoIntern(str, size);
     }
@@ -247,6 +331,22 @@ PyString_FromStringAndSizeSameMerits(const char *str, Py_ssize_t size,
     return op;
 }
 
+/* Return a string with the same contents as s and the given merits (like
+   PyString_FromStringAndSizeSameMerits). The copy keeps the hash of s if it
+   was computed already, so that tainting or cleaning a dict key doesn't make
+   it rehash the whole string. */
+PyObject *
+_PyString_CopyWithMerits(PyStringObject *s, PyTaintObject *merits)
+{
+    PyStringObject *op;
+
+    op = (PyStringObject *)PyString_FromStringAndSizeSameMerits(
+                                s->ob_sval, Py_SIZE(s), merits);
+    if (op != NULL && op->ob_shash == -1)
+        op->ob_shash = s->ob_shash;
+    return (PyObject *)op;
+}
+
 /*
    Based on taint propagation semantics, propagate taint between a and b and
    store result in the result. Returns 1 on success, -1 on failure. The
@@ -257,9 +357,13 @@ int _PyString_BinaryTaintPropagateInPlace(register PyStringObject *result,
                                           register PyStringObject *a,
                                           register PyStringObject *b)
 {
-    return PyTaint_PropagationResult(&(result->ob_merits),
-                                     PyString_GET_MERITS(a),
-                                     PyString_GET_MERITS(b));
+    PyTaintObject *merits = PyString_GET_MERITS(result);
+
+    if (PyTaint_PropagationResult(&merits, PyString_GET_MERITS(a),
+                                  PyString_GET_MERITS(b)) == -1)
+        return -1;
+    _PyString_SET_MERITS(result, merits);
+    return 1;
 }
 
 /*
@@ -277,8 +381,8 @@ _PyString_PropagateTaintInPlace(register PyStringObject *target,
                                   PyString_GET_MERITS(source)) == -1)
         return -1;
 
-    Py_XDECREF(target->ob_merits);
-    PyString_ASSIGN_MERITS(target, result);
+    Py_XDECREF(PyString_GET_MERITS(target));
+    _PyString_SET_MERITS(target, result);
     return 1;
 }
 
@@ -299,6 +403,8 @@ PyString_AssignTaint(PyStringObject *str, PyTaintObject *taint) {
         return NULL;
     }
 
+    if (!_PyTaint_Enabled)
+        taint = NULL;
     if (PyString_GET_MERITS(str) == taint)
         return (PyObject*)str;
 
@@ -310,6 +416,7 @@ PyString_AssignTaint(PyStringObject *str, PyTaintObject *taint) {
                                                     PyString_GET_SIZE(str));
         if (result == NULL)
             return result;
+        ((PyStringObject *)result)->ob_shash = str->ob_shash;
         Py_DECREF(str);
     }
     PyString_ASSIGN_MERITS(result, taint);
@@ -327,8 +434,9 @@ _PyString_CopyTaint(register PyStringObject *target,
       return -1;
     }
 
-    Py_XDECREF(target->ob_merits);
-    PyString_ASSIGN_MERITS(target, source->ob_merits);
+    Py_XDECREF(PyString_GET_MERITS(target));
+    PyString_ASSIGN_MERITS(target, _PyTaint_Enabled ?
+                           PyString_GET_MERITS(source) : NULL);
     return 1;
 }
 
@@ -751,9 +859,22 @@ string_dealloc(PyObject *op)
         case SSTATE_INTERNED_MORTAL:
             /* revive dead object temporarily for DelItem */
             Py_REFCNT(op) = 3;
-            if (PyDict_DelItem(interned, op) != 0)
-                Py_FatalError(
-                    "deletion of interned string failed");
+            if (!PyString_CHECK_TAINTED(op)) {
+                if (PyDict_DelItem(interned, op) != 0)
+                    Py_FatalError(
+                        "deletion of interned string failed");
+            }
+            else {
+                PyObject *table = interned_dict(op, 0);
+                if (table == NULL || PyDict_DelItem(table, op) != 0)
+                    Py_FatalError(
+                        "deletion of interned string failed");
+                if (PyDict_Size(table) == 0 &&
+                    PyDict_DelItem(tainted_interned,
+                                   (PyObject *)PyString_GET_MERITS(op)) != 0)
+                    Py_FatalError(
+                        "deletion of interned string failed");
+            }
             break;
 
         case SSTATE_INTERNED_IMMORTAL:
@@ -762,7 +883,11 @@ string_dealloc(PyObject *op)
         default:
             Py_FatalError("Inconsistent interned string state.");
     }
-    Py_XDECREF(((PyStringObject*)op)->ob_merits);
+    if (PyString_CHECK_TAINTED(op)) {
+        PyTaintObject *merits = PyString_GET_MERITS(op);
+        _PyString_SET_MERITS(op, NULL);
+        Py_DECREF(merits);
+    }
     Py_TYPE(op)->tp_free(op);
 }
 
@@ -1185,6 +1310,7 @@ string_concat(register PyStringObject *a, register PyObject *bb)
 {
     register Py_ssize_t size;
     register PyStringObject *op;
+    PyTaintObject *merits = NULL;
     if (!PyString_Check(bb)) {
 #ifdef Py_USING_UNICODE
         if (PyUnicode_Check(bb))
@@ -1226,22 +1352,23 @@ string_concat(register PyStringObject *a, register PyObject *bb)
                         "strings are too large to concat");
         return NULL;
     }
+    if (PyTaint_PropagationResult(&merits,
+                                  PyString_GET_MERITS(a),
+                                  PyString_GET_MERITS(b)) == -1)
+        return NULL;
     op = (PyStringObject *)PyObject_MALLOC(PyStringObject_SIZE + size);
-    if (op == NULL)
+    if (op == NULL) {
+        Py_XDECREF(merits);
         return PyErr_NoMemory();
+    }
     PyObject_INIT_VAR(op, &PyString_Type, size);
     op->ob_shash = -1;
     op->ob_sstate = SSTATE_NOT_INTERNED;
     Py_MEMCPY(op->ob_sval, a->ob_sval, Py_SIZE(a));
     Py_MEMCPY(op->ob_sval + Py_SIZE(a), b->ob_sval, Py_SIZE(b));
     op->ob_sval[size] = '\0';
-    op->ob_merits = NULL;
-
-    if (PyTaint_PropagationResult(&PyString_GET_MERITS(op),
-                                  PyString_GET_MERITS(a),
-                                  PyString_GET_MERITS(b)) == -1)
-        return NULL;
-
+    _PyString_INIT_MERITS(op);
+    _PyString_SET_MERITS(op, merits);
     return (PyObject *) op;
 #undef b
 }
@@ -1282,7 +1409,7 @@ string_repeat(register PyStringObject *a, register Py_ssize_t n)
     op->ob_shash = -1;
     op->ob_sstate = SSTATE_NOT_INTERNED;
     op->ob_sval[size] = '\0';
-    op->ob_merits = NULL;
+    _PyString_INIT_MERITS(op);
 
     if (_PyString_CopyTaint(op, a) == -1) {
         Py_DECREF(op);
@@ -1328,7 +1455,7 @@ string_slice(register PyStringObject *a, register Py_ssize_t i,
         j = i;
     return PyString_FromStringAndSizeSameMerits(a->ob_sval + i,
                                                 j - i,
-                                                a->ob_merits);
+                                                PyString_GET_MERITS(a));
 }
 
 static int
@@ -1360,7 +1487,7 @@ string_item(PyStringObject *a, register Py_ssize_t i)
         return NULL;
     }
     pchar = a->ob_sval[i];
-    if (a->ob_merits == NULL) {
+    if (!PyString_CHECK_TAINTED(a)) {
         // string is untainted - pick an interned character
         v = (PyObject *)characters[pchar & UCHAR_MAX];
         if (v == NULL)
@@ -1372,14 +1499,9 @@ string_item(PyStringObject *a, register Py_ssize_t i)
             Py_INCREF(v);
         }
     } else {
-        // tainted string - create a new one character string
-        v = PyString_FromStringAndSizeNoIntern(&pchar, 1);
-        if (v == NULL)
-            return NULL;
-        if (_PyString_CopyTaint((PyStringObject*)v, a) == -1) {
-            Py_DECREF(v);
-            return NULL;
-        }
+        // tainted string - share a character with the same taint
+        v = PyString_FromStringAndSizeSameMerits(&pchar, 1,
+                                                 PyString_GET_MERITS(a));
     }
     return v;
 }
@@ -1515,7 +1637,7 @@ string_subscript(PyStringObject* self, PyObject* item)
 
         if (slicelength <= 0) {
             return PyString_FromStringAndSizeSameMerits("", 0,
-                                                        self->ob_merits);
+                                                        PyString_GET_MERITS(self));
         }
         else if (start == 0 && step == 1 &&
                  slicelength == PyString_GET_SIZE(self) &&
@@ -1635,7 +1757,7 @@ Return True if S is tainted, False otherwise.");
 static PyObject *
 string_istainted(PyStringObject *self)
 {
-    long taint_val = (long)(self->ob_merits != NULL);
+    long taint_val = (long)PyString_CHECK_TAINTED(self);
     return PyBool_FromLong(taint_val);
 }
 
@@ -1653,7 +1775,7 @@ string_isclean(PyStringObject *self, PyObject *args)
     if (!PyArg_ParseTuple(args, "|O:isclean", &merit))
         return NULL;
 
-    if (self->ob_merits == NULL) {
+    if (!PyString_CHECK_TAINTED(self)) {
         Py_RETURN_TRUE;
     }
 
@@ -1661,14 +1783,7 @@ string_isclean(PyStringObject *self, PyObject *args)
         Py_RETURN_FALSE;
     }
 
-    if (!PyObject_HasAttrString(merit, "propagation")) {
-        PyErr_SetString(PyExc_TypeError,
-                        "Invalid merit object passed.");
-        return NULL;
-    }
-
-    switch (PySequence_Contains((PyObject*)PyString_GET_MERITS(self),
-                                merit)) {
+    switch (_PyTaint_HasMerit(PyString_GET_MERITS(self), merit)) {
         case -1:
             return NULL;
         case 1:
@@ -1677,6 +1792,22 @@ string_isclean(PyStringObject *self, PyObject *args)
     Py_RETURN_FALSE;
 }
 
+/* Return self with the given (non-NULL) merits. When the caller holds the
+   only reference to self (as in f().taint(), where it's owned by the bound
+   method), self is tainted in place instead of being copied. */
+static PyObject *
+string_retaint(PyStringObject *self, PyTaintObject *taint)
+{
+    if (Py_REFCNT(self) == 1 && PyString_CheckExact(self) &&
+        !PyString_CHECK_INTERNED(self) && _PyTaint_Enabled) {
+        Py_XDECREF(PyString_GET_MERITS(self));
+        PyString_ASSIGN_MERITS(self, taint);
+        Py_INCREF(self);
+        return (PyObject *)self;
+    }
+    return _PyString_CopyWithMerits(self, taint);
+}
+
 PyDoc_STRVAR(taint__doc__,
 "S.taint() -> str\n\
 \n\
@@ -1685,13 +1816,19 @@ Return a tainted copy of S without any merits.");
 static PyObject *
 string_taint(PyStringObject *self)
 {
-    PyTaintObject *taint = PyTaint_EmptyMerits();
+    PyObject *result;
+    PyTaintObject *taint;
+
+    if (!_PyTaint_Enabled)
+        return PyString_FromStringAndSize(PyString_AS_STRING(self),
+                                          PyString_GET_SIZE(self));
+    taint = PyTaint_EmptyMerits();
     if (taint == NULL)
         return NULL;
 
-    return PyString_FromStringAndSizeSameMerits(PyString_AS_STRING(self),
-                                                PyTuple_GET_SIZE(self),
-                                                taint);
+    result = string_retaint(self, taint);
+    Py_DECREF(taint);
+    return result;
 }
 
 PyDoc_STRVAR(cleanfor__doc__,
@@ -1708,6 +1845,9 @@ string_cleanfor(PyStringObject *self, PyObject *merit)
 
     if (_PyTaint_ValidMerit(merit) == -1)
         return NULL;
+    if (!_PyTaint_Enabled)
+        return PyString_FromStringAndSize(PyString_AS_STRING(self),
+                                          PyString_GET_SIZE(self));
 
     if (PyString_CHECK_TAINTED(self)) {
         taint = PyString_GET_MERITS(self);
@@ -1722,16 +1862,36 @@ string_cleanfor(PyStringObject *self, PyObject *merit)
     Py_DECREF(taint);
     if (new_taint == NULL)
         return NULL;
-    newobj = (PyStringObject*)PyString_FromStringAndSizeSameMerits(
-                                PyString_AS_STRING(self),
-                                PyString_GET_SIZE(self),
-                                new_taint);
+    newobj = (PyStringObject*)string_retaint(self, new_taint);
+    Py_DECREF(new_taint);
+    return (PyObject *)newobj;
+}
 
+PyDoc_STRVAR(withmerits__doc__,
+"S.withmerits(merits) -> str\n\
+\n\
+Return a copy of S tainted with exactly the merits from iterable merits.\n\
+Same as applying _cleanfor() with each of them to S.taint(), but the copy is\n\
+made only once.");
 
-    if (newobj == NULL)
+static PyObject *
+string_withmerits(PyStringObject *self, PyObject *merits)
+{
+    PyObject *result;
+    PyTaintObject *taint;
+
+    taint = _PyTaint_AddMerits(NULL, merits);
+    if (taint == NULL)
         return NULL;
-    Py_DECREF(new_taint);
-    return (PyObject *)newobj;
+    if (PyString_GET_MERITS(self) == taint && _PyTaint_Enabled &&
+        PyString_CheckExact(self)) {
+        Py_DECREF(taint);
+        Py_INCREF(self);
+        return (PyObject *)self;
+    }
+    result = string_retaint(self, taint);
+    Py_DECREF(taint);
+    return result;
 }
 
 PyDoc_STRVAR(listmerits__doc__,
@@ -1743,11 +1903,11 @@ None.");
 static PyObject*
 string_listmerits(PyStringObject *self)
 {
-    if (self->ob_merits == NULL) {
+    if (!PyString_CHECK_TAINTED(self)) {
         Py_RETURN_NONE;
     }
 
-    return PySet_New((PyObject*)PyString_GET_MERITS(self));
+    return _PyTaint_GetMerits(PyString_GET_MERITS(self));
 }
 
 PyDoc_STRVAR(propagate__doc__,
@@ -1758,9 +1918,7 @@ Return a copy of S, which has the same merits as T.");
 static PyObject *
 string_propagate(PyStringObject *self, PyStringObject *source)
 {
-    return PyString_FromStringAndSizeSameMerits(PyString_AS_STRING(self),
-                                                PyString_GET_SIZE(self),
-                                                PyString_GET_MERITS(source));
+    return _PyString_CopyWithMerits(self, PyString_GET_MERITS(source));
 }
 
 #define LEFTSTRIP 0
@@ -2043,7 +2201,7 @@ string_join(PyStringObject *self, PyObject *orig)
     if (seqlen == 1) {
         item = PySequence_Fast_GET_ITEM(seq, 0);
         if (PyString_CheckExact(item) || PyUnicode_CheckExact(item)) {
-            if (PyTaint_PropagateTo(&taint, _PyTaint_GetFromObject(item)) == -1)
+            if (PyTaint_PropagateMany(&taint, &item, 1) == -1)
                 goto onError;
             if (PyTaint_IS_CLEAN(taint)) {
                 Py_INCREF(item);
@@ -2051,15 +2209,10 @@ string_join(PyStringObject *self, PyObject *orig)
                 return item;
             }
             if (PyString_CheckExact(item))
-                res = PyString_FromStringAndSizeSameMerits(
-                                        PyString_AS_STRING(item),
-                                        PyString_GET_SIZE(item),
-                                        taint);
+                res = _PyString_CopyWithMerits((PyStringObject *)item, taint);
             else // PyUnicode_CheckExact(item) is true
-                res = PyUnicode_FromUnicodeSameMerits(
-                                        PyUnicode_AS_UNICODE(item),
-                                        PyUnicode_GET_SIZE(item),
-                                        taint);
+                res = _PyUnicode_CopyWithMerits((PyUnicodeObject *)item,
+                                                taint);
             goto done;
         }
     }
@@ -2081,10 +2234,8 @@ string_join(PyStringObject *self, PyObject *orig)
                  * original sequence can be iterated over
                  * again, so we must pass seq here.
                  */
-                PyObject *result;
-                result = PyUnicode_Join((PyObject *)self, seq);
-                Py_DECREF(seq);
-                return result;
+                res = PyUnicode_Join((PyObject *)self, seq);
+                goto done;
             }
 #endif
             PyErr_Format(PyExc_TypeError,
@@ -2101,12 +2252,11 @@ string_join(PyStringObject *self, PyObject *orig)
                 "join() result is too long for a Python string");
             goto onError;
         }
-        if (PyTaint_PropagateTo(&taint, PyString_GET_MERITS(item)) == -1) {
-            Py_DECREF(item);
-            goto onError;
-        }
     }
 
+    if (PyTaint_PropagateMany(&taint, PySequence_Fast_ITEMS(seq), seqlen) == -1)
+        goto onError;
+
     res = PyString_FromStringAndSizeSameMerits((char*)NULL, sz, taint);
 
     if (res == NULL)
@@ -2285,6 +2435,7 @@ do_xstrip(PyStringObject *self, int striptype, PyObject *sepobj)
     Py_ssize_t seplen = PyString_GET_SIZE(sepobj);
     Py_ssize_t i, j;
     PyTaintObject *taint = NULL;
+    PyObject *result;
 
     i = 0;
     if (striptype != RIGHTSTRIP) {
@@ -2308,9 +2459,12 @@ do_xstrip(PyStringObject *self, int striptype, PyObject *sepobj)
     if (i == 0 && j == len && PyString_CheckExact(self) && \
         taint == PyString_GET_MERITS(self)) {
         Py_INCREF(self);
-        return (PyObject*)self;
+        result = (PyObject*)self;
     }
-    return PyString_FromStringAndSizeSameMerits(s+i, j-i, taint);
+    else
+        result = PyString_FromStringAndSizeSameMerits(s+i, j-i, taint);
+    Py_XDECREF(taint);
+    return result;
 }
 
 
@@ -2679,19 +2833,18 @@ string_translate(PyStringObject *self, PyObject *args)
     PyObject *result;
     int trans_table[256];
     PyObject *tableobj, *delobj = NULL;
+    PyObject *operands[2];
+    Py_ssize_t noperands = 0;
     PyTaintObject *taint = NULL;
 
     if (!PyArg_UnpackTuple(args, "translate", 1, 2,
                           &tableobj, &delobj))
         return NULL;
 
-    taint = PyString_GET_MERITS(self);
-    Py_XINCREF(taint);
-
     if (PyString_Check(tableobj)) {
         table = PyString_AS_STRING(tableobj);
         tablen = PyString_GET_SIZE(tableobj);
-        PyTaint_PropagateTo(&taint, PyString_GET_MERITS(tableobj));
+        operands[noperands++] = tableobj;
     }
     else if (tableobj == Py_None) {
         table = NULL;
@@ -2723,7 +2876,7 @@ string_translate(PyStringObject *self, PyObject *args)
         if (PyString_Check(delobj)) {
             del_table = PyString_AS_STRING(delobj);
             dellen = PyString_GET_SIZE(delobj);
-            PyTaint_PropagateTo(&taint, PyString_GET_MERITS(delobj));
+            operands[noperands++] = delobj;
         }
 #ifdef Py_USING_UNICODE
         else if (PyUnicode_Check(delobj)) {
@@ -2740,6 +2893,11 @@ string_translate(PyStringObject *self, PyObject *args)
         dellen = 0;
     }
 
+    taint = PyString_GET_MERITS(self);
+    Py_XINCREF(taint);
+    if (PyTaint_PropagateMany(&taint, operands, noperands) == -1)
+        goto error;
+
     inlen = PyString_GET_SIZE(input_obj);
     result = PyString_FromStringAndSize((char *)NULL, inlen);
     if (result == NULL)
@@ -3312,48 +3470,45 @@ string_replace(PyStringObject *self, PyObject *args)
     PyObject *from, *to, *result;
     const char *from_s, *to_s;
     Py_ssize_t from_len, to_len;
+    PyObject *operands[2];
+    Py_ssize_t noperands = 0;
     PyTaintObject *taint;
 
     if (!PyArg_ParseTuple(args, "OO|n:replace", &from, &to, &count))
         return NULL;
 
-    taint = PyString_GET_MERITS(self);
-
     if (PyString_Check(from)) {
         from_s = PyString_AS_STRING(from);
         from_len = PyString_GET_SIZE(from);
-        if (PyTaint_PropagateTo(&taint, PyString_GET_MERITS(from)) == -1) {
-            goto onError;
-        }
+        operands[noperands++] = from;
     }
 #ifdef Py_USING_UNICODE
     if (PyUnicode_Check(from)) {
-        Py_XDECREF(taint);
         return PyUnicode_Replace((PyObject *)self,
                                  from, to, count);
     }
 #endif
-    else if (PyObject_AsCharBuffer(from, &from_s, &from_len)) {
-        goto onError;
-    }
+    else if (PyObject_AsCharBuffer(from, &from_s, &from_len))
+        return NULL;
 
     if (PyString_Check(to)) {
         to_s = PyString_AS_STRING(to);
         to_len = PyString_GET_SIZE(to);
-        if (PyTaint_PropagateTo(&taint, PyString_GET_MERITS(to)) == -1) {
-            goto onError;
-        }
+        operands[noperands++] = to;
     }
 #ifdef Py_USING_UNICODE
     else if (PyUnicode_Check(to)) {
-        Py_XDECREF(taint);
         return PyUnicode_Replace((PyObject *)self,
                                  from, to, count);
     }
 #endif
-    else if (PyObject_AsCharBuffer(to, &to_s, &to_len)) {
+    else if (PyObject_AsCharBuffer(to, &to_s, &to_len))
+        return NULL;
+
+    taint = PyString_GET_MERITS(self);
+    Py_XINCREF(taint);
+    if (PyTaint_PropagateMany(&taint, operands, noperands) == -1)
         goto onError;
-    }
 
     result = (PyObject *)replace((PyStringObject *) self,
                                from_s, from_len,
@@ -3747,9 +3902,7 @@ do_padding(PyStringObject *self, PyObject *args, int padtype)
             result = (PyObject*)self;
             goto done;
         }
-        result = PyString_FromStringAndSizeSameMerits(PyString_AS_STRING(self),
-                                                      PyString_GET_SIZE(self),
-                                                      taintobj);
+        result = _PyString_CopyWithMerits(self, taintobj);
         // no error check because either way cleanup is the same; also
         // in case of failure, result is NULL
         goto done;
@@ -3847,9 +4000,7 @@ string_zfill(PyStringObject *self, PyObject *args)
             Py_INCREF(self);
             return (PyObject*) self;
         }
-        s = PyString_FromStringAndSizeSameMerits(PyString_AS_STRING(self),
-                                                 PyString_GET_SIZE(self),
-                                                 PyString_GET_MERITS(self));
+        s = _PyString_CopyWithMerits(self, PyString_GET_MERITS(self));
 
         if (s == NULL)
             return NULL;
@@ -4264,6 +4415,7 @@ string_methods[] = {
     {"isclean", (PyCFunction)string_isclean, METH_VARARGS, isclean__doc__},
     {"istainted", (PyCFunction)string_istainted, METH_NOARGS, istainted__doc__},
     {"_cleanfor", (PyCFunction)string_cleanfor, METH_O, cleanfor__doc__},
+    {"withmerits", (PyCFunction)string_withmerits, METH_O, withmerits__doc__},
     {"_merits", (PyCFunction)string_listmerits, METH_NOARGS, listmerits__doc__},
     {"_propagate", (PyCFunction)string_propagate, METH_O, propagate__doc__},
     {"__format__", (PyCFunction) string__format__, METH_VARARGS, p_format__doc__},
@@ -4486,6 +4638,7 @@ _PyString_Resize(PyObject **pv, Py_ssize_t newsize)
 {
     register PyObject *v;
     register PyStringObject *sv;
+    PyTaintObject *merits;
     v = *pv;
     if (!PyString_Check(v) || Py_REFCNT(v) != 1 || newsize < 0 ||
         PyString_CHECK_INTERNED(v)) {
@@ -4497,15 +4650,20 @@ _PyString_Resize(PyObject **pv, Py_ssize_t newsize)
     /* XXX UNREF/NEWREF interface should be more symmetrical */
     _Py_DEC_REFTOTAL;
     _Py_ForgetReference(v);
+    /* the taint may be keyed by the address of the string */
+    merits = PyString_GET_MERITS(v);
+    _PyString_SET_MERITS(v, NULL);
     *pv = (PyObject *)
         PyObject_REALLOC((char *)v, PyStringObject_SIZE + newsize);
     if (*pv == NULL) {
+        Py_XDECREF(merits);
         PyObject_Del(v);
         PyErr_NoMemory();
         return -1;
     }
     _Py_NewReference(*pv);
     sv = (PyStringObject *) *pv;
+    _PyString_SET_MERITS(sv, merits);
     Py_SIZE(sv) = newsize;
     sv->ob_sval[newsize] = '\0';
     sv->ob_shash = -1;          /* invalidate cached hash value */
@@ -4825,7 +4983,8 @@ PyString_Format(PyObject *format, PyObject *args)
     Py_ssize_t reslen, rescnt, fmtcnt;
     int args_owned = 0;
     PyObject *result, *orig_args;
-    PyTaintObject *taint;
+    PyTaint_Accumulator acc;
+    PyTaintObject *taint = NULL;
 #ifdef Py_USING_UNICODE
     PyObject *v = NULL, *w;
 #endif
@@ -4839,11 +4998,11 @@ PyString_Format(PyObject *format, PyObject *args)
     fmtcnt = PyString_GET_SIZE(format);
     reslen = rescnt = fmtcnt + 100;
     result = PyString_FromStringAndSize((char *)NULL, reslen);
-    taint = PyString_GET_MERITS(format);
-    Py_XINCREF(taint);
-
     if (result == NULL)
         return NULL;
+    PyTaint_AccumulatorInit(&acc);
+    if (PyTaint_AccumulatorAdd(&acc, PyString_GET_MERITS(format)) == -1)
+        goto error;
     res = PyString_AsString(result);
     if (PyTuple_Check(args)) {
         arglen = PyTuple_GET_SIZE(args);
@@ -4862,7 +5021,7 @@ PyString_Format(PyObject *format, PyObject *args)
                 rescnt = fmtcnt + 100;
                 reslen += rescnt;
                 if (_PyString_Resize(&result, reslen))
-                    return NULL;
+                    goto error;
                 res = PyString_AS_STRING(result)
                     + reslen - rescnt;
                 --rescnt;
@@ -5069,7 +5228,8 @@ PyString_Format(PyObject *format, PyObject *args)
                     Py_DECREF(temp);
                     goto error;
                 }
-                if (PyTaint_PropagateTo(&taint, PyString_GET_MERITS(temp)) == -1) {
+                if (PyTaint_AccumulatorAdd(&acc,
+                                           PyString_GET_MERITS(temp)) == -1) {
                     Py_DECREF(temp);
                     goto error;
                 }
@@ -5195,13 +5355,13 @@ PyString_Format(PyObject *format, PyObject *args)
                 rescnt = width + fmtcnt + 100;
                 reslen += rescnt;
                 if (reslen < 0) {
-                    Py_DECREF(result);
                     Py_XDECREF(temp);
-                    return PyErr_NoMemory();
+                    PyErr_NoMemory();
+                    goto error;
                 }
                 if (_PyString_Resize(&result, reslen)) {
                     Py_XDECREF(temp);
-                    return NULL;
+                    goto error;
                 }
                 res = PyString_AS_STRING(result)
                     + reslen - rescnt;
@@ -5268,9 +5428,14 @@ PyString_Format(PyObject *format, PyObject *args)
         Py_DECREF(args);
     }
     if (_PyString_Resize(&result, reslen - rescnt))
-        return NULL;
+        goto error;
+    if (PyTaint_AccumulatorResult(&acc, &taint) == -1)
+        goto error;
+    PyTaint_AccumulatorClear(&acc);
 
-    return PyString_AssignTaint((PyStringObject*)result, taint);
+    result = PyString_AssignTaint((PyStringObject*)result, taint);
+    Py_XDECREF(taint);
+    return result;
 
 #ifdef Py_USING_UNICODE
  unicode:
@@ -5312,6 +5477,9 @@ PyString_Format(PyObject *format, PyObject *args)
         goto error;
     /* Assign taint to what we have so far, so that concat won't mess up
        taint propagation. */
+    if (PyTaint_AccumulatorResult(&acc, &taint) == -1)
+        goto error;
+    PyTaint_AccumulatorClear(&acc);
     result = (PyObject*)PyString_AssignTaint((PyStringObject*)result,
                                              taint);
 
@@ -5329,6 +5497,7 @@ PyString_Format(PyObject *format, PyObject *args)
 #endif /* Py_USING_UNICODE */
 
  error:
+    PyTaint_AccumulatorClear(&acc);
     Py_XDECREF(v);
     Py_XDECREF(result);
     Py_XDECREF(taint);
@@ -5342,26 +5511,21 @@ void
 PyString_InternInPlace(PyObject **p)
 {
     register PyStringObject *s = (PyStringObject *)(*p);
-    PyObject *t;
+    PyObject *table, *t;
     if (s == NULL || !PyString_Check(s))
         Py_FatalError("PyString_InternInPlace: strings only please!");
     /* If it's a string subclass, we don't really know what putting
        it in the interned dict might do. */
     if (!PyString_CheckExact(s))
         return;
-    if (PyString_GET_MERITS(s) != NULL) {
-        Py_FatalError("PyString_InternInPlace: untainted strings only please!");
-    }
     if (PyString_CHECK_INTERNED(s))
         return;
-    if (interned == NULL) {
-        interned = PyDict_New();
-        if (interned == NULL) {
-            PyErr_Clear(); /* Don't leave an exception */
-            return;
-        }
+    table = interned_dict((PyObject *)s, 1);
+    if (table == NULL) {
+        PyErr_Clear(); /* Don't leave an exception */
+        return;
     }
-    t = PyDict_GetItem(interned, (PyObject *)s);
+    t = PyDict_GetItem(table, (PyObject *)s);
     if (t) {
         Py_INCREF(t);
         Py_DECREF(*p);
@@ -5369,7 +5533,7 @@ PyString_InternInPlace(PyObject **p)
         return;
     }
 
-    if (PyDict_SetItem(interned, (PyObject *)s, (PyObject *)s) < 0) {
+    if (PyDict_SetItem(table, (PyObject *)s, (PyObject *)s) < 0) {
         PyErr_Clear();
         return;
     }
@@ -5400,6 +5564,14 @@ PyString_InternFromString(const char *cp)
     return s;
 }
 
+void
+_PyString_ClearTaintedChars(void)
+{
+    int i;
+    for (i = 0; i < TAINTED_CHARS_SIZE; i++)
+        Py_CLEAR(tainted_chars[i]);
+}
+
 void
 PyString_Fini(void)
 {
@@ -5407,31 +5579,25 @@ PyString_Fini(void)
     for (i = 0; i < UCHAR_MAX + 1; i++)
         Py_CLEAR(characters[i]);
     Py_CLEAR(nullstring);
+    _PyString_ClearTaintedChars();
 }
 
-void _Py_ReleaseInternedStrings(void)
+/* Give strings interned in table their stolen references back and mark
+   them as not interned. Returns the number of strings, or -1 on failure. */
+static Py_ssize_t
+release_interned(PyObject *table, Py_ssize_t *mortal_size,
+                 Py_ssize_t *immortal_size)
 {
     PyObject *keys;
     PyStringObject *s;
     Py_ssize_t i, n;
-    Py_ssize_t immortal_size = 0, mortal_size = 0;
 
-    if (interned == NULL || !PyDict_Check(interned))
-        return;
-    keys = PyDict_Keys(interned);
+    keys = PyDict_Keys(table);
     if (keys == NULL || !PyList_Check(keys)) {
         PyErr_Clear();
-        return;
+        return -1;
     }
-
-    /* Since _Py_ReleaseInternedStrings() is intended to help a leak
-       detector, interned strings are not forcibly deallocated; rather, we
-       give them their stolen references back, and then clear and DECREF
-       the interned dict. */
-
     n = PyList_GET_SIZE(keys);
-    fprintf(stderr, "releasing %" PY_FORMAT_SIZE_T "d interned strings\n",
-        n);
     for (i = 0; i < n; i++) {
         s = (PyStringObject *) PyList_GET_ITEM(keys, i);
         switch (s->ob_sstate) {
@@ -5440,21 +5606,58 @@ void _Py_ReleaseInternedStrings(void)
             break;
         case SSTATE_INTERNED_IMMORTAL:
             Py_REFCNT(s) += 1;
-            immortal_size += Py_SIZE(s);
+            *immortal_size += Py_SIZE(s);
             break;
         case SSTATE_INTERNED_MORTAL:
             Py_REFCNT(s) += 2;
-            mortal_size += Py_SIZE(s);
+            *mortal_size += Py_SIZE(s);
             break;
         default:
             Py_FatalError("Inconsistent interned string state.");
         }
         s->ob_sstate = SSTATE_NOT_INTERNED;
     }
+    Py_DECREF(keys);
+    PyDict_Clear(table);
+    return n;
+}
+
+void _Py_ReleaseInternedStrings(void)
+{
+    PyObject *tables;
+    Py_ssize_t i, n, released;
+    Py_ssize_t immortal_size = 0, mortal_size = 0;
+
+    if (interned == NULL || !PyDict_Check(interned))
+        return;
+
+    /* Since _Py_ReleaseInternedStrings() is intended to help a leak
+       detector, interned strings are not forcibly deallocated; rather, we
+       give them their stolen references back, and then clear and DECREF
+       the interned dict. */
+
+    n = release_interned(interned, &mortal_size, &immortal_size);
+    if (n < 0)
+        return;
+    if (tainted_interned != NULL) {
+        tables = PyDict_Values(tainted_interned);
+        if (tables == NULL) {
+            PyErr_Clear();
+            return;
+        }
+        for (i = 0; i < PyList_GET_SIZE(tables); i++) {
+            released = release_interned(PyList_GET_ITEM(tables, i),
+                                        &mortal_size, &immortal_size);
+            if (released > 0)
+                n += released;
+        }
+        Py_DECREF(tables);
+        Py_CLEAR(tainted_interned);
+    }
+    fprintf(stderr, "releasing %" PY_FORMAT_SIZE_T "d interned strings\n",
+        n);
     fprintf(stderr, "total size of all interned strings: "
                     "%" PY_FORMAT_SIZE_T "d/%" PY_FORMAT_SIZE_T "d "
                     "mortal/immortal\n", mortal_size, immortal_size);
-    Py_DECREF(keys);
-    PyDict_Clear(interned);
     Py_CLEAR(interned);
 }
@@ -4,37 +4,565 @@
 #include <ctype.h>
 #include <stddef.h>
 
+/* Canonicalisation table of taint objects - an open addressing hash table
+   (with linear probing) of all live taint objects, keyed by their bits. It
+   holds borrowed references; a taint object removes itself from the table
+   when it is deallocated. */
+static PyTaintObject **canonical_table = NULL;
+static Py_ssize_t canonical_mask = -1;      /* table size - 1 */
+static Py_ssize_t canonical_used = 0;
+
+int _PyTaint_Enabled = 1;
+
+/* The taint without merits is kept alive forever. */
+static PyTaintObject *empty_taint = NULL;
+
+/* Size of stack buffers for computing taint bits - taints with more words
+   use a heap allocated buffer. */
+#define TAINT_STACK_WORDS 8
+
+#ifdef Py_TAINT_COMPACT
+/* Taint table for compact string taint (see taintobject.h). Before the first
+   taint object is created it's a static array with just the NULL slot 0, so
+   that PyString_GET_MERITS works for clean strings right from the start.
+   Released slots are kept on a stack and reused. */
+static PyTaintObject *taint_table_initial[1] = {NULL};
+PyTaintObject **_PyTaint_Table = taint_table_initial;
+static Py_ssize_t taint_table_size = 1;         /* slots ever handed out */
+static Py_ssize_t taint_table_allocated = 1;
+static unsigned int *taint_table_free = NULL;   /* stack of released slots */
+static Py_ssize_t taint_table_nfree = 0;
+
+/* Take a free slot of the taint table. Returns its index, or -1 on failure. */
+static Py_ssize_t
+taint_table_take(void)
+{
+    PyTaintObject **table;
+    unsigned int *free_slots;
+    Py_ssize_t allocated;
+
+    if (taint_table_nfree > 0)
+        return taint_table_free[--taint_table_nfree];
+
+    if (taint_table_size == taint_table_allocated) {
+        if (taint_table_allocated >= ((Py_ssize_t)1 << PyTaint_INDEX_BITS)) {
+            PyErr_SetString(PyExc_MemoryError, "too many distinct taints");
+            return -1;
+        }
+        allocated = taint_table_allocated < 64 ? 64 :
+                    2 * taint_table_allocated;
+        if (allocated > ((Py_ssize_t)1 << PyTaint_INDEX_BITS))
+            allocated = (Py_ssize_t)1 << PyTaint_INDEX_BITS;
+
+        free_slots = PyMem_NEW(unsigned int, allocated);
+        if (free_slots == NULL) {
+            PyErr_NoMemory();
+            return -1;
+        }
+        if (_PyTaint_Table == taint_table_initial)
+            table = PyMem_NEW(PyTaintObject*, allocated);
+        else
+            table = (PyTaintObject**)PyMem_REALLOC(_PyTaint_Table,
+                                  allocated * sizeof(PyTaintObject*));
+        if (table == NULL) {
+            PyMem_FREE(free_slots);
+            PyErr_NoMemory();
+            return -1;
+        }
+        if (_PyTaint_Table == taint_table_initial)
+            table[0] = NULL;
+        /* the free stack is empty, nothing to copy */
+        PyMem_FREE(taint_table_free);
+        taint_table_free = free_slots;
+        _PyTaint_Table = table;
+        taint_table_allocated = allocated;
+    }
+    return taint_table_size++;
+}
+
+/* Put slot i of the taint table back on the free stack. */
+static void
+taint_table_put(Py_ssize_t i)
+{
+    assert(i > 0 && i < taint_table_size);
+    _PyTaint_Table[i] = NULL;
+    taint_table_free[taint_table_nfree++] = (unsigned int)i;
+}
+#endif
+
+#ifdef Py_TAINT_SIDETABLE
+/* Side table of string taint (see taintobject.h) - an open addressing hash
+   table (with linear probing and backward shift deletion, so that there are
+   no tombstones) mapping addresses of tainted str and unicode objects to
+   their taint objects. The references to taint objects are owned by the
+   strings, the table just holds them. */
+typedef struct {
+    PyObject *st_key;
+    PyTaintObject *st_value;
+} sidetable_entry;
+
+static sidetable_entry *sidetable = NULL;
+static size_t sidetable_mask = 0;           /* table size - 1 */
+static Py_ssize_t sidetable_used = 0;
+Py_ssize_t _PyTaint_SideTableUnicode = 0;
+
+#define SIDETABLE_MINSIZE 64
+
+#define SIDETABLE_HASH(op) \
+    ((size_t)((Py_uintptr_t)(op) >> 3) ^ (size_t)((Py_uintptr_t)(op) >> 17))
+
+/* Return entry of op, or the empty entry where it should be inserted. The
+   table must be allocated. */
+static sidetable_entry *
+sidetable_lookup(PyObject *op)
+{
+    size_t i = SIDETABLE_HASH(op) & sidetable_mask;
+
+    while (sidetable[i].st_key != NULL && sidetable[i].st_key != op)
+        i = (i + 1) & sidetable_mask;
+    return &sidetable[i];
+}
+
+/* Rehash the table into a new one with given size (a power of two bigger
+   than the number of used entries). Returns 0 on success, -1 if the memory
+   couldn't be allocated (the table is left intact then). */
+static int
+sidetable_resize(size_t size)
+{
+    sidetable_entry *old = sidetable, *entry;
+    size_t old_size = old == NULL ? 0 : sidetable_mask + 1;
+    size_t i;
+
+    sidetable = PyMem_NEW(sidetable_entry, size);
+    if (sidetable == NULL) {
+        sidetable = old;
+        return -1;
+    }
+    memset(sidetable, 0, size * sizeof(sidetable_entry));
+    sidetable_mask = size - 1;
+    for (i = 0; i < old_size; i++) {
+        if (old[i].st_key != NULL) {
+            entry = sidetable_lookup(old[i].st_key);
+            *entry = old[i];
+        }
+    }
+    PyMem_FREE(old);
+    return 0;
+}
+
+static void
+sidetable_remove(sidetable_entry *entry)
+{
+    size_t i = entry - sidetable, j = i, k;
+
+    if (!PyString_Check(entry->st_key))
+        _PyTaint_SideTableUnicode--;
+    sidetable_used--;
+    for (;;) {
+        j = (j + 1) & sidetable_mask;
+        if (sidetable[j].st_key == NULL)
+            break;
+        k = SIDETABLE_HASH(sidetable[j].st_key) & sidetable_mask;
+        /* Move entry j into the hole at i unless its home slot k is
+           cyclically in (i, j]. */
+        if (i <= j ? (k <= i || k > j) : (k <= i && k > j)) {
+            sidetable[i] = sidetable[j];
+            i = j;
+        }
+    }
+    sidetable[i].st_key = NULL;
+    sidetable[i].st_value = NULL;
+
+    /* Shrink the table when most strings got untainted or died; failing to
+       do that is harmless. */
+    if (sidetable_mask + 1 > SIDETABLE_MINSIZE &&
+        (size_t)sidetable_used < (sidetable_mask + 1) / 8)
+        sidetable_resize((sidetable_mask + 1) / 4);
+}
+
+PyTaintObject *
+_PyTaint_SideTableGet(PyObject *op)
+{
+    if (sidetable_used == 0)
+        return NULL;
+    return sidetable_lookup(op)->st_value;
+}
+
+int
+_PyTaint_SideTableSet(PyObject *op, PyTaintObject *taint)
+{
+    sidetable_entry *entry;
+    size_t size;
+
+    if (taint == NULL) {
+        if (sidetable_used != 0) {
+            entry = sidetable_lookup(op);
+            if (entry->st_key != NULL)
+                sidetable_remove(entry);
+        }
+        return 0;
+    }
+
+    size = sidetable == NULL ? 0 : sidetable_mask + 1;
+    if ((size_t)(sidetable_used + 1) * 3 >= size * 2) {
+        if (sidetable_resize(size == 0 ? SIDETABLE_MINSIZE : size * 2) < 0)
+            Py_FatalError("out of memory growing the taint side table");
+    }
+    entry = sidetable_lookup(op);
+    if (entry->st_key == NULL) {
+        entry->st_key = op;
+        sidetable_used++;
+        if (!PyString_Check(op))
+            _PyTaint_SideTableUnicode++;
+    }
+    entry->st_value = taint;
+    return 1;
+}
+#endif
+
+static long
+taint_hash_bits(const PyTaint_Word *bits, Py_ssize_t n)
+{
+    PY_UINT64_T x = (PY_UINT64_T)n;
+    Py_ssize_t i;
+
+    for (i = 0; i < n; i++)
+        x = (x ^ bits[i]) * 0x100000001b3ULL;
+    x ^= x >> 32;
+    return (long)x == -1 ? -2 : (long)x;
+}
+
+/* Return slot of taint object with given bits, or of the empty slot where it
+   should be inserted. */
+static Py_ssize_t
+canonical_lookup(const PyTaint_Word *bits, Py_ssize_t n, long hash)
+{
+    Py_ssize_t i = (Py_ssize_t)((size_t)hash & canonical_mask);
+    PyTaintObject *t;
+
+    while ((t = canonical_table[i]) != NULL) {
+        if (t->ob_hash == hash && Py_SIZE(t) == n &&
+            memcmp(t->ob_bits, bits, n * sizeof(PyTaint_Word)) == 0)
+            return i;
+        i = (i + 1) & canonical_mask;
+    }
+    return i;
+}
+
+static int
+canonical_resize(Py_ssize_t minused)
+{
+    PyTaintObject **old_table = canonical_table, *t;
+    Py_ssize_t old_mask = canonical_mask, size, i, j;
+
+    for (size = 64; size <= minused * 2; size <<= 1)
+        ;
+    canonical_table = PyMem_NEW(PyTaintObject*, size);
+    if (canonical_table == NULL) {
+        canonical_table = old_table;
+        PyErr_NoMemory();
+        return -1;
+    }
+    memset(canonical_table, 0, size * sizeof(PyTaintObject*));
+    canonical_mask = size - 1;
+
+    for (i = 0; i <= old_mask; i++) {
+        t = old_table[i];
+        if (t == NULL)
+            continue;
+        j = (Py_ssize_t)((size_t)t->ob_hash & canonical_mask);
+        while (canonical_table[j] != NULL)
+            j = (j + 1) & canonical_mask;
+        canonical_table[j] = t;
+    }
+    PyMem_FREE(old_table);
+    return 0;
+}
+
+static void
+canonical_remove(PyTaintObject *taint)
+{
+    Py_ssize_t i, j, k;
+
+    i = (Py_ssize_t)((size_t)taint->ob_hash & canonical_mask);
+    while (canonical_table[i] != taint) {
+        assert(canonical_table[i] != NULL);
+        i = (i + 1) & canonical_mask;
+    }
+
+    /* Shift back entries following the removed one, so that lookups don't
+       stop at the hole. */
+    for (j = (i + 1) & canonical_mask; canonical_table[j] != NULL;
+         j = (j + 1) & canonical_mask) {
+        k = (Py_ssize_t)((size_t)canonical_table[j]->ob_hash &
+                         canonical_mask);
+        if ((i <= j) ? (i < k && k <= j) : (i < k || k <= j))
+            continue;
+        canonical_table[i] = canonical_table[j];
+        i = j;
+    }
+    canonical_table[i] = NULL;
+    canonical_used--;
+}
+
+static void
+taint_dealloc(PyTaintObject *self)
+{
+    canonical_remove(self);
+#ifdef Py_TAINT_COMPACT
+    taint_table_put(self->ob_index);
+#endif
+    Py_TYPE(self)->tp_free((PyObject*)self);
+}
+
+PyTypeObject PyTaint_Type = {
+    PyVarObject_HEAD_INIT(&PyType_Type, 0)
+    "taint.Taint",                              /* tp_name */
+    offsetof(PyTaintObject, ob_bits),           /* tp_basicsize */
+    sizeof(PyTaint_Word),                       /* tp_itemsize */
+    (destructor)taint_dealloc,                  /* tp_dealloc */
+    0,                                          /* tp_print */
+    0,                                          /* tp_getattr */
+    0,                                          /* tp_setattr */
+    0,                                          /* tp_compare */
+    0,                                          /* tp_repr */
+    0,                                          /* tp_as_number */
+    0,                                          /* tp_as_sequence */
+    0,                                          /* tp_as_mapping */
+    0,                                          /* tp_hash */
+    0,                                          /* tp_call */
+    0,                                          /* tp_str */
+    0,                                          /* tp_getattro */
+    0,                                          /* tp_setattro */
+    0,                                          /* tp_as_buffer */
+    Py_TPFLAGS_DEFAULT,                         /* tp_flags */
+    "Taint object",                             /* tp_doc */
+    0,                                          /* tp_traverse */
+    0,                                          /* tp_clear */
+    0,                                          /* tp_richcompare */
+    0,                                          /* tp_weaklistoffset */
+    0,                                          /* tp_iter */
+    0,                                          /* tp_iternext */
+    0,                                          /* tp_methods */
+    0,                                          /* tp_members */
+    0,                                          /* tp_getset */
+    0,                                          /* tp_base */
+    0,                                          /* tp_dict */
+    0,                                          /* tp_descr_get */
+    0,                                          /* tp_descr_set */
+    0,                                          /* tp_dictoffset */
+    0,                                          /* tp_init */
+    0,                                          /* tp_alloc */
+    0,                                          /* tp_new */
+    PyObject_Del,                               /* tp_free */
+};
+
+/* Return (a new reference to) the canonical taint object with the first n
+   words of bits. A new object is created only when there is no live taint
+   with those bits. Returns NULL on failure. */
+static PyTaintObject *
+taint_from_bits(const PyTaint_Word *bits, Py_ssize_t n)
+{
+    PyTaintObject *taint;
+    Py_ssize_t i;
+    long hash;
+#ifdef Py_TAINT_COMPACT
+    Py_ssize_t slot;
+#endif
+
+    while (n > 0 && bits[n - 1] == 0)
+        n--;
+    if (n == 0 && empty_taint != NULL) {
+        Py_INCREF(empty_taint);
+        return empty_taint;
+    }
+
+    hash = taint_hash_bits(bits, n);
+    if (canonical_table != NULL) {
+        i = canonical_lookup(bits, n, hash);
+        if (canonical_table[i] != NULL) {
+            Py_INCREF(canonical_table[i]);
+            return canonical_table[i];
+        }
+    }
+
+    /* Keep the table at most half full */
+    if (2 * (canonical_used + 1) > canonical_mask + 1 &&
+        canonical_resize(canonical_used + 1) < 0)
+        return NULL;
+
+#ifdef Py_TAINT_COMPACT
+    slot = taint_table_take();
+    if (slot < 0)
+        return NULL;
+#endif
+    taint = PyObject_NewVar(PyTaintObject, &PyTaint_Type, n);
+    if (taint == NULL) {
+#ifdef Py_TAINT_COMPACT
+        taint_table_put(slot);
+#endif
+        return NULL;
+    }
+#ifdef Py_TAINT_COMPACT
+    taint->ob_index = (unsigned int)slot;
+    _PyTaint_Table[slot] = taint;
+#endif
+    taint->ob_hash = hash;
+    memcpy(taint->ob_bits, bits, n * sizeof(PyTaint_Word));
+
+    i = canonical_lookup(bits, n, hash);
+    canonical_table[i] = taint;
+    canonical_used++;
+    return taint;
+}
+
 PyTaintObject *
-PyTaint_EmptyMerits()
+PyTaint_EmptyMerits(void)
 {
-    return (PyTaintObject*)PyTuple_New(0);
+    if (empty_taint == NULL) {
+        empty_taint = taint_from_bits(NULL, 0);
+        if (empty_taint == NULL)
+            return NULL;
+    }
+    Py_INCREF(empty_taint);
+    return empty_taint;
 }
 
 PyTaintObject *
 _PyTaint_AddMerit(PyTaintObject *taint, PyObject *merit)
 {
-    PyObject *result;
-    Py_ssize_t n, i;
-    PyObject *item;
-    n = PyTuple_GET_SIZE(taint);
-    result = PyTuple_New(n + 1);
+    PyTaint_Word stack_bits[TAINT_STACK_WORDS], *bits = stack_bits;
+    PyTaintObject *result;
+    Py_ssize_t id, n, w;
+
+    assert(PyMerit_Check(merit));
+    id = PyMerit_ID(merit);
+    w = PyTaint_WORD_INDEX(id);
+
+    if (w < Py_SIZE(taint) && (taint->ob_bits[w] & PyTaint_WORD_BIT(id))) {
+        Py_INCREF(taint);
+        return taint;
+    }
+
+    n = Py_SIZE(taint) > w ? Py_SIZE(taint) : w + 1;
+    if (n > TAINT_STACK_WORDS) {
+        bits = PyMem_NEW(PyTaint_Word, n);
+        if (bits == NULL)
+            return (PyTaintObject*)PyErr_NoMemory();
+    }
+    memset(bits, 0, n * sizeof(PyTaint_Word));
+    memcpy(bits, taint->ob_bits, Py_SIZE(taint) * sizeof(PyTaint_Word));
+    bits[w] |= PyTaint_WORD_BIT(id);
+
+    result = taint_from_bits(bits, n);
+    if (bits != stack_bits)
+        PyMem_FREE(bits);
+    return result;
+}
+
+PyTaintObject *
+_PyTaint_AddMerits(PyTaintObject *taint, PyObject *merits)
+{
+    PyTaint_Word stack_bits[TAINT_STACK_WORDS], *bits = stack_bits, *tmp;
+    PyTaintObject *result = NULL;
+    PyObject *iter, *merit;
+    Py_ssize_t id, n, w, size = TAINT_STACK_WORDS;
+
+    n = taint == NULL ? 0 : Py_SIZE(taint);
+    if (n > size) {
+        size = n;
+        bits = PyMem_NEW(PyTaint_Word, size);
+        if (bits == NULL)
+            return (PyTaintObject*)PyErr_NoMemory();
+    }
+    memset(bits, 0, size * sizeof(PyTaint_Word));
+    if (n > 0)
+        memcpy(bits, taint->ob_bits, n * sizeof(PyTaint_Word));
+
+    iter = PyObject_GetIter(merits);
+    if (iter == NULL)
+        goto done;
+    while ((merit = PyIter_Next(iter)) != NULL) {
+        if (_PyTaint_ValidMerit(merit) == -1) {
+            Py_DECREF(merit);
+            goto done;
+        }
+        id = PyMerit_ID(merit);
+        Py_DECREF(merit);
+        w = PyTaint_WORD_INDEX(id);
+        if (w >= size) {
+            tmp = PyMem_NEW(PyTaint_Word, w + 1);
+            if (tmp == NULL) {
+                PyErr_NoMemory();
+                goto done;
+            }
+            memcpy(tmp, bits, size * sizeof(PyTaint_Word));
+            memset(tmp + size, 0, (w + 1 - size) * sizeof(PyTaint_Word));
+            if (bits != stack_bits)
+                PyMem_FREE(bits);
+            bits = tmp;
+            size = w + 1;
+        }
+        bits[w] |= PyTaint_WORD_BIT(id);
+        if (w >= n)
+            n = w + 1;
+    }
+    if (!PyErr_Occurred())
+        result = taint_from_bits(bits, n);
+
+done:
+    Py_XDECREF(iter);
+    if (bits != stack_bits)
+        PyMem_FREE(bits);
+    return result;
+}
+
+int
+_PyTaint_HasMerit(PyTaintObject *taint, PyObject *merit)
+{
+    Py_ssize_t id;
+
+    if (!PyMerit_Check(merit)) {
+        PyErr_SetString(PyExc_TypeError,
+                        "Invalid merit object passed.");
+        return -1;
+    }
+    id = PyMerit_ID(merit);
+    if (PyTaint_WORD_INDEX(id) >= Py_SIZE(taint))
+        return 0;
+    return (taint->ob_bits[PyTaint_WORD_INDEX(id)] &
+            PyTaint_WORD_BIT(id)) != 0;
+}
+
+PyObject *
+_PyTaint_GetMerits(PyTaintObject *taint)
+{
+    PyObject *result, *merit;
+    PyTaint_Word word;
+    Py_ssize_t i, id;
+
+    result = PySet_New(NULL);
     if (result == NULL)
         return NULL;
 
-    for (i = 0; i < n; i++) {
-        item = PyTuple_GET_ITEM(taint, i);
-        Py_INCREF(item);
-        PyTuple_SET_ITEM(result, i, item);
+    for (i = 0; i < Py_SIZE(taint); i++) {
+        word = taint->ob_bits[i];
+        for (id = i * PyTaint_WORD_BITS; word != 0; id++, word >>= 1) {
+            if (!(word & 1))
+                continue;
+            merit = _PyMerit_FromId(id);
+            if (merit != NULL && PySet_Add(result, merit) == -1) {
+                Py_DECREF(result);
+                return NULL;
+            }
+        }
     }
-    Py_INCREF(merit);
-    PyTuple_SET_ITEM(result, n, merit);
-
-    return (PyTaintObject*)result;
+    return result;
 }
 
 int
 _PyTaint_TaintStringListItems(PyObject *target, PyTaintObject *source) {
-    if (PyTaint_IS_CLEAN(source))
+    if (PyTaint_IS_CLEAN(source) || !_PyTaint_Enabled)
         return 1;
     Py_ssize_t i, n;
     PyObject *item, *old_item;
@@ -45,10 +573,7 @@ _PyTaint_TaintStringListItems(PyObject *target, PyTaintObject *source) {
         if (PyString_CHECK_INTERNED(item) ||
             item->ob_refcnt > 1) {
             old_item = item;
-            item = PyString_FromStringAndSizeSameMerits(
-                                      PyString_AS_STRING(item),
-                                      PyString_GET_SIZE(item),
-                                      source);
+            item = _PyString_CopyWithMerits((PyStringObject *)item, source);
             if (item == NULL)
                 return -1;
             Py_DECREF(old_item);
@@ -83,10 +608,7 @@ _PyTaint_TaintStringTupleItems(PyObject *target, PyTaintObject *source) {
         if (PyString_CHECK_INTERNED(item) ||
             item->ob_refcnt > 1) {
             old_item = item;
-            item = PyString_FromStringAndSizeSameMerits(
-                                      PyString_AS_STRING(item),
-                                      PyString_GET_SIZE(item),
-                                      source);
+            item = _PyString_CopyWithMerits((PyStringObject *)item, source);
             if (item == NULL) {
                 result = NULL;
                 goto done;
@@ -130,10 +652,7 @@ _PyTaint_TaintUnicodeTupleItems(PyObject *target, PyTaintObject *source) {
         if (item->ob_refcnt > 1 ||
             PyUnicode_IsShared((PyUnicodeObject*)item)) {
             old_item = item;
-            item = PyUnicode_FromUnicodeSameMerits(
-                                      PyUnicode_AS_UNICODE(item),
-                                      PyUnicode_GET_SIZE(item),
-                                      source);
+            item = _PyUnicode_CopyWithMerits((PyUnicodeObject *)item, source);
             if (item == NULL) {
                 result = NULL;
                 goto done;
@@ -175,7 +694,7 @@ PyTaint_IsTaintable(PyObject *obj) {
 
 int
 _PyTaint_TaintUnicodeListItems(PyObject *target, PyTaintObject *source) {
-    if (PyTaint_IS_CLEAN(source))
+    if (PyTaint_IS_CLEAN(source) || !_PyTaint_Enabled)
         return 1;
     Py_ssize_t i, n;
     PyObject *item, *old_item;
@@ -186,10 +705,7 @@ _PyTaint_TaintUnicodeListItems(PyObject *target, PyTaintObject *source) {
         if (PyUnicode_IsShared((PyUnicodeObject*)item) ||
             item->ob_refcnt > 1) {
             old_item = item;
-            item = PyUnicode_FromUnicodeSameMerits(
-                                      PyUnicode_AS_UNICODE(item),
-                                      PyUnicode_GET_SIZE(item),
-                                      source);
+            item = _PyUnicode_CopyWithMerits((PyUnicodeObject *)item, source);
             if (item == NULL)
                 return -1;
             Py_DECREF(old_item);
@@ -227,107 +743,374 @@ _PyTaint_GetFromObject(PyObject *obj) {
     return NULL;
 }
 
+/* Returns 1 if first n words of bits are the same as bits of taint t. */
+static int
+taint_equal_bits(PyTaintObject *t, const PyTaint_Word *bits, Py_ssize_t n)
+{
+    while (n > 0 && bits[n - 1] == 0)
+        n--;
+    return Py_SIZE(t) == n &&
+           memcmp(t->ob_bits, bits, n * sizeof(PyTaint_Word)) == 0;
+}
+
+/* Compute propagation result of tainted a and b, where b is NULL when the
+   other operand was clean, using given strategy masks. Returns a new
+   reference or NULL on failure. */
+static PyTaintObject *
+propagation_compute(PyTaintObject *a, PyTaintObject *b,
+                    PyTaint_Word *full, PyTaint_Word *keep,
+                    PyTaint_Word *invalid_mask)
+{
+    PyTaint_Word stack_bits[TAINT_STACK_WORDS], *bits = stack_bits;
+    PyTaintObject *result = NULL;
+    PyTaint_Word invalid = 0;
+    Py_ssize_t i, n;
+
+    n = Py_SIZE(a);
+    if (b != NULL && Py_SIZE(b) < n)
+        n = Py_SIZE(b);
+    if (n > TAINT_STACK_WORDS) {
+        bits = PyMem_NEW(PyTaint_Word, n);
+        if (bits == NULL)
+            return (PyTaintObject*)PyErr_NoMemory();
+    }
+
+    if (b != NULL) {
+        // Both tainted - intersect merits and keep full and partial ones
+        for (i = 0; i < n; i++) {
+            invalid |= a->ob_bits[i] & b->ob_bits[i] & invalid_mask[i];
+            bits[i] = a->ob_bits[i] & b->ob_bits[i] & keep[i];
+        }
+    } else {
+        // One untainted, other tainted - keep full merits of the tainted one
+        for (i = 0; i < n; i++) {
+            invalid |= a->ob_bits[i] & invalid_mask[i];
+            bits[i] = a->ob_bits[i] & full[i];
+        }
+    }
+
+    if (invalid) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Invalid taint propagation strategy.");
+    } else if (taint_equal_bits(a, bits, n)) {
+        result = a;
+        Py_INCREF(result);
+    } else if (b != NULL && taint_equal_bits(b, bits, n)) {
+        result = b;
+        Py_INCREF(result);
+    } else {
+        result = taint_from_bits(bits, n);
+    }
+    if (bits != stack_bits)
+        PyMem_FREE(bits);
+    return result;
+}
+
+/* Propagation cache - a direct mapped cache of propagation results, keyed
+   by identity of (canonical) operand taints. Entries own references to all
+   three taints, so the keys can't be reused by other objects while cached.
+   The cache is invalidated whenever any merit's strategy changes. Threads
+   with propagation overrides bypass it. */
+typedef struct {
+    PyTaintObject *a;
+    PyTaintObject *b;       /* NULL when the other operand was clean */
+    PyTaintObject *result;
+} propagation_cache_entry;
+
+static propagation_cache_entry
+    propagation_cache[PyTaint_PROPAGATION_CACHE_SIZE];
+static Py_ssize_t propagation_cache_hits = 0;
+static Py_ssize_t propagation_cache_misses = 0;
+static Py_ssize_t propagation_cache_evictions = 0;
+static Py_ssize_t propagation_cache_invalidations = 0;
+
+#define PROPAGATION_CACHE_INDEX(a, b) \
+    ((((size_t)(a) >> 4) * 31 + ((size_t)(b) >> 4)) & \
+     (PyTaint_PROPAGATION_CACHE_SIZE - 1))
+
+void
+_PyTaint_ClearPropagationCache(void)
+{
+    propagation_cache_entry *entry;
+    Py_ssize_t i;
+
+    for (i = 0; i < PyTaint_PROPAGATION_CACHE_SIZE; i++) {
+        entry = &propagation_cache[i];
+        if (entry->a == NULL)
+            continue;
+        Py_CLEAR(entry->a);
+        Py_CLEAR(entry->b);
+        Py_CLEAR(entry->result);
+    }
+    propagation_cache_invalidations++;
+}
+
+void
+_PyTaint_GetPropagationCacheInfo(PyTaint_PropagationCacheInfo *info)
+{
+    Py_ssize_t i;
+
+    info->hits = propagation_cache_hits;
+    info->misses = propagation_cache_misses;
+    info->evictions = propagation_cache_evictions;
+    info->invalidations = propagation_cache_invalidations;
+    info->size = PyTaint_PROPAGATION_CACHE_SIZE;
+    info->used = 0;
+    for (i = 0; i < PyTaint_PROPAGATION_CACHE_SIZE; i++)
+        if (propagation_cache[i].a != NULL)
+            info->used++;
+}
+
+void
+_PyTaint_ResetPropagationCacheInfo(void)
+{
+    propagation_cache_hits = 0;
+    propagation_cache_misses = 0;
+    propagation_cache_evictions = 0;
+    propagation_cache_invalidations = 0;
+}
+
 int
 PyTaint_PropagationResult(PyTaintObject **target,
                           PyTaintObject *a,
                           PyTaintObject *b)
 {
-    PyObject *new_merits = NULL;
-    register PyObject *src, *m;
-    // n is upper bound of new_merits size, j is its actual size at given
-    // moment
-    register Py_ssize_t i, n, j;
-    int contains;
-
-    // Both untainted
-    if (PyTaint_IS_CLEAN(a) && PyTaint_IS_CLEAN(b)) {
+    PyTaintObject *result = NULL, *tmp;
+    PyTaint_Word *full, *keep, *invalid;
+    propagation_cache_entry *entry;
+
+    // Both untainted, or taint tracking is off
+    if ((PyTaint_IS_CLEAN(a) && PyTaint_IS_CLEAN(b)) || !_PyTaint_Enabled) {
         goto done;
     }
 
-    j = 0;
-
-    // Both tainted - intersect two merits list
-    if (!PyTaint_IS_CLEAN(a) && !PyTaint_IS_CLEAN(b)) {
-        n = PyTuple_GET_SIZE(a) > PyTuple_GET_SIZE(b) ?
-              PyTuple_GET_SIZE(a) : PyTuple_GET_SIZE(b);
-        new_merits = PyTuple_New(n);
-        if (new_merits == NULL)
-          return -1;
-
-        for (i = 0; i < PyTuple_GET_SIZE(a); i++) {
-            m = PyTuple_GET_ITEM(a, i);
-            contains = PySequence_Contains((PyObject*)b, m);
-            if (contains == -1)
-                goto onError;
-            if (contains == 1) {
-                if (PyMerit_FULL_PROPAGATION(m) || \
-                    PyMerit_PARTIAL_PROPAGATION(m)) {
-                    Py_INCREF(m);
-                    PyTuple_SET_ITEM(new_merits, j, m);
-                    j += 1;
-                } else if(!PyMerit_NONE_PROPAGATION(m)) {
-                    PyErr_SetString(PyExc_ValueError,
-                                    "Invalid taint propagation strategy.");
-                    goto onError;
-                }
-            }
-        }
-        // _PyTupleResize will set new_merits to NULL on failure, so instead of
-        // goto onError just return -1
-        if (_PyTuple_Resize(&new_merits, j) != 0)
-          return -1;
+    // Normalize the key: the result doesn't depend on operands' order.
+    if (PyTaint_IS_CLEAN(a)) {
+        a = b;
+        b = NULL;
+    } else if (PyTaint_IS_CLEAN(b)) {
+        b = NULL;
+    } else if (a > b) {
+        tmp = a;
+        a = b;
+        b = tmp;
+    }
 
+    if (_PyMerit_OVERRIDDEN()) {
+        if (_PyMerit_GetMasks(&full, &keep, &invalid) < 0)
+            return -1;
+        result = propagation_compute(a, b, full, keep, invalid);
+        if (result == NULL)
+            return -1;
         goto done;
     }
-    // One untainted, other tainted
-    if (!PyTaint_IS_CLEAN(a)) {
-        src = (PyObject*)a;
-    } else { // ie. !PyTaint_IS_CLEAN(b) is true
-        src = (PyObject*)b;
-    }
-    n = PyTuple_GET_SIZE(src);
-    new_merits = PyTuple_New(n);
-    if (new_merits == NULL)
-      return -1;
-
-    for (i = 0; i < PyTuple_GET_SIZE(src); i++) {
-        m = PyTuple_GET_ITEM(src, i);
-        if (PyMerit_FULL_PROPAGATION(m)) {
-            Py_INCREF(m);
-            PyTuple_SET_ITEM(new_merits, j, m);
-            j += 1;
-        } else if (!PyMerit_NONE_PROPAGATION(m) && \
-                   !PyMerit_PARTIAL_PROPAGATION(m)) {
-            PyErr_SetString(PyExc_ValueError,
-                            "Invalid taint propagation strategy.");
-        }
+
+    entry = &propagation_cache[PROPAGATION_CACHE_INDEX(a, b)];
+    if (entry->a == a && entry->b == b) {
+        propagation_cache_hits++;
+        result = entry->result;
+        Py_INCREF(result);
+        goto done;
     }
-    // _PyTupleResize will set new_merits to NULL on failure, so instead of
-    // goto onError just return
-    if (_PyTuple_Resize(&new_merits, j) != 0)
-      return -1;
+
+    propagation_cache_misses++;
+    result = propagation_compute(a, b, _PyMerit_FullMask, _PyMerit_KeepMask,
+                                 _PyMerit_InvalidMask);
+    if (result == NULL)
+        return -1;
+
+    if (entry->a != NULL) {
+        propagation_cache_evictions++;
+        Py_DECREF(entry->a);
+        Py_XDECREF(entry->b);
+        Py_DECREF(entry->result);
+    }
+    Py_INCREF(a);
+    Py_XINCREF(b);
+    Py_INCREF(result);
+    entry->a = a;
+    entry->b = b;
+    entry->result = result;
 
     done:
       Py_XDECREF(*target);
-      *target = (PyTaintObject*)new_merits;
+      *target = result;
       return 1;
+}
+
+/* --- Propagation accumulator -------------------------------------------- */
+
+/* The accumulator folds operands the same way as repeated PropagateTo calls
+   would, but keeps the intermediate result as raw bits. Two flags let it skip
+   work which can't change the result: once full-propagation mask was applied,
+   clean operands are no-ops, and once the bits were masked at all, adding the
+   first tainted operand again is a no-op (the bits are its subset). */
+
+#define ACC_BITS(acc) ((acc)->ta_heap != NULL ? (acc)->ta_heap : \
+                       (acc)->ta_inline)
+
+void
+PyTaint_AccumulatorInit(PyTaint_Accumulator *acc)
+{
+    acc->ta_count = 0;
+    acc->ta_source = NULL;
+    acc->ta_size = 0;
+    acc->ta_masked = 0;
+    acc->ta_full = 0;
+    acc->ta_heap = NULL;
+}
+
+void
+PyTaint_AccumulatorClear(PyTaint_Accumulator *acc)
+{
+    if (acc->ta_heap != NULL)
+        PyMem_FREE(acc->ta_heap);
+    Py_XDECREF(acc->ta_source);
+    PyTaint_AccumulatorInit(acc);
+}
+
+int
+PyTaint_AccumulatorAdd(PyTaint_Accumulator *acc, PyTaintObject *taint)
+{
+    PyTaint_Word *bits, w, invalid = 0;
+    PyTaint_Word *full_mask = _PyMerit_FullMask;
+    PyTaint_Word *keep_mask = _PyMerit_KeepMask;
+    PyTaint_Word *invalid_mask = _PyMerit_InvalidMask;
+    Py_ssize_t i, n;
+
+    // With taint tracking off, everything is treated as clean
+    if (!_PyTaint_Enabled)
+        taint = NULL;
+    if (_PyMerit_OVERRIDDEN() &&
+        _PyMerit_GetMasks(&full_mask, &keep_mask, &invalid_mask) < 0)
+        return -1;
+    acc->ta_count++;
+
+    if (acc->ta_source == NULL) {
+        // Everything so far was clean
+        if (PyTaint_IS_CLEAN(taint))
+            return 1;
+        n = Py_SIZE(taint);
+        if (n > PyTaint_ACCUMULATOR_WORDS) {
+            acc->ta_heap = PyMem_NEW(PyTaint_Word, n);
+            if (acc->ta_heap == NULL) {
+                PyErr_NoMemory();
+                return -1;
+            }
+        }
+        bits = ACC_BITS(acc);
+        Py_INCREF(taint);
+        acc->ta_source = taint;
+        acc->ta_size = n;
+        if (acc->ta_count == 1) {
+            // First operand - taken as it is
+            memcpy(bits, taint->ob_bits, n * sizeof(PyTaint_Word));
+            return 1;
+        }
+        // Preceded by clean operands - keep full merits
+        for (i = 0; i < n; i++) {
+            invalid |= taint->ob_bits[i] & invalid_mask[i];
+            bits[i] = taint->ob_bits[i] & full_mask[i];
+        }
+        acc->ta_masked = acc->ta_full = 1;
+    }
+    else if (PyTaint_IS_CLEAN(taint)) {
+        if (acc->ta_full)
+            return 1;
+        // Tainted and clean - keep full merits
+        bits = ACC_BITS(acc);
+        for (i = 0; i < acc->ta_size; i++) {
+            invalid |= bits[i] & invalid_mask[i];
+            bits[i] &= full_mask[i];
+        }
+        acc->ta_masked = acc->ta_full = 1;
+    }
+    else {
+        if (taint == acc->ta_source && acc->ta_masked)
+            return 1;
+        // Both tainted - intersect and keep full and partial merits
+        bits = ACC_BITS(acc);
+        if (Py_SIZE(taint) < acc->ta_size)
+            acc->ta_size = Py_SIZE(taint);
+        for (i = 0; i < acc->ta_size; i++) {
+            w = bits[i] & taint->ob_bits[i];
+            invalid |= w & invalid_mask[i];
+            bits[i] = w & keep_mask[i];
+        }
+        acc->ta_masked = 1;
+    }
+
+    if (invalid) {
+        PyErr_SetString(PyExc_ValueError,
+                        "Invalid taint propagation strategy.");
+        return -1;
+    }
+    return 1;
+}
+
+int
+PyTaint_AccumulatorAddObject(PyTaint_Accumulator *acc, PyObject *obj)
+{
+    if (PyString_Check(obj))
+        return PyTaint_AccumulatorAdd(acc, PyString_GET_MERITS(obj));
+    if (PyUnicode_Check(obj))
+        return PyTaint_AccumulatorAdd(acc, PyUnicode_GET_MERITS(obj));
+    Py_FatalError("Attempting to obtain taint from non-taintable object.");
+    // the line below is to surpress compiler warning
+    return -1;
+}
+
+int
+PyTaint_AccumulatorResult(PyTaint_Accumulator *acc, PyTaintObject **target)
+{
+    PyTaintObject *result = NULL;
+    PyTaint_Word *bits;
 
-    onError:
-      Py_DECREF(new_merits);
-      return -1;
+    if (acc->ta_source != NULL) {
+        bits = ACC_BITS(acc);
+        if (taint_equal_bits(acc->ta_source, bits, acc->ta_size)) {
+            result = acc->ta_source;
+            Py_INCREF(result);
+        } else {
+            result = taint_from_bits(bits, acc->ta_size);
+            if (result == NULL)
+                return -1;
+        }
+    }
+    Py_XDECREF(*target);
+    *target = result;
+    return 1;
+}
+
+int
+PyTaint_PropagateMany(PyTaintObject **target, PyObject **objs, Py_ssize_t n)
+{
+    PyTaint_Accumulator acc;
+    Py_ssize_t i;
+    int result = -1;
+
+    PyTaint_AccumulatorInit(&acc);
+    if (PyTaint_AccumulatorAdd(&acc, *target) == -1)
+        goto done;
+    for (i = 0; i < n; i++)
+        if (PyTaint_AccumulatorAddObject(&acc, objs[i]) == -1)
+            goto done;
+    result = PyTaint_AccumulatorResult(&acc, target);
+
+    done:
+      PyTaint_AccumulatorClear(&acc);
+      return result;
 }
 
 int
 _PyTaint_ValidMerit(PyObject *merit) {
-    if (!PyObject_HasAttrString(merit, "propagation")) {
+    if (!PyMerit_Check(merit)) {
         PyErr_SetString(PyExc_TypeError,
                         "Invalid merit object passed.");
         return -1;
     }
 
-    if (!(PyMerit_FULL_PROPAGATION(merit) || \
-          PyMerit_NONE_PROPAGATION(merit) || \
-          PyMerit_PARTIAL_PROPAGATION(merit))) {
+    if (PyMerit_STRATEGY(merit) == PyMerit_STRATEGY_INVALID) {
         PyErr_SetString(PyExc_TypeError,
                         "Merit object has invalid propagation strategy.");
         return -1;
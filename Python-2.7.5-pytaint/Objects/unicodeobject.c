@@ -116,6 +116,28 @@ static PyUnicodeObject *unicode_empty = NULL;
    shared as well. */
 static PyUnicodeObject *unicode_latin1[256] = {NULL};
 
+/* Tainted one character and empty Unicode objects are shared through a
+   direct mapped cache keyed by the (canonical) taint object and the
+   character, as in stringobject.c. Each entry owns a reference to its
+   object, and is replaced by the newer object on collision. */
+#ifndef TAINTED_CHARS_SIZE
+#define TAINTED_CHARS_SIZE 1024
+#endif
+static PyUnicodeObject *unicode_tainted_chars[TAINTED_CHARS_SIZE];
+
+#define TAINTED_CHAR_INDEX(merits, u, size) \
+    (((size_t)(merits)->ob_hash + ((size) ? (size_t)(u)[0] + 1 : 0)) & \
+     (TAINTED_CHARS_SIZE - 1))
+
+/* Is op one of the objects in unicode_tainted_chars? (They count as shared
+   - see PyUnicode_IS_SHARED.) */
+#define _PyUnicode_IS_TAINTED_CHAR(op) \
+    (((PyUnicodeObject*)op)->length <= 1 && \
+     PyUnicode_CHECK_TAINTED(op) && \
+     unicode_tainted_chars[TAINTED_CHAR_INDEX( \
+        PyUnicode_GET_MERITS(op), ((PyUnicodeObject*)op)->str, \
+        ((PyUnicodeObject*)op)->length)] == ((PyUnicodeObject*)op))
+
 /* Default encoding to use and assume when NULL is passed as encoding
    parameter; it is initialized by _PyUnicode_Init().
 
@@ -371,7 +393,7 @@ PyUnicodeObject *_PyUnicode_New(Py_ssize_t length)
     unicode->length = length;
     unicode->hash = -1;
     unicode->defenc = NULL;
-    unicode->merits = NULL;
+    _PyUnicode_INIT_MERITS(unicode);
     return unicode;
 
   onError:
@@ -385,7 +407,12 @@ PyUnicodeObject *_PyUnicode_New(Py_ssize_t length)
 static
 void unicode_dealloc(register PyUnicodeObject *unicode)
 {
-    Py_XDECREF(PyUnicode_GET_MERITS(unicode));
+    PyTaintObject *merits = PyUnicode_GET_MERITS(unicode);
+
+    if (merits != NULL) {
+        _PyUnicode_SET_MERITS(unicode, NULL);
+        Py_DECREF(merits);
+    }
     if (PyUnicode_CheckExact(unicode) &&
         numfree < PyUnicode_MAXFREELIST) {
         /* Keep-Alive optimization */
@@ -474,7 +501,7 @@ PyObject *PyUnicode_FromUnicodeNoSharing(const Py_UNICODE *u,
         unicode->length = size;
         unicode->hash = -1;
         unicode->defenc = NULL;
-        unicode->merits = NULL;
+        _PyUnicode_INIT_MERITS(unicode);
         return (PyObject*)unicode;
     }
     unicode = _PyUnicode_New(size);
@@ -487,13 +514,44 @@ PyObject *PyUnicode_FromUnicodeNoSharing(const Py_UNICODE *u,
     return (PyObject*)unicode;
 }
 
+/* Return a Unicode object of size 0 or 1 with contents u and (non-NULL)
+   taint merits, shared through unicode_tainted_chars. */
+static PyObject *
+tainted_char(const Py_UNICODE *u, Py_ssize_t size, PyTaintObject *merits)
+{
+    PyUnicodeObject *unicode, *old;
+    size_t i;
+
+    assert(size == 0 || size == 1);
+    i = TAINTED_CHAR_INDEX(merits, u, size);
+    unicode = unicode_tainted_chars[i];
+    if (unicode != NULL && PyUnicode_GET_MERITS(unicode) == merits &&
+        unicode->length == size && (size == 0 || unicode->str[0] == u[0])) {
+        Py_INCREF(unicode);
+        return (PyObject *)unicode;
+    }
+    unicode = (PyUnicodeObject *)PyUnicode_FromUnicodeNoSharing(u, size);
+    if (unicode == NULL)
+        return NULL;
+    PyUnicode_ASSIGN_MERITS(unicode, merits);
+    Py_INCREF(unicode);
+    old = unicode_tainted_chars[i];
+    unicode_tainted_chars[i] = unicode;
+    Py_XDECREF(old);
+    return (PyObject *)unicode;
+}
+
 PyObject *PyUnicode_FromUnicodeSameMerits(const Py_UNICODE *u,
                                           Py_ssize_t size,
                                           PyTaintObject *merits)
 {
     PyObject *unicode;
+    if (!_PyTaint_Enabled)
+        merits = NULL;
     if (merits == NULL) {
         unicode = PyUnicode_FromUnicode(u, size);
+    } else if (size <= 1 && u != NULL) {
+        return tainted_char(u, size, merits);
     } else {
         unicode = PyUnicode_FromUnicodeNoSharing(u, size);
     }
@@ -502,13 +560,25 @@ PyObject *PyUnicode_FromUnicodeSameMerits(const Py_UNICODE *u,
         return NULL;
 
     if (merits != NULL) {
-        ((PyUnicodeObject*)unicode)->merits = merits;
+        _PyUnicode_SET_MERITS(unicode, merits);
         Py_INCREF(merits);
     }
 
     return (PyObject*)unicode;
 }
 
+PyObject *_PyUnicode_CopyWithMerits(PyUnicodeObject *u,
+                                    PyTaintObject *merits)
+{
+    PyUnicodeObject *unicode;
+
+    unicode = (PyUnicodeObject *)PyUnicode_FromUnicodeSameMerits(
+                                        u->str, u->length, merits);
+    if (unicode != NULL && unicode->hash == -1)
+        unicode->hash = u->hash;
+    return (PyObject*)unicode;
+}
+
 PyObject *PyUnicode_FromUnicode(const Py_UNICODE *u,
                                 Py_ssize_t size)
 {
@@ -705,13 +775,17 @@ PyUnicode_AssignTaint(PyUnicodeObject *u, PyTaintObject *taint) {
         return NULL;
     }
 
+    if (!_PyTaint_Enabled)
+        taint = NULL;
+    if (PyUnicode_GET_MERITS(u) == taint)
+        return (PyObject*)u;
+
     if (PyUnicode_IS_SHARED(u) || u->ob_refcnt > 1) {
-        result = PyUnicode_FromUnicodeSameMerits(PyUnicode_AS_UNICODE(u),
-                                                 PyUnicode_GET_SIZE(u),
-                                                 taint);
+        result = _PyUnicode_CopyWithMerits(u, taint);
         Py_DECREF(u);
     } else {
         result = (PyObject*)u;
+        Py_CLEAR(u->defenc);
         Py_XDECREF(PyUnicode_GET_MERITS(u));
         PyUnicode_ASSIGN_MERITS(u, taint);
     }
@@ -724,16 +798,18 @@ void
 _PyUnicode_CopyTaint(PyUnicodeObject *target,
                      PyUnicodeObject *source)
 {
+    PyTaintObject *old, *merits;
+
     // check if it is a shared string?
     if (PyUnicode_IS_SHARED(target)) {
         Py_FatalError("Attempted tainting of a shared unicode object");
     }
 
-    Py_CLEAR(target->merits);
-    if (source->merits != NULL) {
-        target->merits = source->merits;
-        Py_INCREF(target->merits);
-    }
+    old = PyUnicode_GET_MERITS(target);
+    merits = _PyTaint_Enabled ? PyUnicode_GET_MERITS(source) : NULL;
+    Py_XINCREF(merits);
+    _PyUnicode_SET_MERITS(target, merits);
+    Py_XDECREF(old);
 }
 
 int
@@ -743,9 +819,7 @@ PyUnicode_IsShared(PyUnicodeObject *u) {
                         "Checking a non-unicode object for unicode sharing");
         return -1;
     }
-    return u == unicode_empty ||
-      (u->length == 1 && PyUnicode_IS_LATIN_CHAR(u->str) && \
-       unicode_latin1[u->str[0]] == u);
+    return PyUnicode_IS_SHARED(u);
 }
 
 static void
@@ -1214,9 +1288,8 @@ PyObject *PyUnicode_FromObject(register PyObject *obj)
     if (PyUnicode_Check(obj)) {
         /* For a Unicode subtype that's not a Unicode object,
            return a true Unicode object with the same data. */
-        return PyUnicode_FromUnicodeSameMerits(PyUnicode_AS_UNICODE(obj),
-                                               PyUnicode_GET_SIZE(obj),
-                                               PyUnicode_GET_MERITS(obj));
+        return _PyUnicode_CopyWithMerits((PyUnicodeObject *)obj,
+                                         PyUnicode_GET_MERITS(obj));
     }
     return PyUnicode_FromEncodedObject(obj, NULL, "strict");
 }
@@ -5116,7 +5189,9 @@ PyObject *PyUnicode_TranslateCharmap(const Py_UNICODE *p,
      * -1=not initialized, 0=unknown, 1=strict, 2=replace,
      * 3=ignore, 4=xmlcharrefreplace */
     int known_errorHandler = -1;
+    PyTaint_Accumulator acc;
 
+    PyTaint_AccumulatorInit(&acc);
     if (mapping == NULL) {
         PyErr_BadArgument();
         return NULL;
@@ -5130,6 +5205,8 @@ PyObject *PyUnicode_TranslateCharmap(const Py_UNICODE *p,
     if (size == 0)
         return res;
     str = PyUnicode_AS_UNICODE(res);
+    if (PyTaint_AccumulatorAdd(&acc, taint) == -1)
+        goto onError;
 
     while (p<endp) {
         /* try to encode it */
@@ -5138,12 +5215,14 @@ PyObject *PyUnicode_TranslateCharmap(const Py_UNICODE *p,
             Py_XDECREF(x);
             goto onError;
         }
-        Py_XDECREF(x);
         if (x!=Py_None) { /* it worked => adjust input pointer */
             ++p;
-            if (x != NULL && PyUnicode_Check(x)) {
-                PyTaint_PropagateTo(&taint, PyUnicode_GET_MERITS(x));
+            if (x != NULL && PyUnicode_Check(x) &&
+                PyTaint_AccumulatorAdd(&acc, PyUnicode_GET_MERITS(x)) == -1) {
+                Py_DECREF(x);
+                goto onError;
             }
+            Py_XDECREF(x);
         }
         else { /* untranslatable character */
             PyObject *repunicode = NULL; /* initialize to prevent gcc warning */
@@ -5155,6 +5234,7 @@ PyObject *PyUnicode_TranslateCharmap(const Py_UNICODE *p,
             const Py_UNICODE *collend = p+1;
             const Py_UNICODE *coll;
 
+            Py_DECREF(x);
             /* find all untranslatable characters */
             while (collend < endp) {
                 if (charmaptranslate_lookup(*collend, mapping, &x))
@@ -5232,11 +5312,15 @@ PyObject *PyUnicode_TranslateCharmap(const Py_UNICODE *p,
     }
     Py_XDECREF(exc);
     Py_XDECREF(errorHandler);
+    if (PyTaint_AccumulatorResult(&acc, &taint) == -1)
+        goto onError;
+    PyTaint_AccumulatorClear(&acc);
     res = PyUnicode_AssignTaint((PyUnicodeObject*)res, taint);
     Py_XDECREF(taint);
     return res;
 
   onError:
+    PyTaint_AccumulatorClear(&acc);
     Py_XDECREF(res);
     Py_XDECREF(exc);
     Py_XDECREF(errorHandler);
@@ -5549,16 +5633,16 @@ PyObject *fixup(PyUnicodeObject *self,
 
     PyUnicodeObject *u;
 
-    u = (PyUnicodeObject*)PyUnicode_FromUnicodeSameMerits(NULL,
-                                                          self->length,
-                                                          self->merits);
+    u = (PyUnicodeObject*)PyUnicode_FromUnicodeSameMerits(
+                                NULL, self->length, PyUnicode_GET_MERITS(self));
 
     if (u == NULL)
         return NULL;
 
     Py_UNICODE_COPY(u->str, self->str, self->length);
 
-    if (!fixfct(u) && PyUnicode_CheckExact(self)) {
+    if (!fixfct(u) && PyUnicode_CheckExact(self) &&
+        PyUnicode_GET_MERITS(u) == PyUnicode_GET_MERITS(self)) {
         /* fixfct should return TRUE if it modified the buffer. If
            FALSE, return a reference to the original buffer instead
            (to save space, not time) */
@@ -5710,7 +5794,9 @@ PyUnicode_Join(PyObject *separator, PyObject *seq)
     PyObject *item;
     Py_ssize_t i;
     PyTaintObject *taint = NULL;
+    PyTaint_Accumulator acc;
 
+    PyTaint_AccumulatorInit(&acc);
     fseq = PySequence_Fast(seq, "");
     if (fseq == NULL) {
         return NULL;
@@ -5734,16 +5820,14 @@ PyUnicode_Join(PyObject *separator, PyObject *seq)
     if (seqlen == 1) {
         item = PySequence_Fast_GET_ITEM(fseq, 0);
         if (PyUnicode_CheckExact(item)) {
-            if (PyTaint_PropagateTo(&taint, PyUnicode_GET_MERITS(item)) == -1)
+            if (PyTaint_PropagateMany(&taint, &item, 1) == -1)
                 goto onError;
             if (PyTaint_IS_CLEAN(taint)) {
                 Py_INCREF(item);
                 res = (PyUnicodeObject *)item;
             } else {
-                res = (PyUnicodeObject *)PyUnicode_FromUnicodeSameMerits(
-                                                PyUnicode_AS_UNICODE(item),
-                                                PyUnicode_GET_SIZE(item),
-                                                taint);
+                res = (PyUnicodeObject *)_PyUnicode_CopyWithMerits(
+                                        (PyUnicodeObject *)item, taint);
             }
             goto Done;
         }
@@ -5773,6 +5857,8 @@ PyUnicode_Join(PyObject *separator, PyObject *seq)
         goto onError;
     res_p = PyUnicode_AS_UNICODE(res);
     res_used = 0;
+    if (PyTaint_AccumulatorAdd(&acc, taint) == -1)
+        goto onError;
 
     for (i = 0; i < seqlen; ++i) {
         Py_ssize_t itemlen;
@@ -5828,7 +5914,7 @@ PyUnicode_Join(PyObject *separator, PyObject *seq)
         }
 
         /* Propagate taint from item */
-        if (PyTaint_PropagateTo(&taint, PyUnicode_GET_MERITS(item)) == -1) {
+        if (PyTaint_AccumulatorAdd(&acc, PyUnicode_GET_MERITS(item)) == -1) {
             Py_DECREF(item);
             goto onError;
         }
@@ -5843,6 +5929,9 @@ PyUnicode_Join(PyObject *separator, PyObject *seq)
     if (_PyUnicode_Resize(&res, res_used) < 0)
         goto onError;
 
+    if (PyTaint_AccumulatorResult(&acc, &taint) == -1)
+        goto onError;
+    PyTaint_AccumulatorClear(&acc);
     res = (PyUnicodeObject*)PyUnicode_AssignTaint(res, taint);
 
   Done:
@@ -5858,6 +5947,7 @@ PyUnicode_Join(PyObject *separator, PyObject *seq)
     /* fall through */
 
   onError:
+    PyTaint_AccumulatorClear(&acc);
     Py_XDECREF(internal_separator);
     Py_DECREF(fseq);
     Py_XDECREF(taint);
@@ -5920,9 +6010,12 @@ PyUnicodeObject *do_padding(PyUnicodeObject *self,
 
     if (padding == Py_None) {
         fillchar = ' ';
-        taintobj = PyUnicode_GET_MERITS(self);
+        if (_PyTaint_Enabled)
+            taintobj = PyUnicode_GET_MERITS(self);
     } else {
         padding = PyUnicode_FromObject(padding);
+        if (padding == NULL)
+            return NULL;
         if (PyUnicode_GET_SIZE(padding) != 1) {
             PyErr_SetString(PyExc_TypeError,
                       "The fill character must be exactly one character long");
@@ -5932,19 +6025,19 @@ PyUnicodeObject *do_padding(PyUnicodeObject *self,
         fillchar = ((PyUnicodeObject*)padding)->str[0];
         if (PyTaint_PropagationResult(&taintobj,
                                       PyUnicode_GET_MERITS(self),
-                                      PyUnicode_GET_MERITS(padding)) == -1)
+                                      PyUnicode_GET_MERITS(padding)) == -1) {
+            Py_DECREF(padding);
             return NULL;
+        }
     }
 
     if (self->length >= width && PyUnicode_CheckExact(self)) {
-        if (PyString_GET_MERITS(self) == taintobj) {
+        if (PyUnicode_GET_MERITS(self) == taintobj) {
             Py_INCREF(self);
             result = (PyObject*)self;
             goto done;
         }
-        result = PyUnicode_FromUnicodeSameMerits(PyUnicode_AS_UNICODE(self),
-                                                 PyUnicode_GET_SIZE(self),
-                                                 PyUnicode_GET_MERITS(self));
+        result = _PyUnicode_CopyWithMerits(self, PyUnicode_GET_MERITS(self));
 
         // no error check because either way cleanup is the same; also
         // in case of failure, result is NULL
@@ -5974,9 +6067,8 @@ PyUnicodeObject *do_padding(PyUnicodeObject *self,
 
         if (!PyTaint_IS_CLEAN(taintobj)) {
             // try to reuse result
-            if (PyUnicode_IS_SHARED(result)) {
-                ((PyUnicodeObject*)result)->merits = taintobj;
-                Py_XINCREF(taintobj);
+            if (!PyUnicode_IS_SHARED(result)) {
+                PyUnicode_ASSIGN_MERITS(result, taintobj);
             } else {
                 PyObject *tmp;
                 tmp = PyUnicode_FromUnicodeSameMerits(
@@ -5992,8 +6084,10 @@ PyUnicodeObject *do_padding(PyUnicodeObject *self,
     }
 
   done:
-    if (padding != Py_None)
+    if (padding != Py_None) {
         Py_XDECREF(taintobj);
+        Py_DECREF(padding);
+    }
     // when padding == NULL, taintobj is borrowed from self, so no decref
     return (PyUnicodeObject*)result;
 
@@ -6124,17 +6218,14 @@ PyObject *replace(PyUnicodeObject *self,
                   Py_ssize_t maxcount)
 {
     PyUnicodeObject *u;
-    PyTaintObject *taint = NULL;
-
-    if (PyTaint_PropagationResult(&taint, PyUnicode_GET_MERITS(self),
-                                  PyUnicode_GET_MERITS(str1)) == -1)
-        return NULL;
-    if (PyTaint_PropagateTo(&taint, PyUnicode_GET_MERITS(str2)) == -1) {
-        Py_XDECREF(taint);
-        return NULL;
-    }
-
+    PyTaintObject *taint = PyUnicode_GET_MERITS(self);
+    PyObject *operands[2], *result = NULL;
 
+    operands[0] = (PyObject*)str1;
+    operands[1] = (PyObject*)str2;
+    Py_XINCREF(taint);
+    if (PyTaint_PropagateMany(&taint, operands, 2) == -1)
+        goto done;
 
     if (maxcount < 0)
         maxcount = PY_SSIZE_T_MAX;
@@ -6154,7 +6245,7 @@ PyObject *replace(PyUnicodeObject *self,
             u = (PyUnicodeObject*) PyUnicode_FromUnicodeSameMerits(NULL,
                                                      self->length, taint);
             if (!u)
-                return NULL;
+                goto done;
             Py_UNICODE_COPY(u->str, self->str, self->length);
             u1 = str1->str[0];
             u2 = str2->str[0];
@@ -6173,7 +6264,7 @@ PyObject *replace(PyUnicodeObject *self,
             u = (PyUnicodeObject*) PyUnicode_FromUnicodeSameMerits(NULL,
                                                      self->length, taint);
             if (!u)
-                return NULL;
+                goto done;
             Py_UNICODE_COPY(u->str, self->str, self->length);
 
             /* change everything in-place, starting with this one */
@@ -6210,19 +6301,19 @@ PyObject *replace(PyUnicodeObject *self,
             if ((product / (str2->length - str1->length)) != n) {
                 PyErr_SetString(PyExc_OverflowError,
                                 "replace string is too long");
-                return NULL;
+                goto done;
             }
             new_size = self->length + product;
             if (new_size < 0) {
                 PyErr_SetString(PyExc_OverflowError,
                                 "replace string is too long");
-                return NULL;
+                goto done;
             }
         }
         u = (PyUnicodeObject*)PyUnicode_FromUnicodeSameMerits(NULL,
                                                               new_size, taint);
         if (!u)
-            return NULL;
+            goto done;
         i = 0;
         p = u->str;
         if (str1->length > 0) {
@@ -6260,15 +6351,22 @@ PyObject *replace(PyUnicodeObject *self,
             Py_UNICODE_COPY(p, self->str+i, self->length-i);
         }
     }
-    return (PyObject *) u;
+    result = (PyObject *) u;
+    goto done;
 
   nothing:
     /* nothing to replace; return original string (when possible) */
     if (PyUnicode_CheckExact(self) && PyUnicode_GET_MERITS(self) == taint) {
         Py_INCREF(self);
-        return (PyObject *) self;
+        result = (PyObject *) self;
     }
-    return PyUnicode_FromUnicodeSameMerits(self->str, self->length, taint);
+    else
+        result = PyUnicode_FromUnicodeSameMerits(self->str, self->length,
+                                                 taint);
+
+  done:
+    Py_XDECREF(taint);
+    return result;
 }
 
 /* --- Unicode Object Methods --------------------------------------------- */
@@ -6595,6 +6693,7 @@ PyObject *PyUnicode_Concat(PyObject *left,
                            PyObject *right)
 {
     PyUnicodeObject *u = NULL, *v = NULL, *w;
+    PyTaintObject *merits = NULL;
 
     /* Coerce the two arguments */
     u = (PyUnicodeObject *)PyUnicode_FromObject(left);
@@ -6605,12 +6704,16 @@ PyObject *PyUnicode_Concat(PyObject *left,
         goto onError;
 
     if (PyUnicode_CHECK_TAINTED(u) || PyUnicode_CHECK_TAINTED(v)) {
-        w = (PyUnicodeObject*)PyUnicode_FromUnicodeNoSharing(NULL,
-                                                  u->length + v->length);
-        if (PyTaint_PropagationResult(&PyUnicode_GET_MERITS(w),
+        if (PyTaint_PropagationResult(&merits,
                                       PyUnicode_GET_MERITS(u),
                                       PyUnicode_GET_MERITS(v)) == -1)
             goto onError;
+        w = (PyUnicodeObject*)PyUnicode_FromUnicodeNoSharing(NULL,
+                                                  u->length + v->length);
+        if (w != NULL)
+            _PyUnicode_SET_MERITS(w, merits);
+        else
+            Py_XDECREF(merits);
     } else {
         /* Shortcuts */
         if (v == unicode_empty) {
@@ -7303,6 +7406,7 @@ _PyUnicode_XStrip(PyUnicodeObject *self, int striptype, PyObject *sepobj)
     Py_ssize_t seplen = PyUnicode_GET_SIZE(sepobj);
     Py_ssize_t i, j;
     PyTaintObject *taint = NULL;
+    PyObject *result;
     if (PyTaint_PropagationResult(&taint, PyUnicode_GET_MERITS(self),
                                   PyUnicode_GET_MERITS(sepobj)) == -1)
         return NULL;
@@ -7327,10 +7431,12 @@ _PyUnicode_XStrip(PyUnicodeObject *self, int striptype, PyObject *sepobj)
     if (i == 0 && j == len && PyUnicode_CheckExact(self) &&
         PyUnicode_GET_MERITS(self) == taint) {
         Py_INCREF(self);
-        return (PyObject*)self;
+        result = (PyObject*)self;
     }
     else
-        return PyUnicode_FromUnicodeSameMerits(s+i, j-i, taint);
+        result = PyUnicode_FromUnicodeSameMerits(s+i, j-i, taint);
+    Py_XDECREF(taint);
+    return result;
 }
 
 
@@ -7763,8 +7869,8 @@ PyUnicode_Partition(PyObject *str_in, PyObject *sep_in)
             goto done;
         }
         out = _PyTaint_TaintUnicodeTupleItems(out, taint);
-        // Can't be NULL, because str_obj or sep_obj (or both) is tainted
-        Py_DECREF(taint);
+        // NULL when taint tracking is off
+        Py_XDECREF(taint);
     }
 
   done:
@@ -7808,8 +7914,8 @@ PyUnicode_RPartition(PyObject *str_in, PyObject *sep_in)
             goto done;
         }
         out = _PyTaint_TaintUnicodeTupleItems(out, taint);
-        // Can't be NULL, because str_obj or sep_obj (or both) is tainted
-        Py_DECREF(taint);
+        // NULL when taint tracking is off
+        Py_XDECREF(taint);
     }
 
   done:
@@ -7984,11 +8090,8 @@ unicode_zfill(PyUnicodeObject *self, PyObject *args)
             return (PyObject*) self;
         }
         else
-            return PyUnicode_FromUnicodeSameMerits(
-                PyUnicode_AS_UNICODE(self),
-                PyUnicode_GET_SIZE(self),
-                PyUnicode_GET_MERITS(self)
-                );
+            return _PyUnicode_CopyWithMerits(self,
+                                             PyUnicode_GET_MERITS(self));
     }
 
     fill = width - self->length;
@@ -8004,7 +8107,7 @@ unicode_zfill(PyUnicodeObject *self, PyObject *args)
         u->str[fill] = '0';
     }
 
-    if (u != self && PyUnicode_CHECK_TAINTED(self)) {
+    if (u != self && PyUnicode_CHECK_TAINTED(self) && _PyTaint_Enabled) {
         if (PyUnicode_IS_SHARED(u)) {
             PyObject *tmp;
             tmp = PyUnicode_FromUnicodeSameMerits(PyUnicode_AS_UNICODE(u),
@@ -8180,19 +8283,39 @@ PyDoc_STRVAR(sizeof__doc__,
 \n\
 ");
 
+/* Return v with the given (non-NULL) merits. When the caller holds the only
+   reference to v (as in f().taint(), where it's owned by the bound method),
+   v is tainted in place instead of being copied. */
+static PyObject *
+unicode_retaint(PyUnicodeObject *v, PyTaintObject *t)
+{
+    if (Py_REFCNT(v) == 1 && PyUnicode_CheckExact(v) &&
+        !PyUnicode_IS_SHARED(v) && _PyTaint_Enabled) {
+        /* the cached default encoding has the old taint */
+        Py_CLEAR(v->defenc);
+        Py_XDECREF(PyUnicode_GET_MERITS(v));
+        PyUnicode_ASSIGN_MERITS(v, t);
+        Py_INCREF(v);
+        return (PyObject*)v;
+    }
+    return _PyUnicode_CopyWithMerits(v, t);
+}
+
 static PyObject *
 unicode_taint(PyUnicodeObject *v)
 {
     PyObject *u;
     PyTaintObject *t;
+
+    if (!_PyTaint_Enabled)
+        return PyUnicode_FromUnicode(PyUnicode_AS_UNICODE(v),
+                                     PyUnicode_GET_SIZE(v));
     t = PyTaint_EmptyMerits();
 
     if (t == NULL)
         return NULL;
 
-    u = PyUnicode_FromUnicodeSameMerits(PyUnicode_AS_UNICODE(v),
-                                        PyUnicode_GET_SIZE(v),
-                                        t);
+    u = unicode_retaint(v, t);
     Py_DECREF(t);
     return u;
 }
@@ -8221,7 +8344,7 @@ unicode_isclean(PyUnicodeObject *v, PyObject *args)
     if (!PyArg_ParseTuple(args, "|O:isclean", &merit))
         return NULL;
 
-    if (v->merits == NULL) {
+    if (!PyUnicode_CHECK_TAINTED(v)) {
         Py_RETURN_TRUE;
     }
 
@@ -8229,14 +8352,7 @@ unicode_isclean(PyUnicodeObject *v, PyObject *args)
         Py_RETURN_FALSE;
     }
 
-    if (!PyObject_HasAttrString(merit, "propagation")) {
-        PyErr_SetString(PyExc_TypeError,
-                        "Invalid merit object passed.");
-        return NULL;
-    }
-
-    switch (PySequence_Contains((PyObject*)PyUnicode_GET_MERITS(v),
-                                merit)) {
+    switch (_PyTaint_HasMerit(PyUnicode_GET_MERITS(v), merit)) {
         case -1:
             return NULL;
         case 1:
@@ -8260,6 +8376,9 @@ unicode_cleanfor(PyUnicodeObject *v, PyObject *merit)
 
     if (_PyTaint_ValidMerit(merit) == -1)
         return NULL;
+    if (!_PyTaint_Enabled)
+        return PyUnicode_FromUnicode(PyUnicode_AS_UNICODE(v),
+                                     PyUnicode_GET_SIZE(v));
 
     if (PyUnicode_CHECK_TAINTED(v)) {
         taint = PyUnicode_GET_MERITS(v);
@@ -8272,16 +8391,40 @@ unicode_cleanfor(PyUnicodeObject *v, PyObject *merit)
 
     new_taint = _PyTaint_AddMerit(taint, merit);
     Py_DECREF(taint);
-    u = (PyUnicodeObject*)PyUnicode_FromUnicodeSameMerits(
-                                      PyUnicode_AS_UNICODE(v),
-                                      PyUnicode_GET_SIZE(v),
-                                      new_taint);
-    if (u == NULL)
+    if (new_taint == NULL)
         return NULL;
+    u = (PyUnicodeObject*)unicode_retaint(v, new_taint);
     Py_DECREF(new_taint);
     return (PyObject*)u;
 }
 
+PyDoc_STRVAR(withmerits__doc__,
+             "S.withmerits(merits) -> unicode\n\
+\n\
+Return a copy of S tainted with exactly the merits from iterable merits.\n\
+Same as applying _cleanfor() with each of them to S.taint(), but the copy is\n\
+made only once.");
+
+static PyObject *
+unicode_withmerits(PyUnicodeObject *v, PyObject *merits)
+{
+    PyObject *u;
+    PyTaintObject *t;
+
+    t = _PyTaint_AddMerits(NULL, merits);
+    if (t == NULL)
+        return NULL;
+    if (PyUnicode_GET_MERITS(v) == t && _PyTaint_Enabled &&
+        PyUnicode_CheckExact(v)) {
+        Py_DECREF(t);
+        Py_INCREF(v);
+        return (PyObject*)v;
+    }
+    u = unicode_retaint(v, t);
+    Py_DECREF(t);
+    return u;
+}
+
 PyDoc_STRVAR(cleanfor__doc__,
              "S._cleanfor(M) -> unicode\n\
 \n\
@@ -8295,7 +8438,7 @@ unicode_listmerits(PyUnicodeObject *v)
         Py_RETURN_NONE;
     }
 
-    return PySet_New((PyObject*)PyUnicode_GET_MERITS(v));
+    return _PyTaint_GetMerits(PyUnicode_GET_MERITS(v));
 }
 
 PyDoc_STRVAR(listmerits__doc__,
@@ -8306,9 +8449,7 @@ If S is tainted, return its set of merits. If S is untainted, return None.");
 static PyObject *
 unicode_propagate(PyUnicodeObject *v, PyUnicodeObject *source)
 {
-    return PyUnicode_FromUnicodeSameMerits(PyUnicode_AS_UNICODE(v),
-                                           PyUnicode_GET_SIZE(v),
-                                           PyUnicode_GET_MERITS(source));
+    return _PyUnicode_CopyWithMerits(v, PyUnicode_GET_MERITS(source));
 }
 
 PyDoc_STRVAR(propagate__doc__,
@@ -8346,6 +8487,7 @@ static PyMethodDef unicode_methods[] = {
     {"isclean", (PyCFunction)unicode_isclean, METH_VARARGS, isclean__doc__},
     {"istainted", (PyCFunction)unicode_istainted, METH_NOARGS, istainted__doc__},
     {"_cleanfor", (PyCFunction)unicode_cleanfor, METH_O, cleanfor__doc__},
+    {"withmerits", (PyCFunction)unicode_withmerits, METH_O, withmerits__doc__},
     {"_merits", (PyCFunction)unicode_listmerits, METH_NOARGS, listmerits__doc__},
     {"_propagate", (PyCFunction)unicode_propagate, METH_O, propagate__doc__},
     {"rfind", (PyCFunction) unicode_rfind, METH_VARARGS, rfind__doc__},
@@ -8786,8 +8928,10 @@ PyObject *PyUnicode_Format(PyObject *format,
     PyUnicodeObject *result = NULL;
     PyObject *dict = NULL;
     PyObject *uformat;
+    PyTaint_Accumulator acc;
     PyTaintObject *taint = NULL;
 
+    PyTaint_AccumulatorInit(&acc);
     if (format == NULL || args == NULL) {
         PyErr_BadInternalCall();
         return NULL;
@@ -8797,8 +8941,8 @@ PyObject *PyUnicode_Format(PyObject *format,
         return NULL;
     fmt = PyUnicode_AS_UNICODE(uformat);
     fmtcnt = PyUnicode_GET_SIZE(uformat);
-    taint = PyUnicode_GET_MERITS(uformat);
-    Py_XINCREF(taint);
+    if (PyTaint_AccumulatorAdd(&acc, PyUnicode_GET_MERITS(uformat)) == -1)
+        goto onError;
 
     reslen = rescnt = fmtcnt + 100;
     result = _PyUnicode_New(reslen);
@@ -9040,8 +9184,8 @@ PyObject *PyUnicode_Format(PyObject *format,
                         goto onError;
                     }
                 }
-                if (PyTaint_PropagateTo(&taint,
-                                        PyUnicode_GET_MERITS(temp)) == -1) {
+                if (PyTaint_AccumulatorAdd(&acc,
+                                           PyUnicode_GET_MERITS(temp)) == -1) {
                     Py_XDECREF(temp);
                     goto onError;
                 }
@@ -9230,14 +9374,20 @@ PyObject *PyUnicode_Format(PyObject *format,
 
     if (_PyUnicode_Resize(&result, reslen - rescnt) < 0)
         goto onError;
+    if (PyTaint_AccumulatorResult(&acc, &taint) == -1)
+        goto onError;
+    PyTaint_AccumulatorClear(&acc);
     if (args_owned) {
         Py_DECREF(args);
     }
     Py_DECREF(uformat);
 
-    return PyUnicode_AssignTaint(result, taint);
+    result = (PyUnicodeObject*)PyUnicode_AssignTaint(result, taint);
+    Py_XDECREF(taint);
+    return (PyObject *)result;
 
   onError:
+    PyTaint_AccumulatorClear(&acc);
     Py_XDECREF(taint);
     Py_XDECREF(result);
     Py_DECREF(uformat);
@@ -9422,6 +9572,15 @@ PyUnicode_ClearFreeList(void)
     return freelist_size;
 }
 
+void
+_PyUnicode_ClearTaintedChars(void)
+{
+    int i;
+
+    for (i = 0; i < TAINTED_CHARS_SIZE; i++)
+        Py_CLEAR(unicode_tainted_chars[i]);
+}
+
 void
 _PyUnicode_Fini(void)
 {
@@ -9431,6 +9590,7 @@ _PyUnicode_Fini(void)
 
     for (i = 0; i < 256; i++)
         Py_CLEAR(unicode_latin1[i]);
+    _PyUnicode_ClearTaintedChars();
 
     (void)PyUnicode_ClearFreeList();
 }
@@ -36,6 +36,7 @@ extern void init_locale(void);
 #endif
 extern void init_codecs(void);
 extern void init_weakref(void);
+extern void init_taint(void);
 extern void init_hotshot(void);
 extern void initxxsubtype(void);
 extern void initzipimport(void);
@@ -116,6 +117,7 @@ struct _inittab _PyImport_Inittab[] = {
 
     {"_codecs", init_codecs},
     {"_weakref", init_weakref},
+    {"_taint", init_taint},
     {"_hotshot", init_hotshot},
     {"_random", init_random},
     {"_bisect", init_bisect},
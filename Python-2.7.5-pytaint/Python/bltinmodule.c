@@ -1269,7 +1269,7 @@ builtin_intern(PyObject *self, PyObject *args)
                         "can't intern subclass of string");
         return NULL;
     }
-    if (((PyStringObject *)s)->ob_merits != NULL) {
+    if (PyString_CHECK_TAINTED(s)) {
         PyErr_SetString(PyExc_TypeError,
                         "tainted strings can't be interned");
         return NULL;
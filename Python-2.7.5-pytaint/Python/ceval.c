@@ -4833,10 +4833,18 @@ string_concatenate(PyObject *v, PyObject *w,
         }
     }
 
-    if (v->ob_refcnt == 1 && !PyString_CHECK_INTERNED(v)) {
+    if (v->ob_refcnt == 1 && !PyString_CHECK_INTERNED(v) &&
+        v_len != 0 && w_len != 0) {
         /* Now we own the last reference to 'v', so we can resize it
-         * in-place.
+         * in-place. (Concatenation with an empty string doesn't propagate
+         * taint, so leave these cases to PyString_Concat.)
          */
+        if ((PyString_CHECK_TAINTED(v) || PyString_CHECK_TAINTED(w)) &&
+            _PyString_PropagateTaintInPlace((PyStringObject *)v,
+                                            (PyStringObject *)w) == -1) {
+            Py_DECREF(v);
+            return NULL;
+        }
         if (_PyString_Resize(&v, new_len) != 0) {
             /* XXX if _PyString_Resize() fails, 'v' has been
              * deallocated so it cannot be put back into
@@ -195,6 +195,8 @@ new_threadstate(PyInterpreterState *interp, int init)
         tstate->trash_delete_nesting = 0;
         tstate->trash_delete_later = NULL;
 
+        tstate->merit_overrides = NULL;
+
         if (init)
             _PyThreadState_Init(tstate);
 
@@ -251,6 +253,8 @@ PyThreadState_Clear(PyThreadState *tstate)
     tstate->c_tracefunc = NULL;
     Py_CLEAR(tstate->c_profileobj);
     Py_CLEAR(tstate->c_traceobj);
+
+    _PyMerit_ClearOverrides(tstate);
 }
 
 
@@ -90,6 +90,7 @@ int Py_IgnoreEnvironmentFlag; /* e.g. PYTHONPATH, PYTHONHOME */
 int _Py_QnewFlag = 0;
 int Py_NoUserSiteDirectory = 0; /* for -s and site.py */
 int Py_HashRandomizationFlag = 0; /* for -R and PYTHONHASHSEED */
+int Py_NoTaintFlag = 0; /* for -X notaint and PYTHONNOTAINT */
 
 /* PyModule_GetWarningsModule is no longer necessary as of 2.6
 since _warnings is builtin.  This API should not be used. */
@@ -171,6 +172,8 @@ Py_InitializeEx(int install_sigs)
        check its value further. */
     if ((p = Py_GETENV("PYTHONHASHSEED")) && *p != '\0')
         Py_HashRandomizationFlag = add_flag(Py_HashRandomizationFlag, p);
+    if ((p = Py_GETENV("PYTHONNOTAINT")) && *p != '\0')
+        Py_NoTaintFlag = add_flag(Py_NoTaintFlag, p);
 
     _PyRandom_Init();
 
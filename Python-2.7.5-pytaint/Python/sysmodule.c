@@ -1210,6 +1210,7 @@ static PyStructSequence_Field flags_fields[] = {
     /* {"skip_first",                   "-x"}, */
     {"bytes_warning", "-b"},
     {"hash_randomization", "-R"},
+    {"no_taint", "-X notaint"},
     {0}
 };
 
@@ -1218,9 +1219,9 @@ static PyStructSequence_Desc flags_desc = {
     flags__doc__,       /* doc */
     flags_fields,       /* fields */
 #ifdef RISCOS
-    17
+    18
 #else
-    16
+    17
 #endif
 };
 
@@ -1258,6 +1259,7 @@ make_flags(void)
     /* SetFlag(skipfirstline); */
     SetFlag(Py_BytesWarningFlag);
     SetFlag(Py_HashRandomizationFlag);
+    SetFlag(Py_NoTaintFlag);
 #undef SetFlag
 
     if (PyErr_Occurred()) {
@@ -0,0 +1,423 @@
+from pybench import Test
+from string import join
+import taint
+
+# These tests only make sense on an interpreter with taint tracking.
+if not hasattr(str, 'taint'):
+    raise ImportError('taint tracking is not supported')
+
+class BenchmarkMerit(Merit):
+    propagation = Merit.FullPropagation
+
+class BuildStringsInPlace(Test):
+
+    version = 2.0
+    operations = 10 * 5
+    rounds = 100000
+
+    def test(self):
+
+        c = join(map(str, range(10)), '')
+
+        for i in xrange(self.rounds):
+            s = join(['x', 'x'], c)
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+    def calibrate(self):
+
+        c = join(map(str, range(10)), '')
+
+        for i in xrange(self.rounds):
+            s = join(['x', 'x'], c)
+
+
+class BuildTaintedStringsInPlace(Test):
+
+    version = 2.0
+    operations = 10 * 5
+    rounds = 100000
+
+    def test(self):
+
+        c = join(map(str, range(10)), '')._cleanfor(BenchmarkMerit)
+
+        for i in xrange(self.rounds):
+            s = join(['x', 'x'], c)
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+            s += c
+            s += c
+            s += c
+            s += c
+            s += c
+
+    def calibrate(self):
+
+        c = join(map(str, range(10)), '')._cleanfor(BenchmarkMerit)
+
+        for i in xrange(self.rounds):
+            s = join(['x', 'x'], c)
+
+
+class TaintAndPropagate(Test):
+
+    version = 2.0
+    operations = 10 * 6
+    rounds = 40000
+
+    def test(self):
+
+        c = join(map(str, range(10)), '')
+
+        for i in xrange(self.rounds):
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+            s = c.taint()
+            t = s + c
+            t = s.upper()
+            t = s[2:8]
+            t = '%s-%s' % (s, c)
+            t = s.replace('1', 'x')
+
+    def calibrate(self):
+
+        c = join(map(str, range(10)), '')
+
+        for i in xrange(self.rounds):
+            s = c
+
+class ComplexSinkCall(Test):
+
+    version = 2.0
+    operations = 10
+    rounds = 40000
+
+    def test(self):
+
+        a = 'abc'._cleanfor(BenchmarkMerit)
+        b = [u'x', 'y'._cleanfor(BenchmarkMerit)]
+        c = {'k': 'v'}
+        d = 'x'
+        e = None
+        merits = [BenchmarkMerit]
+        f = taint._complex_sink(
+            [merits] * 5,
+            {'f': merits, 'g': merits, 'h': merits})(lambda *args, **kwargs: 0)
+
+        for i in xrange(self.rounds):
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+            f(a, b, c, d, e, f=a, g=b, h=c)
+
+    def calibrate(self):
+
+        a = 'abc'._cleanfor(BenchmarkMerit)
+        b = [u'x', 'y'._cleanfor(BenchmarkMerit)]
+        c = {'k': 'v'}
+        d = 'x'
+        e = None
+        f = lambda *args, **kwargs: 0
+
+        for i in xrange(self.rounds):
+            pass
+
+class Plain(object):
+
+    def __init__(self, value):
+        self.value = value
+
+class WrapInProxies(Test):
+
+    version = 2.0
+    operations = 5 * 2
+    rounds = 20000
+
+    def test(self):
+
+        c = 'abc'.taint()
+        proxy = taint._proxy_class(Plain)
+
+        for i in xrange(self.rounds):
+            p = proxy(c)
+            p = taint._proxy_class(Plain)(c)
+            p = proxy(c)
+            p = taint._proxy_class(Plain)(c)
+            p = proxy(c)
+            p = taint._proxy_class(Plain)(c)
+            p = proxy(c)
+            p = taint._proxy_class(Plain)(c)
+            p = proxy(c)
+            p = taint._proxy_class(Plain)(c)
+
+    def calibrate(self):
+
+        c = 'abc'.taint()
+        proxy = taint._proxy_class(Plain)
+
+        for i in xrange(self.rounds):
+            pass
+
+class ReadSourceRows(Test):
+
+    version = 2.0
+    operations = 5
+    rounds = 20000
+
+    def test(self):
+
+        rows = [('row%d' % i, i, {'k': 'v'}) for i in xrange(1000)]
+        src = taint.source(lambda: rows, lazy=True)
+
+        for i in xrange(self.rounds):
+            r = src()[0][0]
+            r = src()[1][2]['k']
+            r = src()[-1][0]
+            r = src()[10:20][0][0]
+            r = src()[500][1]
+
+    def calibrate(self):
+
+        rows = [('row%d' % i, i, {'k': 'v'}) for i in xrange(1000)]
+        src = taint.source(lambda: rows, lazy=True)
+
+        for i in xrange(self.rounds):
+            pass
+
+class StreamSourceItems(Test):
+
+    version = 2.0
+    operations = 100
+    rounds = 4000
+
+    def test(self):
+
+        items = ['item%d' % i for i in xrange(100)]
+        src = taint.source(lambda: iter(items))
+
+        for i in xrange(self.rounds):
+            for item in src():
+                pass
+
+    def calibrate(self):
+
+        items = ['item%d' % i for i in xrange(100)]
+        src = taint.source(lambda: iter(items))
+
+        for i in xrange(self.rounds):
+            pass
+
+class CallDecorated(Test):
+
+    version = 2.0
+    operations = 3 * 3
+    rounds = 40000
+
+    def test(self):
+
+        def f(value, suffix=''):
+            return value
+        src = taint.source(f)
+        cln = taint.cleaner(BenchmarkMerit)(f)
+        prop = taint.propagator(f)
+        s = 'abc'.taint()
+
+        for i in xrange(self.rounds):
+            src(s)
+            cln(s)
+            prop(s)
+            src(s, suffix='x')
+            cln(s, suffix='x')
+            prop(s, suffix='x')
+            src(s, 'x')
+            cln(s, 'x')
+            prop(s, 'x')
+
+    def calibrate(self):
+
+        def f(value, suffix=''):
+            return value
+        src = taint.source(f)
+        cln = taint.cleaner(BenchmarkMerit)(f)
+        prop = taint.propagator(f)
+        s = 'abc'.taint()
+
+        for i in xrange(self.rounds):
+            pass
@@ -601,6 +601,9 @@ class PyBuildExt(build_ext):
              depends=["_io/_iomodule.h"], include_dirs=["Modules/_io"]))
         # _functools
         exts.append( Extension("_functools", ["_functoolsmodule.c"]) )
+        # taint tracking helpers (taint.py needs them); built in through
+        # Modules/Setup.dist, this covers a Modules/Setup which predates them
+        exts.append( Extension("_taint", ["_taintmodule.c"]) )
         # _json speedups
         exts.append( Extension("_json", ["_json.c"]) )
         # Python C API test module